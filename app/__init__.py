@@ -1,4 +1,4 @@
-from flask import Flask, render_template, current_app, session
+from flask import Flask, render_template
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_migrate import Migrate
@@ -6,7 +6,6 @@ from flask_mail import Mail
 from flask_wtf.csrf import CSRFProtect
 from config import config
 from datetime import datetime
-import os
 
 # Initialize extensions
 db = SQLAlchemy()
@@ -29,6 +28,27 @@ def create_app(config_name='default'):
     mail.init_app(app)
     csrf.init_app(app)
 
+    from app import availability_service, dashboard_stats, recurrence, session_store, user_cache
+    from app import billing, calendar_service, currency, jobs, ledger, logbook, maintenance_forecast
+    from app import payroll, reconciliation, reports
+    # Imported for the job handlers they register
+    from app import notifications, waitlist_matcher  # noqa: F401
+    session_store.init_app(app)
+    availability_service.init_app(app)
+    dashboard_stats.init_app(app)
+    recurrence.init_app(app)
+    user_cache.init_app(app)
+    jobs.init_app(app)
+    calendar_service.init_app(app)
+    maintenance_forecast.init_app(app)
+    logbook.init_app(app)
+    currency.init_app(app)
+    billing.init_app(app)
+    ledger.init_app(app)
+    reconciliation.init_app(app)
+    payroll.init_app(app)
+    reports.init_app(app)
+
     @app.context_processor
     def inject_datetime():
         return dict(datetime=datetime)
@@ -40,18 +60,6 @@ def create_app(config_name='default'):
             return ''
         return value.strftime(format)
 
-    @app.before_request
-    def before_request():
-        if '_id' not in session:
-            session['_id'] = os.urandom(16).hex()
-            session.modified = True
-
-    @app.after_request
-    def after_request(response):
-        # Ensure session is saved
-        session.modified = True
-        return response
-
     # Register blueprints
     from app.routes import main as main_blueprint
     from app.routes import auth as auth_blueprint
@@ -80,21 +88,9 @@ def create_app(config_name='default'):
 
     return app
 
-# Import models after db is defined to avoid circular imports
-from app.models import User
 
 @login_manager.user_loader
 def load_user(id):
-    """Load user from database."""
-    current_app.logger.debug(f"Loading user with ID: {id}")
-    user = db.session.get(User, int(id))
-    if user:
-        msg = (
-            f"Loaded user: {user}, "
-            f"Role: {user.role}, "
-            f"Is Admin: {user.is_admin}"
-        )
-        current_app.logger.debug(msg)
-    else:
-        current_app.logger.debug("User not found")
-    return user
+    """Load the session principal, from the identity cache when possible."""
+    from app.user_cache import load_principal
+    return load_principal(int(id))
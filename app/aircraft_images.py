@@ -0,0 +1,153 @@
+"""
+Non-blocking aircraft image resolution.
+
+Templates ask for ``Aircraft.image_url`` on every render.  Validating an
+image means opening it and sniffing its header, and repairing a missing one
+means calling out to Wikimedia, so neither belongs in the request path.
+``AircraftImageResolver`` remembers which files it has already validated
+(keyed by filename and modification time), remembers recent fetch failures,
+and hands repairs to a background worker while the page renders with the
+default image.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+
+import filetype
+
+logger = logging.getLogger("aircraft_image")
+
+DEFAULT_IMAGE_PATH = 'images/aircraft/default.jpg'
+VALID_IMAGE_MIMES = ("image/jpeg", "image/png", "image/gif")
+MIN_IMAGE_BYTES = 1024
+
+# Seconds to wait before retrying a fetch that failed
+DEFAULT_NEGATIVE_TTL = 600
+
+
+def is_valid_image_file(path):
+    """Return True if path is a non-trivial JPEG, PNG or GIF file."""
+    try:
+        if os.path.getsize(path) <= MIN_IMAGE_BYTES:
+            return False
+        with open(path, 'rb') as f:
+            kind = filetype.guess(f.read(261))
+    except OSError:
+        return False
+    return bool(kind and kind.mime in VALID_IMAGE_MIMES)
+
+
+class AircraftImageResolver:
+    """Process-wide cache of validated aircraft images with background repair."""
+
+    def __init__(self, image_dir, fetch, web_prefix='images/aircraft/',
+                 negative_ttl=DEFAULT_NEGATIVE_TTL):
+        self.image_dir = image_dir
+        self.web_prefix = web_prefix
+        self.negative_ttl = negative_ttl
+        # ``fetch(filename, make, model)`` repairs an image and returns its
+        # static path, or the default path on failure
+        self._fetch = fetch
+        self._checked = {}   # filename -> (mtime_ns, is_valid)
+        self._failed = {}    # filename -> monotonic time of last failed fetch
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._worker = None
+
+    def resolve(self, filename, make=None, model=None, fetch_missing=True):
+        """
+        Return the static path for an aircraft image without blocking.
+
+        Valid files are served directly; missing or invalid ones fall back
+        to the default image and, if ``fetch_missing`` is set, are queued
+        for a background fetch.
+        """
+        if not filename:
+            return DEFAULT_IMAGE_PATH
+        path = os.path.join(self.image_dir, filename)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = None
+
+        if mtime is not None:
+            with self._lock:
+                checked = self._checked.get(filename)
+            if checked is None or checked[0] != mtime:
+                checked = (mtime, is_valid_image_file(path))
+                with self._lock:
+                    self._checked[filename] = checked
+            if checked[1]:
+                return f'{self.web_prefix}{filename}'
+
+        if fetch_missing:
+            self.schedule_fetch(filename, make, model)
+        return DEFAULT_IMAGE_PATH
+
+    def schedule_fetch(self, filename, make=None, model=None):
+        """Queue a background fetch unless one is pending or recently failed."""
+        with self._lock:
+            if filename in self._pending:
+                return False
+            failed_at = self._failed.get(filename)
+            if failed_at is not None and time.monotonic() - failed_at < self.negative_ttl:
+                return False
+            self._pending.add(filename)
+        self._queue.put((filename, make, model))
+        self._ensure_worker()
+        return True
+
+    def invalidate(self, filename=None):
+        """Forget cached results for one filename, or for every image."""
+        with self._lock:
+            if filename is None:
+                self._checked.clear()
+                self._failed.clear()
+            else:
+                self._checked.pop(filename, None)
+                self._failed.pop(filename, None)
+
+    def run_pending(self):
+        """Process queued fetches in the calling thread; used by scripts and tests."""
+        while True:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            self._process(*job)
+            self._queue.task_done()
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(
+                target=self._work, name='aircraft-image-fetcher', daemon=True
+            )
+            self._worker.start()
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._process(*job)
+            finally:
+                self._queue.task_done()
+
+    def _process(self, filename, make, model):
+        try:
+            result = self._fetch(filename, make, model)
+        except Exception as e:
+            logger.error(f"Background fetch failed for {filename}: {e}")
+            result = DEFAULT_IMAGE_PATH
+        with self._lock:
+            self._pending.discard(filename)
+            self._checked.pop(filename, None)
+            if result == DEFAULT_IMAGE_PATH:
+                self._failed[filename] = time.monotonic()
+            else:
+                self._failed.pop(filename, None)
@@ -0,0 +1,575 @@
+"""
+Booking availability and conflict detection.
+
+Every booking entry point (student booking form, admin create/edit) asks
+this module whether the requested aircraft, instructor and student are free,
+and booking forms use it to resolve the whole fleet's airworthiness at once.
+Conflict checks read the composite (resource_id, start_time, end_time)
+indexes on ``booking`` inside the caller's transaction, so a write is never
+accepted on the strength of another process's stale view.  The read-only
+busy intervals behind the booking calendar come instead from per-resource
+interval indexes that are cached in-process until a booking or recurring
+series write touches that resource or their TTL runs out.  The indexes also
+hold the recurring occurrences past each series' materialized horizon, so a
+covered window needs no booking or series query at all.  An
+aircraft is also unavailable for windows ending after its
+``available_until``, the next maintenance limit that
+``app.maintenance_forecast`` keeps on the aircraft row, and for windows
+overlapping planned maintenance.
+"""
+
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone
+import threading
+import time
+
+from flask import current_app, has_app_context, g
+from sqlalchemy import and_, event, func, inspect, or_, select
+from sqlalchemy.orm import Session
+
+from app import db
+from app.bulk_inserts import bulk_insert_listener
+from app.maintenance_forecast import PLANNED_MAINTENANCE_STATUSES, planned_maintenance_end
+from app.models import (
+    Aircraft, Booking, MaintenanceRecord, RecurringBooking, Squawk, User, grounding_memo
+)
+
+
+# Booking statuses that hold a resource for their time window
+ACTIVE_BOOKING_STATUSES = ('pending', 'confirmed', 'in_progress')
+
+# Resource name -> Booking column holding the resource id
+RESOURCE_COLUMNS = {
+    'aircraft': 'aircraft_id',
+    'instructor': 'instructor_id',
+    'student': 'student_id',
+}
+
+# How far back each cached index reaches; older windows go to the database
+INDEX_LOOKBACK = timedelta(days=1)
+# How far ahead unmaterialized recurring occurrences are expanded into each
+# cached index; windows ending later go to the database
+INDEX_LOOKAHEAD = timedelta(days=180)
+
+# Seconds a cached index may be reused before it is rebuilt, which bounds
+# how long read-only views miss writes made in other worker processes
+DEFAULT_CACHE_TTL = 60
+
+EXTENSION_KEY = 'booking_conflicts'
+
+
+def normalize_datetime(dt):
+    """Return a naive UTC datetime, matching how booking times are stored."""
+    if dt is None:
+        return None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+class IntervalIndex:
+    """
+    Static interval index over the bookings of a single resource.
+
+    Intervals are kept sorted by start time alongside a running maximum of
+    end times.  Because that running maximum never decreases, both ends of
+    the candidate range for an overlap query are found by binary search, so
+    a lookup costs O(log n) plus the handful of candidates it returns.
+    Ids are booking ids, or ``'recurring:<series id>'`` for occurrences
+    that are not stored as bookings yet.
+    """
+
+    def __init__(self, intervals, covers_from=None, covers_until=None):
+        intervals = sorted(intervals, key=lambda interval: interval[:2])
+        self.starts = [start for start, _, _ in intervals]
+        self.ends = [end for _, end, _ in intervals]
+        self.booking_ids = [booking_id for _, _, booking_id in intervals]
+        self.max_ends = []
+        running = None
+        for end in self.ends:
+            running = end if running is None or end > running else running
+            self.max_ends.append(running)
+        self.covers_from = covers_from
+        self.covers_until = covers_until
+        self.built_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.starts)
+
+    def covers(self, start_time, end_time=None):
+        """Return True if the window is fully indexed, recurring occurrences included."""
+        if self.covers_from is not None and start_time < self.covers_from:
+            return False
+        return end_time is None or self.covers_until is None or end_time <= self.covers_until
+
+    def _overlapping_positions(self, start_time, end_time):
+        # Only intervals starting before end_time can overlap ...
+        hi = bisect_left(self.starts, end_time)
+        # ... and none before the first whose running max end passes start_time
+        lo = bisect_right(self.max_ends, start_time, 0, hi)
+        return [i for i in range(lo, hi) if self.ends[i] > start_time]
+
+    def overlapping(self, start_time, end_time, exclude_booking_id=None):
+        """Return ids of bookings overlapping the half-open window."""
+        return [
+            self.booking_ids[i]
+            for i in self._overlapping_positions(start_time, end_time)
+            if self.booking_ids[i] != exclude_booking_id
+        ]
+
+    def overlapping_intervals(self, start_time, end_time):
+        """Return the (start, end) pairs overlapping the half-open window."""
+        return [(self.starts[i], self.ends[i])
+                for i in self._overlapping_positions(start_time, end_time)]
+
+
+class BookingConflictIndex:
+    """
+    Process-wide cache of IntervalIndex objects keyed by resource.
+
+    Only read-only views may trust it: writes made by other processes
+    reach it when the TTL expires, not when they commit.  Each key carries
+    a generation that ``invalidate`` bumps, and a freshly built index is
+    only stored if its generation did not move during the build, so rows
+    read before a commit cannot be cached after that commit's invalidation.
+    """
+
+    def __init__(self, ttl=DEFAULT_CACHE_TTL):
+        self.ttl = ttl
+        self._indexes = {}
+        self._generations = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def _token(self, key):
+        return self._generation, self._generations.get(key, 0)
+
+    def get(self, resource, resource_id):
+        return self.get_many(resource, [resource_id])[int(resource_id)]
+
+    def get_many(self, resource, resource_ids):
+        """Return {resource id: IntervalIndex}, building the missing ones together."""
+        resource_ids = list(dict.fromkeys(int(resource_id) for resource_id in resource_ids))
+        with self._lock:
+            indexes = {resource_id: self._indexes.get((resource, resource_id))
+                       for resource_id in resource_ids}
+            tokens = {resource_id: self._token((resource, resource_id))
+                      for resource_id in resource_ids}
+        now = time.monotonic()
+        stale = [resource_id for resource_id, index in indexes.items()
+                 if index is None or now - index.built_at >= self.ttl]
+        if stale:
+            built = self._build(resource, stale)
+            indexes.update(built)
+            with self._lock:
+                for resource_id, index in built.items():
+                    if self._token((resource, resource_id)) == tokens[resource_id]:
+                        self._indexes[(resource, resource_id)] = index
+        return indexes
+
+    def invalidate(self, keys=None):
+        """Drop cached indexes for the given (resource, id) keys, or all."""
+        with self._lock:
+            if keys is None:
+                self._generation += 1
+                self._indexes.clear()
+                return
+            for key in keys:
+                self._generations[key] = self._generations.get(key, 0) + 1
+                self._indexes.pop(key, None)
+
+    def _build(self, resource, resource_ids):
+        """Build the indexes of several resources with one bookings and one series query."""
+        column = getattr(Booking, RESOURCE_COLUMNS[resource])
+        now = datetime.now(timezone.utc)
+        covers_from = normalize_datetime(now - INDEX_LOOKBACK)
+        covers_until = normalize_datetime(now + INDEX_LOOKAHEAD)
+        intervals = {resource_id: [] for resource_id in resource_ids}
+        rows = Booking.query.with_entities(
+            column, Booking.start_time, Booking.end_time, Booking.id
+        ).filter(
+            column.in_(resource_ids),
+            Booking.end_time > covers_from,
+            Booking.status.in_(ACTIVE_BOOKING_STATUSES)
+        ).all()
+        for resource_id, start, end, booking_id in rows:
+            intervals[resource_id].append(
+                (normalize_datetime(start), normalize_datetime(end), booking_id)
+            )
+        from app.recurrence import virtual_occurrences
+        ids = {name: resource_ids if name == resource else [] for name in RESOURCE_COLUMNS}
+        for series, start, end in virtual_occurrences(
+                covers_from, covers_until, aircraft_ids=ids['aircraft'],
+                instructor_ids=ids['instructor'], student_ids=ids['student']):
+            resource_id = getattr(series, RESOURCE_COLUMNS[resource])
+            if resource_id in intervals:
+                intervals[resource_id].append((start, end, f'recurring:{series.id}'))
+        return {
+            resource_id: IntervalIndex(items, covers_from=covers_from, covers_until=covers_until)
+            for resource_id, items in intervals.items()
+        }
+
+
+def init_app(app):
+    """Attach a conflict index cache to the application."""
+    ttl = app.config.get('BOOKING_CONFLICT_CACHE_TTL', DEFAULT_CACHE_TTL)
+    app.extensions[EXTENSION_KEY] = BookingConflictIndex(ttl=ttl)
+
+
+def get_conflict_index():
+    """Return the current application's conflict index cache."""
+    index = current_app.extensions.get(EXTENSION_KEY)
+    if index is None:
+        init_app(current_app)
+        index = current_app.extensions[EXTENSION_KEY]
+    return index
+
+
+def _query_overlapping(resource, resource_id, start_time, end_time, exclude_booking_id=None):
+    """Return ids of a resource's active bookings overlapping the window, via the composite index."""
+    column = getattr(Booking, RESOURCE_COLUMNS[resource])
+    query = Booking.query.with_entities(Booking.id).filter(
+        column == resource_id,
+        Booking.start_time < end_time,
+        Booking.end_time > start_time,
+        Booking.status.in_(ACTIVE_BOOKING_STATUSES)
+    )
+    if exclude_booking_id is not None:
+        query = query.filter(Booking.id != exclude_booking_id)
+    return [booking_id for booking_id, in query.all()]
+
+
+def lock_booking_parties(aircraft_id=None, instructor_id=None, student_id=None):
+    """
+    Lock the aircraft, instructor and student rows until the transaction ends.
+
+    Booking writes call this before ``find_conflicts`` and the prepaid
+    balance check, so two bookings for the same aircraft, instructor or
+    student take turns from their checks to their commits instead of both
+    passing.  The aircraft is locked first and the users in id order,
+    matching check-out and the ledger.
+    """
+    from app.ledger import lock_accounts
+    connection = db.session.connection()
+    if aircraft_id:
+        connection.execute(
+            select(Aircraft.id).where(Aircraft.id == int(aircraft_id)).with_for_update()
+        ).all()
+    lock_accounts(connection, {int(user_id) for user_id in (instructor_id, student_id) if user_id})
+
+
+def maintenance_holds(aircraft_id, start_time, end_time):
+    """
+    Return why maintenance keeps the aircraft from the window, if it does.
+
+    The aircraft's limit and its planned maintenance starting before the
+    window ends come back in one query; planned maintenance only holds the
+    window if it is expected to run into it.
+    """
+    rows = db.session.query(
+        Aircraft.available_until, Aircraft.available_until_reason,
+        MaintenanceRecord.performed_at, MaintenanceRecord.labor_hours
+    ).outerjoin(MaintenanceRecord, and_(
+        MaintenanceRecord.aircraft_id == Aircraft.id,
+        MaintenanceRecord.status.in_(PLANNED_MAINTENANCE_STATUSES),
+        MaintenanceRecord.performed_at < end_time
+    )).filter(Aircraft.id == aircraft_id).all()
+    if not rows:
+        return []
+    reasons = []
+    available_until, reason = rows[0].available_until, rows[0].available_until_reason
+    if available_until is not None and end_time > available_until:
+        reasons.append(reason or 'Maintenance due')
+    if any(row.performed_at is not None and
+           planned_maintenance_end(row.performed_at, row.labor_hours) > start_time
+           for row in rows):
+        reasons.append('Scheduled maintenance')
+    return reasons
+
+
+def find_conflicts(start_time, end_time, aircraft_id=None, instructor_id=None,
+                   student_id=None, exclude_booking_id=None):
+    """
+    Find active bookings that overlap the requested window.
+
+    Returns a dict mapping each conflicting resource name ('aircraft',
+    'instructor', 'student') to the ids of the bookings it clashes with,
+    or ``'recurring:<series id>'`` for a recurring occurrence that is not
+    stored as a booking yet.  Resources that are free, or not given, are
+    omitted.  An aircraft that reaches a maintenance limit before the
+    window ends, or has planned maintenance during it, adds
+    ``'maintenance'`` with the reasons.
+
+    Bookings are read from the database in the caller's transaction, which
+    is what every write must rely on; the cached interval indexes are only
+    for read-only views.
+    """
+    start_time = normalize_datetime(start_time)
+    end_time = normalize_datetime(end_time)
+    if exclude_booking_id is not None:
+        exclude_booking_id = int(exclude_booking_id)
+    requested = {
+        'aircraft': aircraft_id,
+        'instructor': instructor_id,
+        'student': student_id,
+    }
+    conflicts = {}
+    for resource, resource_id in requested.items():
+        if not resource_id:
+            continue
+        booking_ids = _query_overlapping(
+            resource, resource_id, start_time, end_time, exclude_booking_id
+        )
+        if booking_ids:
+            conflicts[resource] = booking_ids
+
+    if aircraft_id:
+        reasons = maintenance_holds(aircraft_id, start_time, end_time)
+        if reasons:
+            conflicts['maintenance'] = reasons
+
+    # Recurring series beyond their materialized horizon have no rows yet
+    from app.recurrence import virtual_occurrences
+    requested_ids = {resource: [resource_id] if resource_id else []
+                     for resource, resource_id in requested.items()}
+    for series, _, _ in virtual_occurrences(
+            start_time, end_time,
+            aircraft_ids=requested_ids['aircraft'],
+            instructor_ids=requested_ids['instructor'],
+            student_ids=requested_ids['student']):
+        for resource, resource_id in requested.items():
+            if not resource_id:
+                continue
+            if getattr(series, RESOURCE_COLUMNS[resource]) == int(resource_id):
+                marker = f'recurring:{series.id}'
+                if marker not in conflicts.setdefault(resource, []):
+                    conflicts[resource].append(marker)
+    return conflicts
+
+
+def merge_intervals(intervals):
+    """Merge overlapping or touching (start, end) pairs into a sorted list."""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def _resource_ids(resource):
+    """Return the ids of every aircraft, or of every instructor."""
+    if resource == 'aircraft':
+        query = db.session.query(Aircraft.id)
+    else:
+        query = db.session.query(User.id).filter(User.is_instructor.is_(True))
+    return [resource_id for resource_id, in query]
+
+
+def _query_busy_intervals(start_time, end_time, wanted):
+    """Read the unmerged busy intervals of the wanted resources from the database."""
+    resource_filters = []
+    for resource, ids in wanted.items():
+        column = getattr(Booking, RESOURCE_COLUMNS[resource])
+        if ids is None:
+            resource_filters.append(column.isnot(None))
+        elif ids:
+            resource_filters.append(column.in_(ids))
+
+    busy = {resource: {} for resource in wanted}
+    if not resource_filters:
+        return busy
+
+    from app.recurrence import virtual_occurrences
+    for series, start, end in virtual_occurrences(
+            start_time, end_time,
+            aircraft_ids=wanted['aircraft'], instructor_ids=wanted['instructor'],
+            student_ids=None if None in wanted.values() else []):
+        interval = (max(start, start_time), min(end, end_time))
+        for resource in wanted:
+            resource_id = getattr(series, RESOURCE_COLUMNS[resource])
+            ids = wanted[resource]
+            if resource_id and (ids is None or resource_id in ids):
+                busy[resource].setdefault(resource_id, []).append(interval)
+
+    rows = db.session.query(
+        Booking.aircraft_id, Booking.instructor_id, Booking.start_time, Booking.end_time
+    ).filter(
+        Booking.start_time < end_time,
+        Booking.end_time > start_time,
+        Booking.status.in_(ACTIVE_BOOKING_STATUSES),
+        or_(*resource_filters)
+    ).all()
+
+    for aircraft_id, instructor_id, start, end in rows:
+        interval = (max(start, start_time), min(end, end_time))
+        for resource, resource_id in (('aircraft', aircraft_id), ('instructor', instructor_id)):
+            ids = wanted[resource]
+            if resource_id and (ids is None or resource_id in ids):
+                busy[resource].setdefault(resource_id, []).append(interval)
+    return busy
+
+
+def busy_intervals(start_time, end_time, aircraft_ids=None, instructor_ids=None):
+    """
+    Return the merged busy intervals of aircraft and instructors in a window.
+
+    The result maps 'aircraft' and 'instructor' to dicts of resource id ->
+    sorted, non-overlapping (start, end) pairs clipped to the window.  Only
+    active bookings count, matching what ``find_conflicts`` would reject.
+    ``aircraft_ids``/``instructor_ids`` restrict the resources returned;
+    None means every aircraft or instructor.
+
+    Windows the cached interval indexes cover are answered from them, so
+    the result may miss another process's writes for up to the cache TTL;
+    older or further-out windows are read from the database.
+    """
+    start_time = normalize_datetime(start_time)
+    end_time = normalize_datetime(end_time)
+    wanted = {
+        resource: None if ids is None else {int(i) for i in ids}
+        for resource, ids in (('aircraft', aircraft_ids), ('instructor', instructor_ids))
+    }
+
+    busy = {resource: {} for resource in wanted}
+    now = normalize_datetime(datetime.now(timezone.utc))
+    if start_time >= now - INDEX_LOOKBACK and end_time <= now + INDEX_LOOKAHEAD:
+        cache = get_conflict_index()
+        # Resources whose cached index does not cover the window
+        uncovered = {}
+        for resource, ids in wanted.items():
+            uncovered[resource] = set()
+            indexes = cache.get_many(resource, _resource_ids(resource) if ids is None else ids)
+            for resource_id, index in indexes.items():
+                if not index.covers(start_time, end_time):
+                    uncovered[resource].add(resource_id)
+                    continue
+                intervals = [(max(start, start_time), min(end, end_time))
+                             for start, end in index.overlapping_intervals(start_time, end_time)]
+                if intervals:
+                    busy[resource][resource_id] = intervals
+        wanted = uncovered
+
+    for resource, by_resource in _query_busy_intervals(start_time, end_time, wanted).items():
+        for resource_id, intervals in by_resource.items():
+            busy[resource].setdefault(resource_id, []).extend(intervals)
+    for by_resource in busy.values():
+        for resource_id, intervals in by_resource.items():
+            by_resource[resource_id] = merge_intervals(intervals)
+    return busy
+
+
+def compute_fleet_availability(aircraft_ids=None):
+    """
+    Resolve availability for many aircraft with a single grouped query.
+
+    Returns a dict keyed by aircraft id with ``available``, ``status`` (the
+    same text as ``Aircraft.availability_status``), ``grounded``,
+    ``inspection_100hr_due``, ``annual_due`` and ``available_until``.  Grounding results are also
+    stored in the per-request memo so ``Aircraft.is_available`` and
+    ``Aircraft.availability_status`` do not query again.
+    """
+    if aircraft_ids is not None:
+        aircraft_ids = [int(aircraft_id) for aircraft_id in aircraft_ids]
+        if not aircraft_ids:
+            return {}
+    query = db.session.query(
+        Aircraft.id,
+        Aircraft.status,
+        Aircraft.time_to_next_100hr,
+        Aircraft.date_of_next_annual,
+        Aircraft.available_until,
+        func.count(Squawk.id)
+    ).outerjoin(Squawk, and_(
+        Squawk.aircraft_id == Aircraft.id,
+        Squawk.status == 'open',
+        Squawk.ground_airplane.is_(True)
+    )).group_by(Aircraft.id)
+    if aircraft_ids is not None:
+        query = query.filter(Aircraft.id.in_(aircraft_ids))
+
+    today = datetime.now(timezone.utc).date()
+    memo = grounding_memo()
+    fleet = {}
+    for (aircraft_id, status, time_to_next_100hr, date_of_next_annual, available_until,
+         grounding_count) in query.all():
+        grounded = grounding_count > 0
+        if memo is not None:
+            memo[aircraft_id] = grounded
+        summary = Aircraft.describe_availability(
+            status, time_to_next_100hr, date_of_next_annual, grounded
+        )
+        fleet[aircraft_id] = {
+            'available': summary == 'Available',
+            'status': summary,
+            'grounded': grounded,
+            'inspection_100hr_due': time_to_next_100hr is not None and time_to_next_100hr < 1.0,
+            'annual_due': date_of_next_annual is not None and date_of_next_annual <= today,
+            'available_until': available_until,
+        }
+    return fleet
+
+
+def conflict_message(conflicts):
+    """Build a user-facing message describing the conflicting resources."""
+    messages = []
+    names = [resource for resource in RESOURCE_COLUMNS if resource in conflicts]
+    if len(names) == 1:
+        messages.append(f'This {names[0]} is already booked during the selected time.')
+    elif names:
+        subject = 'The ' + ', '.join(names[:-1]) + f' and {names[-1]} are'
+        messages.append(f'{subject} already booked during the selected time.')
+    if 'maintenance' in conflicts:
+        reasons = ', '.join(conflicts['maintenance'])
+        messages.append(f'The aircraft is unavailable for maintenance by then ({reasons}).')
+    return ' '.join(messages) or None
+
+
+@bulk_insert_listener(Booking)
+def _collect_bulk_booking_writes(session, rows):
+    """Mark resources touched by a bulk ``insert(Booking)`` for invalidation."""
+    touched = session.info.setdefault('booking_conflict_keys', set())
+    for row in rows:
+        for resource, column in RESOURCE_COLUMNS.items():
+            if row.get(column):
+                touched.add((resource, int(row[column])))
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_booking_changes(session, flush_context):
+    """Remember which resources were touched by booking or series writes in this flush."""
+    touched = session.info.setdefault('booking_conflict_keys', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, (Booking, RecurringBooking)):
+            continue
+        state = inspect(obj)
+        for resource, column in RESOURCE_COLUMNS.items():
+            history = state.attrs[column].history
+            for value in list(history.added) + list(history.unchanged) + list(history.deleted):
+                if value:
+                    touched.add((resource, int(value)))
+
+
+@event.listens_for(Session, 'after_flush')
+def _reset_grounding_memo(session, flush_context):
+    """Squawk writes can ground or release an aircraft mid-request."""
+    changed = list(session.new) + list(session.dirty) + list(session.deleted)
+    if has_app_context() and any(isinstance(obj, Squawk) for obj in changed):
+        g.pop('_grounding_memo', None)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    touched = session.info.pop('booking_conflict_keys', None)
+    if touched and has_app_context():
+        index = current_app.extensions.get(EXTENSION_KEY)
+        if index is not None:
+            index.invalidate(touched)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _invalidate_on_rollback(session, previous_transaction):
+    # An index rebuilt mid-transaction may hold rows that were just rolled back
+    _invalidate_on_commit(session)
@@ -0,0 +1,151 @@
+"""
+Flight billing.
+
+``complete_check_out`` bills each flight as it is checked out.
+``run_billing`` catches the completed flights that have a check-in and a
+check-out but no invoice yet, such as flights closed before check-out
+billed them, or imported ones.  It pages through them in booking order.
+Each page is one joined query returning plain rows of booking, meter
+readings and rates.  The rows are priced in one pass with the same
+arithmetic as check-out and inserted with a single executemany.  One
+INSERT ... SELECT then charges them to the students' accounts, and they
+are added to the instructors' payroll facts and the daily report facts.
+
+Invoice numbers come from the booking id (``INV-000042``).  Concurrent
+runs therefore never contend for a counter.  Each booking has at most one
+invoice; the insert skips bookings that already have one (``ON CONFLICT
+(booking_id) DO NOTHING``) and returns the rows it did write, so when two
+runs, or a run and a check-out, race for the same flight, only the winner
+charges and records it.  An invoice number already taken by another
+booking's invoice, say one typed in by hand, is an error rather than a
+flight that looks billed.
+"""
+
+import click
+
+from app import db
+from app.bulk_inserts import record_bulk_insert
+from app.ledger import charge_invoices
+from app.models import Aircraft, Booking, CheckIn, CheckOut, Invoice, User
+from app.payroll import record_invoices
+from app.upserts import dialect_insert
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def invoice_number_for(booking_id):
+    """Return the invoice number for a booking's flight."""
+    return f'INV-{booking_id:06d}'
+
+
+def invoice_values(booking_id, aircraft_id, student_id, instructor_id, flight_hours,
+                   aircraft_rate, instructor_rate, invoice_date):
+    """Return the column values of one flight's invoice."""
+    aircraft_total = round(aircraft_rate * flight_hours, 2)
+    instructor_total = instructor_time = None
+    if instructor_id is not None:
+        instructor_rate = instructor_rate or 0.0
+        instructor_time = flight_hours
+        instructor_total = round(instructor_rate * flight_hours, 2)
+    else:
+        instructor_rate = None
+    return dict(
+        booking_id=booking_id,
+        aircraft_id=aircraft_id,
+        student_id=student_id,
+        instructor_id=instructor_id,
+        invoice_number=invoice_number_for(booking_id),
+        invoice_date=invoice_date,
+        aircraft_rate=aircraft_rate,
+        aircraft_time=flight_hours,
+        aircraft_total=aircraft_total,
+        instructor_rate=instructor_rate,
+        instructor_time=instructor_time,
+        instructor_total=instructor_total,
+        total_amount=round(aircraft_total + (instructor_total or 0.0), 2),
+        status='pending'
+    )
+
+
+def uninvoiced_flights(until=None, after_id=0, limit=DEFAULT_BATCH_SIZE):
+    """
+    Return up to ``limit`` completed, uninvoiced flights after booking ``after_id``.
+
+    Each row carries what pricing needs: the booking's parties, the Hobbs
+    readings and check-out time, and the aircraft and instructor rates.
+    Flights whose Hobbs reading went backwards are left for a human.
+    """
+    instructor = db.aliased(User)
+    query = db.session.query(
+        Booking.id, Booking.aircraft_id, Booking.student_id, Booking.instructor_id,
+        CheckIn.hobbs_start, CheckOut.hobbs_end, CheckOut.check_out_time,
+        Aircraft.rate_per_hour, instructor.instructor_rate_per_hour
+    ).join(CheckIn, CheckIn.booking_id == Booking.id).join(
+        CheckOut, CheckOut.booking_id == Booking.id
+    ).join(Aircraft, Aircraft.id == Booking.aircraft_id).outerjoin(
+        instructor, instructor.id == Booking.instructor_id
+    ).outerjoin(Invoice, Invoice.booking_id == Booking.id).filter(
+        Booking.status == 'completed',
+        Invoice.id.is_(None),
+        CheckOut.hobbs_end >= CheckIn.hobbs_start,
+        Booking.id > after_id
+    )
+    if until is not None:
+        query = query.filter(CheckOut.check_out_time < until)
+    return query.order_by(Booking.id).limit(limit).all()
+
+
+def price_flights(rows):
+    """Return the invoice values for rows from ``uninvoiced_flights``."""
+    return [
+        invoice_values(booking_id, aircraft_id, student_id, instructor_id,
+                       round(hobbs_end - hobbs_start, 2), aircraft_rate or 0.0,
+                       instructor_rate, check_out_time)
+        for (booking_id, aircraft_id, student_id, instructor_id, hobbs_start, hobbs_end,
+             check_out_time, aircraft_rate, instructor_rate) in rows
+    ]
+
+
+def run_billing(until=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Invoice every completed, uninvoiced flight checked out before ``until``.
+
+    Commits after each batch and returns the number of invoices created.
+    Flights another process invoiced meanwhile are skipped.
+    """
+    created = 0
+    after_id = 0
+    while True:
+        rows = uninvoiced_flights(until, after_id, batch_size)
+        if not rows:
+            return created
+        values = price_flights(rows)
+        try:
+            connection = db.session.connection()
+            statement = dialect_insert(connection)(Invoice.__table__).on_conflict_do_nothing(
+                index_elements=['booking_id']
+            ).returning(Invoice.id, Invoice.booking_id)
+            inserted = dict(connection.execute(statement, values).all())
+            if inserted:
+                billed = Invoice.id.in_(list(inserted))
+                charge_invoices(connection, billed)
+                record_invoices(connection, billed)
+                booking_ids = set(inserted.values())
+                record_bulk_insert(db.session, Invoice,
+                                   [v for v in values if v['booking_id'] in booking_ids])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        created += len(inserted)
+        after_id = rows[-1][0]
+
+
+def init_app(app):
+    """Register the ``flask run-billing`` command."""
+    @app.cli.command('run-billing')
+    @click.option('--until', type=click.DateTime(formats=['%Y-%m-%d']),
+                  help='Only bill flights checked out before this date (UTC).')
+    def run_billing_command(until):
+        """Invoice completed flights that have not been billed."""
+        print(f'Created {run_billing(until)} invoices')
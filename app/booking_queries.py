@@ -0,0 +1,45 @@
+"""
+Reusable Booking queries for listing pages.
+
+Booking tables render the student, instructor and aircraft of every row.
+Loading those lazily costs three extra SELECTs per booking, so every
+listing route builds its query from ``BookingQueries`` which joins them in
+up front.
+"""
+
+from sqlalchemy.orm import joinedload
+
+from app.models import Booking
+
+
+class BookingQueries:
+    """Query builders that eager-load the parties of each booking."""
+
+    @staticmethod
+    def with_parties(query=None):
+        """Return a Booking query that loads student, instructor and aircraft in one SELECT."""
+        if query is None:
+            query = Booking.query
+        return query.options(
+            joinedload(Booking.student),
+            joinedload(Booking.instructor),
+            joinedload(Booking.aircraft)
+        )
+
+    @classmethod
+    def for_student(cls, student_id):
+        """Bookings flown by a student."""
+        return cls.with_parties().filter(Booking.student_id == student_id)
+
+    @classmethod
+    def for_instructor(cls, instructor_id):
+        """Bookings taught by an instructor."""
+        return cls.with_parties().filter(Booking.instructor_id == instructor_id)
+
+    @classmethod
+    def in_window(cls, start_time, end_time, query=None):
+        """Bookings starting inside [start_time, end_time], ordered by start."""
+        return cls.with_parties(query).filter(
+            Booking.start_time >= start_time,
+            Booking.start_time <= end_time
+        ).order_by(Booking.start_time)
@@ -0,0 +1,38 @@
+"""
+Bulk inserts that keep the derived data in step.
+
+``session.execute(insert(Model), rows)`` skips the unit of work, so the
+flush hooks that maintain the conflict index, the dashboard counters and
+the report facts never see those rows.  Each of those modules registers a
+listener for the models it follows with ``@bulk_insert_listener(Model)``.
+Bulk inserts go through ``bulk_insert``, or call ``record_bulk_insert``
+with the rows a custom insert statement wrote, so no listener is missed.
+"""
+
+from collections import defaultdict
+
+from sqlalchemy import insert
+
+_listeners = defaultdict(list)
+
+
+def bulk_insert_listener(model):
+    """Register ``listener(session, rows)`` for rows bulk inserted into ``model``."""
+    def register(listener):
+        _listeners[model].append(listener)
+        return listener
+    return register
+
+
+def record_bulk_insert(session, model, rows):
+    """Pass rows a bulk insert wrote to ``model`` to every listener."""
+    if rows:
+        for listener in _listeners[model]:
+            listener(session, rows)
+
+
+def bulk_insert(session, model, rows):
+    """Insert the row dicts with one executemany and record them; the caller commits."""
+    if rows:
+        session.execute(insert(model), rows)
+        record_bulk_insert(session, model, rows)
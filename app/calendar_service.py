@@ -1,15 +1,253 @@
+"""
+Google Calendar integration.
+
+Bookings are pushed to each connected user's calendar incrementally: a sync
+only looks at bookings whose ``updated_at`` is past the user's
+``google_calendar_synced_at`` high-water mark, and sends the resulting
+inserts, updates and deletes as Google API batch requests.  The event id a
+booking was given in each user's calendar is kept in
+``GoogleCalendarEvent``, together with the ``updated_at`` it was pushed
+at.  ``updated_at`` is stamped before the writing transaction commits, so
+each sync rescans a ``SYNC_OVERLAP`` window behind the mark to pick up
+late commits; bookings in it that were already pushed are skipped.
+Events for bookings the user can no longer see, because they were
+reassigned or deleted, are removed from the calendar.
+
+Building a client is kept off the hot path: the Calendar discovery
+document is parsed once per process, clients are cached per user for as
+long as their stored credentials stay valid, and API calls share
+per-thread persistent HTTP connections.  A background thread refreshes
+access tokens shortly before ``google_calendar_token_expiry`` so calls
+rarely wait on the token endpoint.
+
+``GOOGLE_CALENDAR_API_ENDPOINT`` points the client at another server,
+such as a local fake in tests.
+"""
+
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from urllib.parse import urljoin
+import json
+import logging
+import threading
+import time
+
 from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
 from google_auth_oauthlib.flow import Flow
 from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
-import json
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.errors import HttpError
+from googleapiclient.http import BatchHttpRequest, build_http
 from flask import current_app, session
-from app.models import Booking
+import requests
+from sqlalchemy import or_, true
+from app.models import Booking, GoogleCalendarEvent, User
+from app.booking_queries import BookingQueries
+from app.jobs import enqueue, task
 from app import db
 
 
+logger = logging.getLogger("calendar_service")
+
 SCOPES = ['https://www.googleapis.com/auth/calendar']
 
+DEFAULT_API_ENDPOINT = 'https://www.googleapis.com/'
+
+# Google recommends at most 50 calls per Calendar batch request
+MAX_BATCH_SIZE = 50
+
+# Bookings in these statuses are removed from calendars
+REMOVED_STATUSES = ('cancelled',)
+
+# Status codes meaning the event is already gone from the calendar
+GONE_STATUSES = (404, 410)
+
+# How far behind the high-water mark each sync looks for late-committed changes
+SYNC_OVERLAP = timedelta(minutes=5)
+
+# Seconds before expiry at which access tokens are refreshed in the background
+DEFAULT_REFRESH_MARGIN = 300
+# Seconds between background checks for tokens about to expire
+DEFAULT_REFRESH_INTERVAL = 60
+
+EXTENSION_KEY = 'google_calendar_refresher'
+
+
+class CalendarSyncError(Exception):
+    """Some calendar operations failed; the sync can be retried."""
+
+
+class _ServiceCache:
+    """Built API clients per user id, reused while the credentials are unchanged."""
+
+    def __init__(self):
+        self._entries = {}  # user id -> (credentials JSON, credentials, service)
+        self._lock = threading.Lock()
+
+    def get(self, user_id, credentials_json):
+        with self._lock:
+            entry = self._entries.get(user_id)
+        if entry is None or entry[0] != credentials_json or not entry[1].valid:
+            return None
+        return entry[1], entry[2]
+
+    def peek(self, user_id):
+        """Return the raw (credentials JSON, credentials, service) entry, or None."""
+        with self._lock:
+            return self._entries.get(user_id)
+
+    def put(self, user_id, credentials_json, credentials, service):
+        with self._lock:
+            self._entries[user_id] = (credentials_json, credentials, service)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class PooledHttp:
+    """
+    httplib2-compatible client that keeps one connection pool per thread.
+
+    ``httplib2.Http`` is not thread-safe, so cached API clients, which job
+    worker threads share, send each request through the calling thread's
+    own long-lived ``Http`` and reuse its keep-alive connections.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _http(self):
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = self._local.http = build_http()
+        return http
+
+    def request(self, *args, **kwargs):
+        return self._http().request(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._http(), name)
+
+
+service_cache = _ServiceCache()
+http_pool = PooledHttp()
+# Token refreshes reuse one HTTP session instead of a new Request() each time
+token_request = Request(session=requests.Session())
+
+
+@lru_cache(maxsize=None)
+def get_discovery_document():
+    """Return the Calendar v3 discovery document, parsed once per process."""
+    return json.loads(get_static_doc('calendar', 'v3'))
+
+
+def _api_endpoint():
+    return current_app.config.get('GOOGLE_CALENDAR_API_ENDPOINT') or DEFAULT_API_ENDPOINT
+
+
+def store_credentials(user, credentials):
+    """Save credentials and their expiry on the user; the caller commits."""
+    user.google_calendar_credentials = credentials.to_json()
+    user.google_calendar_token = credentials.token
+    user.google_calendar_token_expiry = credentials.expiry
+
+
+def refresh_credentials(user, credentials):
+    """Fetch a new access token and store it on the user; the caller commits."""
+    credentials.refresh(token_request)
+    store_credentials(user, credentials)
+
+
+def refresh_expiring_credentials(now=None):
+    """
+    Refresh every connected user's token that expires within the margin.
+
+    Cached clients keep working because their credentials object is
+    refreshed in place.  Returns how many tokens were refreshed.
+    """
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    margin = timedelta(seconds=current_app.config.get('GOOGLE_CALENDAR_REFRESH_MARGIN',
+                                                      DEFAULT_REFRESH_MARGIN))
+    users = User.query.filter(
+        User.google_calendar_enabled.is_(True),
+        User.google_calendar_credentials.isnot(None),
+        User.google_calendar_token_expiry <= now + margin
+    ).all()
+    refreshed = 0
+    for user in users:
+        cached = service_cache.peek(user.id)
+        if cached is not None and cached[0] == user.google_calendar_credentials:
+            credentials = cached[1]
+        else:
+            cached = None
+            credentials = Credentials.from_authorized_user_info(
+                json.loads(user.google_calendar_credentials), SCOPES
+            )
+        if not credentials.refresh_token:
+            continue
+        try:
+            refresh_credentials(user, credentials)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Token refresh failed for user {user.id}: {e}")
+            continue
+        if cached is not None:
+            service_cache.put(user.id, user.google_calendar_credentials, credentials, cached[2])
+        refreshed += 1
+    return refreshed
+
+
+class CredentialRefresher:
+    """Background thread running ``refresh_expiring_credentials`` periodically."""
+
+    def __init__(self, app, interval=DEFAULT_REFRESH_INTERVAL):
+        self.app = app
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def start(self):
+        """Start the thread unless it is running or disabled (interval 0)."""
+        if not self.interval:
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(
+                target=self._work, name='google-token-refresher', daemon=True
+            )
+            self._worker.start()
+
+    def _work(self):
+        while True:
+            time.sleep(self.interval)
+            with self.app.app_context():
+                try:
+                    refresh_expiring_credentials()
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Token refresher error: {e}")
+
+
+def visible_bookings(user):
+    """Filter criterion for the bookings shown in a user's calendar."""
+    if user.is_admin:
+        return true()
+    if user.is_instructor:
+        return (Booking.instructor_id == user.id) | Booking.instructor_id.is_(None)
+    return Booking.student_id == user.id
+
+
+def init_app(app):
+    """Attach the token refresher; it starts when calendar clients are first used."""
+    app.extensions[EXTENSION_KEY] = CredentialRefresher(
+        app, interval=app.config.get('GOOGLE_CALENDAR_REFRESH_INTERVAL', DEFAULT_REFRESH_INTERVAL)
+    )
+
 
 class GoogleCalendarService:
     def __init__(self):
@@ -60,28 +298,22 @@ class GoogleCalendarService:
         credentials = flow.credentials
         return credentials
 
-    def get_bookings_for_user(self, user):
-        """Get bookings based on user role."""
-        if user.is_admin:
-            return Booking.query.all()
-        elif user.is_instructor:
-            return Booking.query.filter(
-                (Booking.instructor_id == user.id) |
-                (Booking.instructor_id.is_(None))
-            ).all()
-        else:
-            return Booking.query.filter_by(student_id=user.id).all()
+    def get_bookings_for_user(self, user, changed_since=None):
+        """Get bookings based on user role, optionally only those changed since a time."""
+        query = BookingQueries.with_parties().filter(visible_bookings(user))
+        if changed_since is not None:
+            query = query.filter(Booking.updated_at > changed_since)
+        return query.order_by(Booking.updated_at, Booking.id).all()
 
-    def create_event(self, booking, user):
-        """Create a Google Calendar event for a booking."""
-        if not self.service:
-            self._initialize_service(user)
+    def _calendar_id(self, user):
+        return user.google_calendar_id or 'primary'
 
+    def _event_body(self, booking):
         instructor_name = (
             booking.instructor.full_name if booking.instructor else "Solo"
         )
-        event = {
-            'summary': f'Flight Training - {booking.aircraft.tail_number}',
+        return {
+            'summary': f'Flight Training - {booking.aircraft.registration}',
             'description': (
                 f'Student: {booking.student.full_name}\n'
                 f'Instructor: {instructor_name}\n'
@@ -97,10 +329,15 @@ class GoogleCalendarService:
             },
         }
 
+    def create_event(self, booking, user):
+        """Create a Google Calendar event for a booking."""
+        if not self.service:
+            self._initialize_service(user)
+
         try:
             event = self.service.events().insert(
-                calendarId='primary',
-                body=event
+                calendarId=self._calendar_id(user),
+                body=self._event_body(booking)
             ).execute()
             return event.get('id')
         except Exception as e:
@@ -114,31 +351,11 @@ class GoogleCalendarService:
         if not self.service:
             self._initialize_service(user)
 
-        instructor_name = (
-            booking.instructor.full_name if booking.instructor else "Solo"
-        )
-        event = {
-            'summary': f'Flight Training - {booking.aircraft.tail_number}',
-            'description': (
-                f'Student: {booking.student.full_name}\n'
-                f'Instructor: {instructor_name}\n'
-                f'Status: {booking.status}'
-            ),
-            'start': {
-                'dateTime': booking.start_time.isoformat(),
-                'timeZone': 'UTC',
-            },
-            'end': {
-                'dateTime': booking.end_time.isoformat(),
-                'timeZone': 'UTC',
-            },
-        }
-
         try:
             event = self.service.events().update(
-                calendarId='primary',
+                calendarId=self._calendar_id(user),
                 eventId=event_id,
-                body=event
+                body=self._event_body(booking)
             ).execute()
             return event.get('id')
         except Exception as e:
@@ -154,7 +371,7 @@ class GoogleCalendarService:
 
         try:
             self.service.events().delete(
-                calendarId='primary',
+                calendarId=self._calendar_id(user),
                 eventId=event_id
             ).execute()
             return True
@@ -165,29 +382,123 @@ class GoogleCalendarService:
             return False
 
     def sync_all_bookings(self, user):
-        """Sync all relevant bookings for a user based on their role."""
+        """
+        Push bookings changed since the user's last sync, in batch requests.
+
+        New bookings are inserted, changed ones updated, and cancelled ones
+        and those the user can no longer see deleted.  Progress is
+        committed; the high-water mark only advances when every operation
+        succeeded, otherwise ``CalendarSyncError`` is raised and the next
+        sync repeats the remaining work.  Returns the number of operations
+        sent.
+        """
         if not (user.google_calendar_enabled and
                 user.google_calendar_credentials):
-            return
+            return 0
 
-        bookings = self.get_bookings_for_user(user)
+        since = user.google_calendar_synced_at
+        bookings = self.get_bookings_for_user(user, since and since - SYNC_OVERLAP)
+        events = {
+            event.booking_id: event
+            for event in GoogleCalendarEvent.query.filter(
+                GoogleCalendarEvent.user_id == user.id,
+                GoogleCalendarEvent.booking_id.in_([b.id for b in bookings])
+            )
+        }
+
+        operations = []
         for booking in bookings:
-            if not booking.google_calendar_event_id:
-                event_id = self.create_event(booking, user)
-                if event_id:
-                    booking.google_calendar_event_id = event_id
-            else:
-                self.update_event(
-                    booking.google_calendar_event_id,
-                    booking,
-                    user
-                )
+            event = events.get(booking.id)
+            if booking.status in REMOVED_STATUSES:
+                if event is not None:
+                    operations.append(('delete', booking, event))
+            elif event is None:
+                operations.append(('insert', booking, None))
+            elif event.booking_updated_at != booking.updated_at:
+                operations.append(('update', booking, event))
+        hidden = GoogleCalendarEvent.query.outerjoin(
+            Booking, Booking.id == GoogleCalendarEvent.booking_id
+        ).filter(
+            GoogleCalendarEvent.user_id == user.id,
+            or_(Booking.id.is_(None), ~visible_bookings(user))
+        )
+        operations.extend(('delete', None, event) for event in hidden)
+        if not operations:
+            return 0
+        self._initialize_service(user)
+
+        sent = 0
+        failures = []
+        while operations:
+            sent += len(operations)
+            operations = self._run_batches(user, operations, failures)
+        if failures:
+            db.session.commit()
+            raise CalendarSyncError(
+                f'{len(failures)} calendar operations failed for user {user.id}: {failures[0]}'
+            )
+        if bookings:
+            user.google_calendar_synced_at = max(b.updated_at for b in bookings)
+        db.session.commit()
+        return sent
+
+    def _run_batches(self, user, operations, failures):
+        """Send operations in batches; returns follow-up operations to run."""
+        calendar_id = self._calendar_id(user)
+        batch_uri = urljoin(_api_endpoint(), 'batch/calendar/v3')
+        events_api = self.service.events()
+        follow_up = []
+
+        for offset in range(0, len(operations), MAX_BATCH_SIZE):
+            chunk = operations[offset:offset + MAX_BATCH_SIZE]
+
+            def handle(request_id, response, exception, chunk=chunk):
+                kind, booking, event = chunk[int(request_id)]
+                gone = isinstance(exception, HttpError) and exception.resp.status in GONE_STATUSES
+                if exception is not None and (kind == 'insert' or not gone):
+                    booking_id = booking.id if booking is not None else event.booking_id
+                    failures.append(f'{kind} booking {booking_id}: {exception}')
+                elif kind == 'insert':
+                    db.session.add(GoogleCalendarEvent(
+                        user_id=user.id, booking_id=booking.id, event_id=response['id'],
+                        booking_updated_at=booking.updated_at
+                    ))
+                elif kind == 'delete':
+                    db.session.delete(event)
+                elif gone:
+                    # The event was removed from the calendar by hand; put it back
+                    db.session.delete(event)
+                    follow_up.append(('insert', booking, None))
+                else:
+                    event.booking_updated_at = booking.updated_at
+
+            batch = BatchHttpRequest(callback=handle, batch_uri=batch_uri)
+            for index, (kind, booking, event) in enumerate(chunk):
+                if kind == 'insert':
+                    request = events_api.insert(calendarId=calendar_id, body=self._event_body(booking))
+                elif kind == 'update':
+                    request = events_api.update(calendarId=calendar_id, eventId=event.event_id,
+                                                body=self._event_body(booking))
+                else:
+                    request = events_api.delete(calendarId=calendar_id, eventId=event.event_id)
+                batch.add(request, request_id=str(index))
+            try:
+                batch.execute()
+            except Exception as e:
+                failures.append(f'batch request: {e}')
+            db.session.flush()
+        return follow_up
 
     def _initialize_service(self, user):
         """Initialize the Google Calendar service with user's credentials."""
         if not user.google_calendar_credentials:
             raise Exception("No Google Calendar credentials found for user")
 
+        cached = service_cache.get(user.id, user.google_calendar_credentials)
+        if cached is not None:
+            self.credentials, self.service = cached
+            return
+
         self.credentials = Credentials.from_authorized_user_info(
             json.loads(user.google_calendar_credentials),
             SCOPES
@@ -196,11 +507,45 @@ class GoogleCalendarService:
         if not self.credentials or not self.credentials.valid:
             if (self.credentials and self.credentials.expired and
                     self.credentials.refresh_token):
-                self.credentials.refresh(Request())
-                # Update stored credentials
-                user.google_calendar_credentials = self.credentials.to_json()
+                refresh_credentials(user, self.credentials)
                 db.session.commit()
             else:
                 raise Exception("No valid credentials available")
+        elif user.google_calendar_token_expiry != self.credentials.expiry:
+            # Record the expiry so the background refresher can find it
+            store_credentials(user, self.credentials)
+            db.session.commit()
+
+        self.service = build_from_document(
+            get_discovery_document(),
+            http=AuthorizedHttp(self.credentials, http=http_pool),
+            client_options={'api_endpoint': urljoin(_api_endpoint(), 'calendar/v3/')}
+        )
+        service_cache.put(user.id, user.google_calendar_credentials,
+                          self.credentials, self.service)
+        refresher = current_app.extensions.get(EXTENSION_KEY)
+        if refresher is not None:
+            refresher.start()
+
+
+def schedule_calendar_sync(user_ids):
+    """Queue a calendar sync for each of the users who connected Google Calendar."""
+    user_ids = {user_id for user_id in user_ids if user_id}
+    if not user_ids:
+        return
+    connected = db.session.query(User.id).filter(
+        User.id.in_(user_ids),
+        User.google_calendar_enabled.is_(True),
+        User.google_calendar_credentials.isnot(None)
+    )
+    for user_id, in connected:
+        enqueue('sync_google_calendar', user_id=user_id)
+
 
-        self.service = build('calendar', 'v3', credentials=self.credentials)
+@task('sync_google_calendar')
+def sync_google_calendar(user_id):
+    """Job handler: push the user's bookings to their Google Calendar."""
+    user = db.session.get(User, user_id)
+    if user is None:
+        return
+    GoogleCalendarService().sync_all_bookings(user)
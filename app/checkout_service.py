@@ -0,0 +1,107 @@
+"""
+Flight check-out.
+
+Checking a flight out touches several rows that have to agree with each
+other: the ``CheckOut`` record, the booking's status, the aircraft's Hobbs
+and tach totals and its hour-based maintenance countdowns, the student's
+``FlightLog`` entry and the ``Invoice``.  ``complete_check_out`` does all of
+it in one transaction.  The booking and aircraft rows are locked with
+``SELECT ... FOR UPDATE`` first (a no-op on SQLite, where the write lock is
+taken at the first UPDATE), and the countdowns are decremented with SQL
+expressions rather than values read into Python, so two flights on the same
+aircraft finishing at once both count.  Pages showing the flight afterwards
+read the stored totals instead of recomputing them.
+"""
+
+from sqlalchemy import select
+
+from app import db
+from app.billing import invoice_values
+from app.models import Aircraft, Booking, CheckOut, FlightLog, Invoice, Squawk
+from app.utils.datetime_utils import utcnow
+
+# Aircraft countdowns that run down with every hour flown
+MAINTENANCE_COUNTDOWNS = ('time_to_next_oil_change', 'time_to_next_100hr')
+
+
+class CheckOutError(ValueError):
+    """Raised when a flight cannot be checked out."""
+
+
+def _lock(model, id):
+    return db.session.execute(
+        select(model).where(model.id == id).with_for_update().execution_options(populate_existing=True)
+    ).scalar_one()
+
+
+def complete_check_out(booking, hobbs_end, tach_end, instructor_id=None, notes='',
+                       squawk_description=None, reported_by_id=None, now=None):
+    """
+    Check a flight out, bill it and log it, and commit.
+
+    Flight time is the Hobbs difference between the check-in and check-out;
+    the maintenance countdowns and both bills use it.  Raises
+    ``CheckOutError`` (after rolling back) if the flight was not checked in,
+    is already checked out, or the meter readings go backwards.
+    """
+    now = now or utcnow()
+    try:
+        booking = _lock(Booking, booking.id)
+        check_in = booking.check_in
+        if check_in is None:
+            raise CheckOutError('This flight has not been checked in.')
+        if booking.check_out is not None:
+            raise CheckOutError('This flight has already been checked out.')
+        if hobbs_end < check_in.hobbs_start or tach_end < check_in.tach_start:
+            raise CheckOutError('Hobbs and tach readings cannot be lower than at check-in.')
+
+        aircraft = _lock(Aircraft, booking.aircraft_id)
+        flight_hours = round(hobbs_end - check_in.hobbs_start, 2)
+
+        db.session.add(CheckOut(
+            booking_id=booking.id,
+            aircraft_id=aircraft.id,
+            instructor_id=instructor_id,
+            check_out_time=now,
+            hobbs_end=hobbs_end,
+            tach_end=tach_end,
+            notes=notes
+        ))
+        booking.status = 'completed'
+
+        aircraft.hobbs_time = hobbs_end
+        aircraft.tach_time = tach_end
+        for column in MAINTENANCE_COUNTDOWNS:
+            if getattr(aircraft, column) is not None:
+                setattr(aircraft, column, getattr(Aircraft, column) - flight_hours)
+
+        dual = booking.instructor_id is not None
+        db.session.add(FlightLog(
+            booking_id=booking.id,
+            aircraft_id=aircraft.id,
+            user_id=booking.student_id,
+            flight_date=check_in.check_in_time,
+            dual_received=flight_hours if dual else None,
+            pic_time=None if dual else flight_hours,
+            remarks=notes or None
+        ))
+
+        instructor_rate = booking.instructor.instructor_rate_per_hour if dual else None
+        db.session.add(Invoice(**invoice_values(
+            booking.id, aircraft.id, booking.student_id, booking.instructor_id,
+            flight_hours, aircraft.rate_per_hour, instructor_rate, now
+        )))
+
+        if squawk_description:
+            db.session.add(Squawk(
+                aircraft_id=aircraft.id,
+                description=squawk_description,
+                reported_by_id=reported_by_id,
+                status='open'
+            ))
+
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return booking
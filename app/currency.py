@@ -0,0 +1,224 @@
+"""
+Pilot currency and recency.
+
+Each ``CurrencyRule`` asks for some recent experience inside a trailing
+window.  Examples are three landings in 90 days to carry passengers,
+three night landings for night passengers, and six approaches plus
+holding in six calendar months to file IFR.  ``evaluate_currency`` answers
+every rule for many pilots at once.  One query reads the flights in the
+widest window for all of them from the (user_id, flight_date) index, and
+the counting happens in Python.
+
+Results are cached per pilot in-process.  A commit that writes a pilot's
+``FlightLog`` drops their entry.  An entry also expires when the first
+rule it reports as current lapses, or after ``CURRENCY_CACHE_TTL``
+seconds, which bounds staleness from writes in other processes.
+"""
+
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+import threading
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import FlightLog
+
+DEFAULT_CACHE_TTL = 300
+
+EXTENSION_KEY = 'pilot_currency'
+
+# One rule's result: whether the pilot is current, until when (None if not
+# current), and what they logged inside the window
+CurrencyStatus = namedtuple('CurrencyStatus', 'rule label current expires_at counts')
+
+
+def _month_start(dt, months_back=0):
+    """Return midnight on the first of the month ``months_back`` before dt's."""
+    month_index = dt.year * 12 + dt.month - 1 - months_back
+    return datetime(month_index // 12, month_index % 12 + 1, 1)
+
+
+class CurrencyRule:
+    """Recent experience a pilot must have logged inside a trailing window."""
+
+    def __init__(self, name, label, requirements, days=None, calendar_months=None):
+        self.name = name
+        self.label = label
+        # (FlightLog field, minimum) pairs; 'landings' is day plus night
+        self.requirements = requirements
+        self.days = days
+        self.calendar_months = calendar_months
+
+    def window_start(self, now):
+        """Return the oldest flight date that still counts at ``now``."""
+        if self.calendar_months is not None:
+            return _month_start(now, self.calendar_months)
+        return now - timedelta(days=self.days)
+
+    def lapses_at(self, flight_date):
+        """Return when experience logged at ``flight_date`` stops counting."""
+        if self.calendar_months is not None:
+            # Good through the end of the last calendar month of the window
+            return _month_start(flight_date, -(self.calendar_months + 1))
+        return flight_date + timedelta(days=self.days)
+
+    def evaluate(self, flights, now):
+        """Evaluate against (flight_date, counts) pairs sorted newest first."""
+        start = self.window_start(now)
+        totals = {}
+        expires_at = None
+        current = True
+        for field, minimum in self.requirements:
+            logged = 0
+            reached_at = None
+            for flight_date, counts in flights:
+                if flight_date < start:
+                    break
+                logged += counts[field]
+                if reached_at is None and logged >= minimum:
+                    reached_at = flight_date
+            totals[field] = logged
+            if reached_at is None:
+                current = False
+            else:
+                lapses = self.lapses_at(reached_at)
+                expires_at = lapses if expires_at is None else min(expires_at, lapses)
+        return CurrencyStatus(self.name, self.label, current,
+                              expires_at if current else None, totals)
+
+
+RULES = (
+    CurrencyRule('passengers', 'Day passenger carrying', (('landings', 3),), days=90),
+    CurrencyRule('night', 'Night passenger carrying', (('landings_night', 3),), days=90),
+    CurrencyRule('instrument', 'Instrument (approaches and holding)',
+                 (('approaches', 6), ('holds', 1)), calendar_months=6),
+)
+
+
+class CurrencyCache:
+    """Process-wide map of pilot id -> evaluated rules."""
+
+    def __init__(self, ttl=DEFAULT_CACHE_TTL):
+        self.ttl = ttl
+        self._entries = {}  # pilot id -> (built at, valid until, results)
+        self._lock = threading.Lock()
+
+    def get(self, user_id, now):
+        with self._lock:
+            entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        built_at, valid_until, results = entry
+        if time.monotonic() - built_at >= self.ttl or (valid_until is not None and now >= valid_until):
+            return None
+        return results
+
+    def put(self, user_id, results):
+        expiries = [status.expires_at for status in results.values() if status.expires_at]
+        with self._lock:
+            self._entries[user_id] = (time.monotonic(), min(expiries, default=None), results)
+
+    def invalidate(self, user_ids=None):
+        """Drop the given pilot ids, or every entry when ``user_ids`` is None."""
+        with self._lock:
+            if user_ids is None:
+                self._entries.clear()
+                return
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+
+def init_app(app):
+    """Attach a currency cache to the application."""
+    ttl = app.config.get('CURRENCY_CACHE_TTL', DEFAULT_CACHE_TTL)
+    app.extensions[EXTENSION_KEY] = CurrencyCache(ttl=ttl)
+
+
+def get_currency_cache():
+    """Return the current application's currency cache."""
+    cache = current_app.extensions.get(EXTENSION_KEY)
+    if cache is None:
+        init_app(current_app)
+        cache = current_app.extensions[EXTENSION_KEY]
+    return cache
+
+
+def _recent_flights(user_ids, now):
+    """Return {pilot id: [(flight_date, counts)]} newest first, in one query."""
+    oldest = min(rule.window_start(now) for rule in RULES)
+    rows = db.session.query(
+        FlightLog.user_id, FlightLog.flight_date, FlightLog.landings_day,
+        FlightLog.landings_night, FlightLog.approaches, FlightLog.holds
+    ).filter(
+        FlightLog.user_id.in_(user_ids),
+        FlightLog.flight_date >= oldest,
+        FlightLog.flight_date <= now
+    ).order_by(FlightLog.user_id, FlightLog.flight_date.desc()).all()
+    flights = {user_id: [] for user_id in user_ids}
+    for user_id, flight_date, landings_day, landings_night, approaches, holds in rows:
+        flights[user_id].append((flight_date, {
+            'landings': (landings_day or 0) + (landings_night or 0),
+            'landings_night': landings_night or 0,
+            'approaches': approaches or 0,
+            'holds': holds or 0,
+        }))
+    return flights
+
+
+def evaluate_currency(user_ids, now=None):
+    """
+    Return {pilot id: {rule name: CurrencyStatus}} for every given pilot.
+
+    Cached pilots are answered from memory; the rest share one query.
+    """
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    cache = get_currency_cache()
+    results = {}
+    missing = []
+    for user_id in {int(user_id) for user_id in user_ids if user_id}:
+        cached = cache.get(user_id, now)
+        if cached is None:
+            missing.append(user_id)
+        else:
+            results[user_id] = cached
+    if missing:
+        for user_id, flights in _recent_flights(missing, now).items():
+            results[user_id] = {rule.name: rule.evaluate(flights, now) for rule in RULES}
+            cache.put(user_id, results[user_id])
+    return results
+
+
+def lapsed_rules(statuses):
+    """Return the labels of the rules a pilot is not current for."""
+    return [status.label for status in statuses.values() if not status.current]
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_pilots(session, flush_context):
+    """Remember whose flight logs this flush wrote."""
+    pilots = session.info.setdefault('currency_pilots', set())
+    for obj in session.new | session.dirty | session.deleted:
+        if isinstance(obj, FlightLog):
+            history = inspect(obj).attrs.user_id.history
+            for user_id in list(history.added) + list(history.unchanged) + list(history.deleted):
+                if user_id:
+                    pilots.add(int(user_id))
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    pilots = session.info.pop('currency_pilots', None)
+    if pilots and has_app_context():
+        cache = current_app.extensions.get(EXTENSION_KEY)
+        if cache is not None:
+            cache.invalidate(pilots)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _invalidate_on_rollback(session, previous_transaction):
+    # A result computed mid-transaction may count flights that were rolled back
+    _invalidate_on_commit(session)
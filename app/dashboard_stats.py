@@ -0,0 +1,138 @@
+"""
+Materialized admin dashboard statistics.
+
+The admin dashboard shows a handful of counts over users, aircraft,
+bookings and maintenance records.  Instead of running a COUNT(*) per figure
+on every page load, the counts live in the single ``dashboard_stats`` row
+and are adjusted in the same transaction as each ORM insert, update or
+delete that could change them.
+
+Bulk ``Query.delete()``/``update()`` calls bypass the ORM unit of work, so
+after those (or to repair drift) call ``rebuild_dashboard_stats``.
+"""
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app import db
+from app.bulk_inserts import bulk_insert_listener
+from app.model_history import attribute_values, track_previous_values
+from app.models import User, Aircraft, Booking, MaintenanceRecord, DashboardStats
+
+STATS_ROW_ID = 1
+
+# Counter column -> (model, attribute, value) where attribute/value is the
+# condition a row must meet to be counted, or None to count every row
+COUNTERS = {
+    'total_users': (User, None, None),
+    'active_users': (User, 'status', 'active'),
+    'total_aircraft': (Aircraft, None, None),
+    'available_aircraft': (Aircraft, 'status', 'available'),
+    'pending_bookings': (Booking, 'status', 'pending'),
+    'maintenance_due': (MaintenanceRecord, 'status', 'due'),
+}
+
+
+def rebuild_dashboard_stats():
+    """Recount every statistic from the source tables and store the snapshot."""
+    counts = {}
+    for name, (model, attribute, value) in COUNTERS.items():
+        query = db.session.query(db.func.count(model.id))
+        if attribute is not None:
+            query = query.filter(getattr(model, attribute) == value)
+        counts[name] = query.scalar()
+
+    stats = db.session.get(DashboardStats, STATS_ROW_ID)
+    if stats is None:
+        stats = DashboardStats(id=STATS_ROW_ID)
+        db.session.add(stats)
+    for name, count in counts.items():
+        setattr(stats, name, count)
+    db.session.commit()
+    return stats
+
+
+def get_dashboard_stats():
+    """Return the dashboard counters as a dict, building the snapshot on first use."""
+    stats = db.session.get(DashboardStats, STATS_ROW_ID)
+    if stats is None:
+        stats = rebuild_dashboard_stats()
+    return {name: getattr(stats, name) for name in COUNTERS}
+
+
+def _counter_deltas(session):
+    deltas = {}
+    for name, (model, attribute, value) in COUNTERS.items():
+        delta = 0
+        for obj in session.new:
+            if isinstance(obj, model):
+                if attribute is None or getattr(obj, attribute) == value:
+                    delta += 1
+        for obj in session.deleted:
+            if isinstance(obj, model):
+                if attribute is None:
+                    delta -= 1
+                else:
+                    before, _ = attribute_values(inspect(obj), attribute)
+                    delta -= before == value
+        if attribute is not None:
+            for obj in session.dirty:
+                if isinstance(obj, model) and obj not in session.deleted:
+                    state = inspect(obj)
+                    if state.attrs[attribute].history.has_changes():
+                        before, after = attribute_values(state, attribute)
+                        delta += (after == value) - (before == value)
+        if delta:
+            deltas[name] = delta
+    return deltas
+
+
+# Load the value an assignment replaces so the delta can be computed
+track_previous_values(*(getattr(model, attribute)
+                        for model, attribute, _ in COUNTERS.values() if attribute is not None))
+
+
+def _bulk_insert_counter(model):
+    """Return a listener counting rows added by a bulk ``insert(model)``."""
+    def count_rows(session, rows):
+        deltas = {}
+        for name, (counted_model, attribute, value) in COUNTERS.items():
+            if counted_model is model:
+                delta = sum(1 for row in rows if attribute is None or row.get(attribute) == value)
+                if delta:
+                    deltas[name] = delta
+        _apply_deltas(session, deltas)
+    return count_rows
+
+
+for _model in dict.fromkeys(model for model, _, _ in COUNTERS.values()):
+    bulk_insert_listener(_model)(_bulk_insert_counter(_model))
+
+
+@event.listens_for(Session, 'after_flush')
+def _apply_counter_deltas(session, flush_context):
+    """Adjust the snapshot row inside the flush's own transaction."""
+    _apply_deltas(session, _counter_deltas(session))
+
+
+def _apply_deltas(session, deltas):
+    if not deltas:
+        return
+    table = DashboardStats.__table__
+    # If the row does not exist yet this updates nothing; the first read
+    # rebuilds it from scratch
+    session.connection().execute(
+        table.update()
+        .where(table.c.id == STATS_ROW_ID)
+        .values({name: table.c[name] + delta for name, delta in deltas.items()})
+    )
+
+
+def init_app(app):
+    """Register the ``flask rebuild-dashboard-stats`` command."""
+    @app.cli.command('rebuild-dashboard-stats')
+    def rebuild_dashboard_stats_command():
+        """Recount the admin dashboard statistics from the source tables."""
+        stats = rebuild_dashboard_stats()
+        for name in COUNTERS:
+            print(f'{name}: {getattr(stats, name)}')
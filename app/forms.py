@@ -1,16 +1,17 @@
 from flask_wtf import FlaskForm
 from wtforms import (
     StringField, PasswordField, BooleanField, SubmitField, SelectField,
-    DateTimeField, FloatField, TextAreaField, IntegerField, FileField
+    DateTimeField, FloatField, TextAreaField, IntegerField, FileField, DateField,
+    TimeField
 )
 from wtforms.validators import (
     DataRequired, Email, Optional, EqualTo, ValidationError, NumberRange, Length
 )
 from app.models import User
 import re
+import pytz
 from flask_wtf.csrf import CSRFProtect
 from datetime import datetime
-from datetime import timezone
 
 
 csrf = CSRFProtect()
@@ -133,6 +134,104 @@ class BookingForm(FlaskForm):
     submit = SubmitField('Book')
 
 
+class RecurringBookingForm(FlaskForm):
+    aircraft_id = SelectField(
+        'Aircraft',
+        coerce=int,
+        validators=[
+            DataRequired()
+        ]
+    )
+    instructor_id = SelectField(
+        'Instructor',
+        coerce=int,
+        validators=[
+            Optional()
+        ]
+    )
+    day_of_week = SelectField(
+        'Day of Week',
+        coerce=int,
+        choices=[
+            (0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'),
+            (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')
+        ]
+    )
+    start_time = TimeField(
+        'Start Time',
+        validators=[
+            DataRequired()
+        ]
+    )
+    duration_hours = FloatField(
+        'Duration (hours)',
+        validators=[
+            DataRequired(),
+            NumberRange(min=0.5, max=8)
+        ]
+    )
+    start_date = DateField(
+        'Start Date',
+        validators=[
+            DataRequired()
+        ]
+    )
+    end_date = DateField(
+        'End Date',
+        validators=[
+            Optional()
+        ]
+    )
+    submit = SubmitField('Create')
+
+    def validate_end_date(self, field):
+        if field.data and self.start_date.data and field.data < self.start_date.data:
+            raise ValidationError('End date must be on or after the start date.')
+
+
+class WaitlistForm(FlaskForm):
+    aircraft_id = SelectField(
+        'Aircraft',
+        coerce=int,
+        validators=[
+            DataRequired()
+        ]
+    )
+    instructor_id = SelectField(
+        'Instructor',
+        coerce=int,
+        validators=[
+            Optional()
+        ]
+    )
+    requested_date = DateField(
+        'Requested Date',
+        validators=[
+            DataRequired()
+        ]
+    )
+    time_preference = SelectField(
+        'Time Preference',
+        choices=[
+            ('', 'Any Time'),
+            ('morning', 'Morning'),
+            ('afternoon', 'Afternoon'),
+            ('evening', 'Evening')
+        ],
+        validators=[
+            Optional()
+        ]
+    )
+    duration_hours = FloatField(
+        'Duration (hours)',
+        validators=[
+            DataRequired(),
+            NumberRange(min=0.5, max=8)
+        ]
+    )
+    submit = SubmitField('Join Waitlist')
+
+
 class GoogleCalendarSettingsForm(FlaskForm):
     enabled = BooleanField('Enable Google Calendar Integration')
     calendar_id = StringField(
@@ -635,6 +734,12 @@ class AccountSettingsForm(FlaskForm):
             Optional()
         ]
     )
+    timezone = StringField(
+        'Timezone',
+        validators=[
+            Optional()
+        ]
+    )
     password = PasswordField(
         'New Password',
         validators=[
@@ -649,6 +754,10 @@ class AccountSettingsForm(FlaskForm):
     )
     submit = SubmitField('Update Settings')
 
+    def validate_timezone(self, field):
+        if field.data and field.data not in pytz.all_timezones_set:
+            raise ValidationError('Enter a timezone name such as America/Los_Angeles.')
+
 
 class ContactForm(FlaskForm):
     name = StringField('Name', validators=[DataRequired(), Length(min=2, max=100)])
@@ -0,0 +1,258 @@
+"""
+Durable background jobs.
+
+Slow side effects (email, calendar sync, waitlist matching) are queued as
+rows in the ``job`` table instead of being done inside the request.
+``enqueue`` adds the row to the current session, so a job only exists if
+the transaction that asked for it commits.  Jobs are run by ``flask jobs
+worker``, and also by a small pool of threads inside each web process when
+``JOBS_WORKER_THREADS`` is set.  Workers claim a job with a conditional UPDATE, so several threads or
+processes can share one table.
+
+A job that raises is retried with exponential backoff; once it has used
+up its attempts it is left in the table with status ``dead`` for
+inspection and ``flask jobs retry-dead``.  A job left ``running`` by a
+worker that died is reclaimed after ``JOBS_LOCK_TIMEOUT`` seconds.
+
+Tasks are plain functions registered with ``@task(name)``; the job payload
+is passed as keyword arguments and must be JSON-serializable.
+"""
+
+from datetime import datetime, timedelta, timezone
+import logging
+import threading
+
+import click
+from flask import current_app, has_app_context
+from flask.cli import AppGroup
+from sqlalchemy import and_, event, or_, update
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import Job
+
+logger = logging.getLogger("jobs")
+
+DEFAULT_MAX_ATTEMPTS = 5
+# Seconds before the first retry; doubled for each further attempt
+DEFAULT_BACKOFF = 30
+MAX_BACKOFF = 3600
+# Seconds after which a job still marked running is assumed abandoned
+DEFAULT_LOCK_TIMEOUT = 600
+# Seconds an idle worker sleeps before polling for due retries
+DEFAULT_POLL_INTERVAL = 5
+
+EXTENSION_KEY = 'job_runner'
+
+# Task name -> function
+TASKS = {}
+
+
+def task(name):
+    """Register a function as the handler for jobs called ``name``."""
+    def decorator(f):
+        TASKS[name] = f
+        return f
+    return decorator
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def enqueue(name, delay=None, max_attempts=None, **payload):
+    """
+    Queue a job for ``name`` with ``payload`` as its arguments.
+
+    The job is added to the current session; the caller commits.
+    """
+    if name not in TASKS:
+        raise ValueError(f'Unknown job: {name!r}')
+    job = Job(
+        name=name,
+        payload=payload,
+        status='queued',
+        max_attempts=max_attempts or current_app.config.get('JOBS_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS),
+        run_at=_utcnow() + (delay or timedelta())
+    )
+    db.session.add(job)
+    return job
+
+
+def backoff_delay(attempts):
+    """Return how long to wait before retrying a job that failed ``attempts`` times."""
+    base = current_app.config.get('JOBS_BACKOFF_SECONDS', DEFAULT_BACKOFF)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), MAX_BACKOFF))
+
+
+def claim_job(now=None):
+    """
+    Mark the next runnable job as running and return it, or None.
+
+    The UPDATE only succeeds if the job is still claimable, so a job is
+    never handed to two workers; on a lost race the next one is tried.
+    """
+    now = now or _utcnow()
+    stale = now - timedelta(seconds=current_app.config.get('JOBS_LOCK_TIMEOUT', DEFAULT_LOCK_TIMEOUT))
+    claimable = or_(
+        and_(Job.status == 'queued', Job.run_at <= now),
+        and_(Job.status == 'running', Job.locked_at < stale)
+    )
+    while True:
+        job_id = db.session.query(Job.id).filter(claimable) \
+            .order_by(Job.run_at, Job.id).limit(1).scalar()
+        if job_id is None:
+            db.session.commit()
+            return None
+        claimed = db.session.execute(
+            update(Job).where(Job.id == job_id, claimable)
+            .values(status='running', locked_at=now, attempts=Job.attempts + 1)
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, job_id, populate_existing=True)
+
+
+def run_job(job, now=None):
+    """Run a claimed job, then mark it done, queued for retry or dead.  Returns success."""
+    job_id = job.id
+    handler = TASKS.get(job.name)
+    try:
+        if handler is None:
+            raise LookupError(f'No task registered for {job.name!r}')
+        handler(**(job.payload or {}))
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(Job, job_id)
+        now = now or _utcnow()
+        job.last_error = f'{type(e).__name__}: {e}'
+        job.locked_at = None
+        if handler is None or job.attempts >= job.max_attempts:
+            job.status = 'dead'
+            job.finished_at = now
+            logger.error(f"Job {job_id} ({job.name}) failed permanently: {e}")
+        else:
+            job.status = 'queued'
+            job.run_at = now + backoff_delay(job.attempts)
+            logger.warning(f"Job {job_id} ({job.name}) failed, retrying at {job.run_at}: {e}")
+        db.session.commit()
+        return False
+
+    job = db.session.get(Job, job_id)
+    job.status = 'done'
+    job.locked_at = None
+    job.finished_at = now or _utcnow()
+    db.session.commit()
+    return True
+
+
+def run_pending(now=None):
+    """Run every job that is due in the calling thread; returns how many ran."""
+    count = 0
+    while True:
+        job = claim_job(now)
+        if job is None:
+            return count
+        run_job(job, now)
+        count += 1
+
+
+class JobRunner:
+    """Pool of worker threads draining the job table for one application."""
+
+    def __init__(self, app, threads=1, poll_interval=DEFAULT_POLL_INTERVAL):
+        self.app = app
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._workers = []
+
+    def start(self):
+        """Start any worker threads that are not already running."""
+        with self._lock:
+            self._workers = [t for t in self._workers if t.is_alive()]
+            for number in range(len(self._workers), self.threads):
+                worker = threading.Thread(
+                    target=self._work, name=f'job-worker-{number}', daemon=True
+                )
+                worker.start()
+                self._workers.append(worker)
+        return list(self._workers)
+
+    def wake(self):
+        """Tell idle workers that new jobs were committed."""
+        if self.threads:
+            self.start()
+            self._wakeup.set()
+
+    def _work(self):
+        while True:
+            with self.app.app_context():
+                try:
+                    job = claim_job()
+                    if job is not None:
+                        run_job(job)
+                        continue
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Job worker error: {e}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+
+jobs_cli = AppGroup('jobs', help='Run and manage background jobs.')
+
+
+@jobs_cli.command('worker')
+@click.option('--threads', default=1, show_default=True, help='Number of worker threads.')
+@click.option('--burst', is_flag=True, help='Run the jobs that are due, then exit.')
+def worker_command(threads, burst):
+    """Run queued background jobs."""
+    if burst:
+        print(f'Ran {run_pending()} jobs')
+        return
+    runner = JobRunner(current_app._get_current_object(), threads=threads,
+                       poll_interval=current_app.config.get('JOBS_POLL_INTERVAL', DEFAULT_POLL_INTERVAL))
+    for worker in runner.start():
+        worker.join()
+
+
+@jobs_cli.command('retry-dead')
+def retry_dead_command():
+    """Queue every dead job for another round of attempts."""
+    count = Job.query.filter_by(status='dead').update(
+        {'status': 'queued', 'attempts': 0, 'run_at': _utcnow(), 'finished_at': None},
+        synchronize_session=False
+    )
+    db.session.commit()
+    print(f'Requeued {count} jobs')
+
+
+def init_app(app):
+    """Attach the in-process job runner and register ``flask jobs``."""
+    app.extensions[EXTENSION_KEY] = JobRunner(
+        app,
+        threads=app.config.get('JOBS_WORKER_THREADS', 0),
+        poll_interval=app.config.get('JOBS_POLL_INTERVAL', DEFAULT_POLL_INTERVAL)
+    )
+    app.cli.add_command(jobs_cli)
+
+
+@event.listens_for(Session, 'after_flush')
+def _note_new_jobs(session, flush_context):
+    if any(isinstance(obj, Job) for obj in session.new):
+        session.info['jobs_enqueued'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_runner(session):
+    if session.info.pop('jobs_enqueued', False) and has_app_context():
+        runner = current_app.extensions.get(EXTENSION_KEY)
+        if runner is not None:
+            runner.wake()
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_new_jobs(session, previous_transaction):
+    session.info.pop('jobs_enqueued', None)
@@ -0,0 +1,217 @@
+"""
+Prepaid student accounts.
+
+Students pay deposits into an account and fly against them.  Every movement
+is a ``LedgerEntry`` row, and no row is ever changed.  Deposits are
+positive, while invoice charges and refunds are negative.  Each invoice
+is charged once when it is inserted, whether by check-out or by the
+billing run.
+
+Every ``LEDGER_SNAPSHOT_INTERVAL`` entries (50 by default) a student gets a
+``LedgerSnapshot`` of their balance through the newest entry.  The balance
+is the latest snapshot plus the entries after it.  It is read with one
+query on the (student_id, id) index and never sums more than one interval
+of history.  Snapshots are written in the same transaction as the entry
+that fills the interval, so they always agree with the ledger.
+
+The tail is "entries with a higher id than the snapshot", which only holds
+if no entry with a lower id commits after the snapshot is taken.  On
+databases with concurrent writers, ids are handed out before commit, so
+every write to a student's ledger first locks the student's ``users`` row
+(``SELECT ... FOR UPDATE``).  The writes of one student's ledger are then
+serialized from id allocation to commit.  SQLite already serializes all
+writers and ignores ``FOR UPDATE``.
+"""
+
+from datetime import datetime, timezone
+import math
+
+from flask import current_app, has_app_context
+from sqlalchemy import and_, event, exists, func, insert, literal, select
+from sqlalchemy.orm import Session
+
+from app import db
+from app.availability_service import ACTIVE_BOOKING_STATUSES
+from app.models import Aircraft, Booking, Invoice, LedgerEntry, LedgerSnapshot, User
+
+DEFAULT_SNAPSHOT_INTERVAL = 50
+
+# entry type -> sign of the amount; None keeps the sign it was given
+ENTRY_TYPES = {
+    'deposit': 1,
+    'charge': -1,
+    'refund': -1,
+    'adjustment': None,
+}
+
+
+class LedgerError(ValueError):
+    """Raised when a ledger entry is not valid."""
+
+
+def lock_accounts(connection, student_ids):
+    """Lock the students' rows until the transaction ends, in id order to avoid deadlocks."""
+    if student_ids:
+        connection.execute(
+            select(User.id).where(User.id.in_(sorted(student_ids))).order_by(User.id).with_for_update()
+        ).all()
+
+
+def _snapshot_interval():
+    if not has_app_context():
+        return DEFAULT_SNAPSHOT_INTERVAL
+    return current_app.config.get('LEDGER_SNAPSHOT_INTERVAL', DEFAULT_SNAPSHOT_INTERVAL)
+
+
+def _tail_query(student_id):
+    """Select (snapshot balance, tail sum, tail length, newest entry id) for a student."""
+    latest = select(func.max(LedgerSnapshot.through_entry_id)).where(
+        LedgerSnapshot.student_id == student_id
+    ).scalar_subquery()
+    snapshot_balance = select(LedgerSnapshot.balance).where(
+        LedgerSnapshot.student_id == student_id,
+        LedgerSnapshot.through_entry_id == latest
+    ).scalar_subquery()
+    return select(
+        func.coalesce(snapshot_balance, 0.0),
+        func.coalesce(func.sum(LedgerEntry.amount), 0.0),
+        func.count(LedgerEntry.id),
+        func.max(LedgerEntry.id)
+    ).where(
+        LedgerEntry.student_id == student_id,
+        LedgerEntry.id > func.coalesce(latest, 0)
+    )
+
+
+def account_balance(student_id):
+    """Return a student's current balance."""
+    snapshot_balance, tail, _, _ = db.session.execute(_tail_query(student_id)).one()
+    return round(snapshot_balance + tail, 2)
+
+
+def _snapshot_if_due(connection, student_id, interval=None):
+    """Snapshot a student's balance once the tail has reached the interval."""
+    snapshot_balance, tail, length, newest = connection.execute(_tail_query(student_id)).one()
+    if length and length >= (interval or _snapshot_interval()):
+        connection.execute(insert(LedgerSnapshot).values(
+            student_id=student_id, through_entry_id=newest,
+            balance=round(snapshot_balance + tail, 2)
+        ))
+        return True
+    return False
+
+
+def snapshot_accounts(connection, student_ids):
+    """Snapshot the accounts among ``student_ids`` whose tail is due."""
+    for student_id in student_ids:
+        _snapshot_if_due(connection, student_id)
+
+
+def post_entry(student_id, entry_type, amount, description=None, created_by_id=None,
+               invoice_id=None):
+    """
+    Append an entry to a student's ledger; the caller commits.
+
+    ``amount`` is given as a positive number for deposits, charges and
+    refunds and signed for adjustments.  Raises ``LedgerError`` for an
+    unknown type or a zero, infinite or NaN amount.
+    """
+    if entry_type not in ENTRY_TYPES:
+        raise LedgerError(f'Unknown ledger entry type: {entry_type}')
+    amount = float(amount)
+    if not math.isfinite(amount):
+        raise LedgerError('A ledger entry needs a finite amount.')
+    amount = round(amount, 2)
+    if not amount:
+        raise LedgerError('A ledger entry needs a non-zero amount.')
+    sign = ENTRY_TYPES[entry_type]
+    if sign is not None:
+        amount = sign * abs(amount)
+    lock_accounts(db.session.connection(), [student_id])
+    entry = LedgerEntry(student_id=student_id, entry_type=entry_type, amount=amount,
+                        description=description, created_by_id=created_by_id,
+                        invoice_id=invoice_id)
+    db.session.add(entry)
+    db.session.flush()
+    _snapshot_if_due(db.session.connection(), student_id)
+    return entry
+
+
+def charge_invoices(connection, *criteria):
+    """
+    Charge every invoice matching ``criteria`` that has not been charged yet.
+
+    One INSERT ... SELECT writes all the charges; returns the ids of the
+    students charged.
+    """
+    uncharged = and_(*criteria, ~exists().where(LedgerEntry.invoice_id == Invoice.id))
+    student_ids = {student_id for student_id, in connection.execute(
+        select(Invoice.student_id).where(uncharged).distinct()
+    )}
+    if student_ids:
+        lock_accounts(connection, student_ids)
+        connection.execute(insert(LedgerEntry).from_select(
+            ['student_id', 'entry_type', 'amount', 'invoice_id', 'description', 'created_at'],
+            select(
+                Invoice.student_id, literal('charge'), -Invoice.total_amount, Invoice.id,
+                literal('Invoice ') + Invoice.invoice_number, Invoice.invoice_date
+            ).where(uncharged).order_by(Invoice.id)
+        ))
+        snapshot_accounts(connection, student_ids)
+    return student_ids
+
+
+def estimated_cost(aircraft, instructor, hours):
+    """Return what a booking is expected to cost at current rates."""
+    cost = (aircraft.rate_per_hour or 0.0) * hours
+    if instructor is not None:
+        cost += (instructor.instructor_rate_per_hour or 0.0) * hours
+    return round(cost, 2)
+
+
+def booked_cost(student_id, now=None):
+    """Return the estimated cost of a student's active, uninvoiced bookings still to come."""
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    instructor = db.aliased(User)
+    rows = db.session.query(
+        Booking.start_time, Booking.end_time, Aircraft.rate_per_hour,
+        instructor.instructor_rate_per_hour
+    ).join(Aircraft, Aircraft.id == Booking.aircraft_id).outerjoin(
+        instructor, instructor.id == Booking.instructor_id
+    ).filter(
+        Booking.student_id == student_id,
+        Booking.status.in_(ACTIVE_BOOKING_STATUSES),
+        Booking.end_time > now,
+        ~exists().where(Invoice.booking_id == Booking.id)
+    )
+    cost = 0.0
+    for start_time, end_time, aircraft_rate, instructor_rate in rows:
+        hours = (end_time - start_time).total_seconds() / 3600
+        cost += ((aircraft_rate or 0.0) + (instructor_rate or 0.0)) * hours
+    return round(cost, 2)
+
+
+def has_sufficient_funds(student_id, amount):
+    """Return whether a student's balance covers ``amount`` on top of the flights already booked."""
+    return account_balance(student_id) - booked_cost(student_id) >= amount
+
+
+@event.listens_for(Session, 'after_flush')
+def _charge_new_invoices(session, flush_context):
+    """Charge invoices added through the session in the same transaction."""
+    invoice_ids = [obj.id for obj in session.new if isinstance(obj, Invoice)]
+    if invoice_ids:
+        charge_invoices(session.connection(), Invoice.id.in_(invoice_ids))
+
+
+def init_app(app):
+    """Register the ``flask snapshot-ledgers`` command."""
+    @app.cli.command('snapshot-ledgers')
+    def snapshot_ledgers_command():
+        """Snapshot every student balance that has entries since its last snapshot."""
+        connection = db.session.connection()
+        student_ids = [student_id for student_id, in db.session.query(LedgerEntry.student_id).distinct()]
+        lock_accounts(connection, student_ids)
+        count = sum(_snapshot_if_due(connection, student_id, interval=1) for student_id in student_ids)
+        db.session.commit()
+        print(f'Snapshot {count} accounts')
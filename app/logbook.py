@@ -0,0 +1,180 @@
+"""
+Pilot logbook totals.
+
+Each pilot has one ``LogbookRollup`` row per period: all time, and the
+trailing 30 days, 90 days and 12 months.  Each row sums the ``FlightLog``
+time, landing and approach columns over that period.  Every flush that
+inserts, updates or deletes a flight log adjusts the affected rows with
+``col = col + delta`` in the same transaction, like the dashboard
+counters, so a logbook page reads four rows instead of summing the log.
+
+The windowed rows also record ``stale_after``.  That is when the oldest
+flight they count slides out of the window.  Until then the row is exact.
+After it, the next read rebuilds the row from the (user_id, flight_date)
+index, and writes skip the stale row in the meantime.  A missing row is
+built the same way, so ``flask rebuild-logbook-rollups`` is only needed
+after bulk SQL edits to the log.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import case, event, func, inspect, or_
+from sqlalchemy.orm import Session
+
+from app import db
+from app.model_history import attribute_values, track_previous_values
+from app.models import FlightLog, LogbookRollup
+from app.upserts import upsert
+from app.availability_service import normalize_datetime
+
+# Period -> trailing window, or None for all time
+PERIODS = {
+    'all': None,
+    '30d': timedelta(days=30),
+    '90d': timedelta(days=90),
+    '12m': timedelta(days=365),
+}
+
+# FlightLog columns summed into every rollup
+SUMMED_COLUMNS = (
+    'pic_time', 'sic_time', 'dual_received', 'cross_country', 'night',
+    'actual_instrument', 'simulated_instrument', 'hood_time', 'ground_instruction',
+    'landings_day', 'landings_night', 'approaches', 'holds',
+)
+
+# Attributes whose change moves a flight's numbers between rollups
+TRACKED_ATTRIBUTES = ('user_id', 'flight_date') + SUMMED_COLUMNS
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def rebuild_rollup(user_id, period, now=None):
+    """
+    Recompute one pilot's rollup for one period from the log; the caller commits.
+
+    The row is written with an upsert, so concurrent first reads that both
+    find it missing do not collide on (user_id, period).
+    """
+    now = now or _utcnow()
+    window = PERIODS[period]
+    query = db.session.query(
+        func.count(FlightLog.id),
+        func.min(FlightLog.flight_date),
+        *(func.coalesce(func.sum(getattr(FlightLog, column)), 0) for column in SUMMED_COLUMNS)
+    ).filter(FlightLog.user_id == user_id)
+    if window is not None:
+        query = query.filter(FlightLog.flight_date > now - window)
+    flights, oldest, *sums = query.one()
+
+    row = dict(zip(SUMMED_COLUMNS, sums), user_id=user_id, period=period, flights=flights,
+               stale_after=None)
+    if window is not None and oldest is not None:
+        row['stale_after'] = normalize_datetime(oldest) + window
+    upsert(db.session.connection(), LogbookRollup.__table__, ('user_id', 'period'), [row])
+    return LogbookRollup.query.filter_by(user_id=user_id, period=period).populate_existing().one()
+
+
+def get_logbook_totals(user_id, now=None):
+    """
+    Return {period: LogbookRollup} for a pilot.
+
+    Rows that are missing or have gone stale are rebuilt and committed
+    first.
+    """
+    now = now or _utcnow()
+    rollups = {
+        rollup.period: rollup
+        for rollup in LogbookRollup.query.filter_by(user_id=user_id).populate_existing()
+    }
+    rebuilt = False
+    for period in PERIODS:
+        rollup = rollups.get(period)
+        if rollup is None or (rollup.stale_after is not None and rollup.stale_after <= now):
+            rollups[period] = rebuild_rollup(user_id, period, now)
+            rebuilt = True
+    if rebuilt:
+        db.session.commit()
+    return rollups
+
+
+def flight_changes(session, attributes=TRACKED_ATTRIBUTES):
+    """
+    Return (sign, {attribute: value}) for each flight a flush added or removed.
+
+    A flight whose ``attributes`` changed counts as removed with its old
+    values and added with its new ones.
+    """
+    changes = []
+    for obj in session.new:
+        if isinstance(obj, FlightLog):
+            changes.append((1, {name: getattr(obj, name) for name in attributes}))
+    for obj in session.dirty | session.deleted:
+        if not isinstance(obj, FlightLog):
+            continue
+        state = inspect(obj)
+        values = {name: attribute_values(state, name) for name in attributes}
+        if obj in session.deleted:
+            changes.append((-1, {name: before for name, (before, _) in values.items()}))
+        elif any(state.attrs[name].history.has_changes() for name in attributes):
+            changes.append((-1, {name: before for name, (before, _) in values.items()}))
+            changes.append((1, {name: after for name, (_, after) in values.items()}))
+    return changes
+
+
+def _apply_change(connection, sign, values, now):
+    table = LogbookRollup.__table__
+    flight_date = normalize_datetime(values['flight_date'])
+    if not values['user_id'] or flight_date is None:
+        return
+    increments = {column: table.c[column] + sign * (values[column] or 0) for column in SUMMED_COLUMNS}
+    increments['flights'] = table.c.flights + sign
+    for period, window in PERIODS.items():
+        conditions = [table.c.user_id == int(values['user_id']), table.c.period == period]
+        row_values = dict(increments)
+        if window is not None:
+            if flight_date <= now - window:
+                continue
+            # Stale rows are rebuilt on the next read instead
+            conditions.append(or_(table.c.stale_after.is_(None), table.c.stale_after > now))
+            if sign > 0:
+                leaves_window = flight_date + window
+                row_values['stale_after'] = case(
+                    (or_(table.c.stale_after.is_(None), table.c.stale_after > leaves_window),
+                     leaves_window),
+                    else_=table.c.stale_after
+                )
+        # A pilot without rows yet gets them built on first read
+        connection.execute(table.update().where(*conditions).values(row_values))
+
+
+@event.listens_for(Session, 'after_flush')
+def _apply_rollup_deltas(session, flush_context):
+    """Adjust the pilots' rollups inside the flush's own transaction."""
+    changes = flight_changes(session)
+    if changes:
+        now = _utcnow()
+        connection = session.connection()
+        for sign, values in changes:
+            _apply_change(connection, sign, values, now)
+
+
+# Load the old value before it is overwritten, even when the attribute was
+# expired by an earlier commit, so the old numbers can be taken back out
+track_previous_values(*(getattr(FlightLog, name) for name in TRACKED_ATTRIBUTES))
+
+
+def init_app(app):
+    """Register the ``flask rebuild-logbook-rollups`` command."""
+    @app.cli.command('rebuild-logbook-rollups')
+    def rebuild_logbook_rollups_command():
+        """Recompute every pilot's logbook rollups from the flight log."""
+        user_ids = {user_id for user_id, in db.session.query(FlightLog.user_id).distinct()}
+        user_ids.update(user_id for user_id, in db.session.query(LogbookRollup.user_id).distinct())
+        now = _utcnow()
+        for user_id in user_ids:
+            for period in PERIODS:
+                rebuild_rollup(user_id, period, now)
+        db.session.commit()
+        print(f'Rebuilt logbook rollups for {len(user_ids)} pilots')
@@ -0,0 +1,271 @@
+"""
+Maintenance due-date forecasting.
+
+Every maintenance item on every aircraft gets a row in
+``maintenance_forecast`` saying when it is projected to come due.  The
+items are each ``MaintenanceType`` with an interval that the aircraft
+has a completed record for, plus the aircraft's own oil-change and
+100-hour countdowns and its annual inspection date.  Hour-based items are
+projected from the hours remaining and the aircraft's trailing
+utilization.  That utilization is the Hobbs time of its check-outs over the
+last ``MAINTENANCE_UTILIZATION_DAYS`` days (90 by default), per day.
+Calendar items use their due date.  The forecast is the earlier of the two.
+
+The whole fleet is computed in one pass.  One grouped query fetches each
+aircraft's utilization and another fetches its latest record of each
+type; the projection is then plain arithmetic per row.  A flush that adds
+a check-out, changes a maintenance record or type, or changes an
+aircraft's meters or countdowns refreshes the rows of the aircraft it
+touched in the same transaction.  ``flask refresh-maintenance-forecast``
+rebuilds the whole table.
+
+A refresh also stores ``Aircraft.available_until``, the first projected
+100-hour or annual limit, so booking conflict checks read one column
+instead of re-projecting.  Planned maintenance, a pending or in-progress
+``MaintenanceRecord``, is not a limit: it blocks the aircraft from its
+``performed_at`` for its ``labor_hours`` (``PLANNED_MAINTENANCE_HOURS``,
+24 by default, when not estimated), and bookings after it are fine.
+"""
+
+from datetime import datetime, time, timedelta, timezone
+
+from flask import current_app, has_app_context
+from sqlalchemy import and_, event, func, inspect, or_
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import (
+    Aircraft, CheckIn, CheckOut, MaintenanceForecast, MaintenanceRecord, MaintenanceType
+)
+
+DEFAULT_UTILIZATION_DAYS = 90
+
+# Hours planned maintenance blocks the aircraft for when it has no estimate
+DEFAULT_PLANNED_MAINTENANCE_HOURS = 24
+
+# item -> (name, Aircraft column holding the hours remaining)
+AIRCRAFT_COUNTDOWNS = {
+    'oil_change': ('Oil change', 'time_to_next_oil_change'),
+    '100hr': ('100-hour inspection', 'time_to_next_100hr'),
+}
+ANNUAL_ITEM = 'annual'
+
+# Items that make the aircraft unavailable once due
+LIMIT_ITEMS = ('100hr', ANNUAL_ITEM)
+
+# MaintenanceRecord statuses of maintenance that is booked but not done
+PLANNED_MAINTENANCE_STATUSES = ('pending', 'in_progress')
+
+# Aircraft columns a forecast is computed from
+AIRCRAFT_INPUTS = ('hobbs_time', 'date_of_next_annual') + tuple(
+    column for _, column in AIRCRAFT_COUNTDOWNS.values()
+)
+
+ENTIRE_FLEET = 'all'
+
+
+def utilization(aircraft_ids, now):
+    """Return {aircraft_id: Hobbs hours flown per day} over the trailing window."""
+    days = current_app.config.get('MAINTENANCE_UTILIZATION_DAYS', DEFAULT_UTILIZATION_DAYS)
+    query = db.session.query(
+        CheckOut.aircraft_id, func.sum(CheckOut.hobbs_end - CheckIn.hobbs_start)
+    ).join(CheckIn, CheckIn.booking_id == CheckOut.booking_id).filter(
+        CheckOut.check_out_time >= now - timedelta(days=days)
+    )
+    if aircraft_ids is not None:
+        query = query.filter(CheckOut.aircraft_id.in_(aircraft_ids))
+    return {
+        aircraft_id: max(hours or 0.0, 0.0) / days
+        for aircraft_id, hours in query.group_by(CheckOut.aircraft_id)
+    }
+
+
+def latest_records(aircraft_ids):
+    """Return {(aircraft_id, maintenance_type_id): latest completed record}."""
+    completed = MaintenanceRecord.status == 'completed'
+    latest = db.session.query(
+        MaintenanceRecord.aircraft_id,
+        MaintenanceRecord.maintenance_type_id,
+        func.max(MaintenanceRecord.performed_at).label('performed_at')
+    ).filter(completed)
+    if aircraft_ids is not None:
+        latest = latest.filter(MaintenanceRecord.aircraft_id.in_(aircraft_ids))
+    latest = latest.group_by(
+        MaintenanceRecord.aircraft_id, MaintenanceRecord.maintenance_type_id
+    ).subquery()
+    records = MaintenanceRecord.query.join(latest, and_(
+        MaintenanceRecord.aircraft_id == latest.c.aircraft_id,
+        MaintenanceRecord.maintenance_type_id == latest.c.maintenance_type_id,
+        MaintenanceRecord.performed_at == latest.c.performed_at
+    )).filter(completed).order_by(MaintenanceRecord.id)
+    # Ties on performed_at go to the record entered last
+    return {(r.aircraft_id, r.maintenance_type_id): r for r in records}
+
+
+def planned_maintenance_end(performed_at, labor_hours):
+    """Return when planned maintenance starting at performed_at is expected to end."""
+    hours = labor_hours or current_app.config.get('PLANNED_MAINTENANCE_HOURS',
+                                                  DEFAULT_PLANNED_MAINTENANCE_HOURS)
+    return performed_at + timedelta(hours=hours)
+
+
+def project(hours_remaining, daily_hours, due_date, now):
+    """Return (due_by_hours_at, due_by_date_at, projected_due_at) for one item."""
+    due_by_hours = None
+    if hours_remaining is not None:
+        if hours_remaining <= 0:
+            due_by_hours = now
+        elif daily_hours:
+            due_by_hours = now + timedelta(days=hours_remaining / daily_hours)
+    due = [at for at in (due_by_hours, due_date) if at is not None]
+    return due_by_hours, due_date, min(due) if due else None
+
+
+def compute_forecasts(fleet, maintenance_types, records, rates, now):
+    """Return the forecast row values for every item on every aircraft."""
+    rows = []
+    for aircraft in fleet:
+        daily_hours = rates.get(aircraft.id, 0.0)
+
+        def add(item, name, hours_remaining=None, due_date=None, maintenance_type_id=None):
+            by_hours, by_date, projected = project(hours_remaining, daily_hours, due_date, now)
+            rows.append(dict(
+                aircraft_id=aircraft.id, maintenance_type_id=maintenance_type_id,
+                item=item, name=name, hours_remaining=hours_remaining,
+                daily_hours=daily_hours, due_by_hours_at=by_hours,
+                due_by_date_at=by_date, projected_due_at=projected, computed_at=now
+            ))
+
+        for item, (name, column) in AIRCRAFT_COUNTDOWNS.items():
+            if getattr(aircraft, column) is not None:
+                add(item, name, hours_remaining=getattr(aircraft, column))
+        if aircraft.date_of_next_annual is not None:
+            add(ANNUAL_ITEM, 'Annual inspection',
+                due_date=datetime.combine(aircraft.date_of_next_annual, time()))
+
+        for maintenance_type in maintenance_types:
+            record = records.get((aircraft.id, maintenance_type.id))
+            if record is None:
+                continue
+            hours_remaining = None
+            interval_hours = record.next_due_hours or maintenance_type.interval_hours
+            if interval_hours and record.hobbs_hours is not None and aircraft.hobbs_time is not None:
+                hours_remaining = record.hobbs_hours + interval_hours - aircraft.hobbs_time
+            due_date = record.next_due_date
+            if due_date is None and maintenance_type.interval_days:
+                due_date = record.performed_at + timedelta(days=maintenance_type.interval_days)
+            add(f'type-{maintenance_type.id}', maintenance_type.name,
+                hours_remaining=hours_remaining, due_date=due_date,
+                maintenance_type_id=maintenance_type.id)
+    return rows
+
+
+def availability_limits(fleet, rows):
+    """Return {aircraft_id: (available_until, reason)} for every aircraft."""
+    limits = {aircraft.id: (None, None) for aircraft in fleet}
+    candidates = [
+        (row['aircraft_id'], row['projected_due_at'], f"{row['name']} due")
+        for row in rows
+        if row['item'] in LIMIT_ITEMS and row['projected_due_at'] is not None
+    ]
+    for aircraft_id, at, reason in candidates:
+        current = limits.get(aircraft_id)
+        if current is not None and (current[0] is None or at < current[0]):
+            limits[aircraft_id] = (at, reason)
+    return limits
+
+
+def refresh_forecast(aircraft_ids=None, now=None):
+    """
+    Recompute the forecast rows of the given aircraft, or the whole fleet.
+
+    Adds, updates and deletes rows and sets each aircraft's
+    ``available_until`` in the current session; the caller commits.
+    Returns the number of forecast rows.
+    """
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    fleet = Aircraft.query
+    existing = MaintenanceForecast.query
+    if aircraft_ids is not None:
+        aircraft_ids = sorted(aircraft_ids)
+        fleet = fleet.filter(Aircraft.id.in_(aircraft_ids))
+        existing = existing.filter(MaintenanceForecast.aircraft_id.in_(aircraft_ids))
+    maintenance_types = MaintenanceType.query.filter(or_(
+        MaintenanceType.interval_hours.isnot(None), MaintenanceType.interval_days.isnot(None)
+    )).all()
+
+    fleet = fleet.all()
+    rows = compute_forecasts(fleet, maintenance_types, latest_records(aircraft_ids),
+                             utilization(aircraft_ids, now), now)
+    stored = {(forecast.aircraft_id, forecast.item): forecast for forecast in existing}
+    for values in rows:
+        forecast = stored.pop((values['aircraft_id'], values['item']), None)
+        if forecast is None:
+            forecast = MaintenanceForecast()
+            db.session.add(forecast)
+        for name, value in values.items():
+            setattr(forecast, name, value)
+    for stale in stored.values():
+        db.session.delete(stale)
+
+    limits = availability_limits(fleet, rows)
+    for aircraft in fleet:
+        until, reason = limits[aircraft.id]
+        if (aircraft.available_until, aircraft.available_until_reason) != (until, reason):
+            aircraft.available_until = until
+            aircraft.available_until_reason = reason
+    return len(rows)
+
+
+def _changed_aircraft(session):
+    changed = set()
+    for obj in session.new | session.dirty | session.deleted:
+        if isinstance(obj, MaintenanceType):
+            changed.add(ENTIRE_FLEET)
+        elif isinstance(obj, (CheckOut, MaintenanceRecord)):
+            changed.add(obj.aircraft_id)
+            # A record moved to another aircraft changes both
+            changed.update(inspect(obj).attrs.aircraft_id.history.deleted)
+        elif isinstance(obj, Aircraft):
+            state = inspect(obj)
+            if obj in session.new or any(
+                state.attrs[column].history.has_changes() for column in AIRCRAFT_INPUTS
+            ):
+                changed.add(obj)
+    return changed
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_changed_aircraft(session, flush_context, instances):
+    session.info.setdefault('maintenance_forecast_aircraft', set()).update(
+        _changed_aircraft(session)
+    )
+
+
+@event.listens_for(Session, 'after_flush_postexec')
+def _refresh_changed_aircraft(session, flush_context):
+    """Refresh the forecasts of aircraft the flush touched, in the same transaction."""
+    changed = session.info.pop('maintenance_forecast_aircraft', None)
+    if not changed or not has_app_context():
+        return
+    if ENTIRE_FLEET in changed:
+        refresh_forecast()
+        return
+    # New aircraft only have an id once flushed
+    ids = {inspect(obj).identity[0] if isinstance(obj, Aircraft) else obj for obj in changed}
+    refresh_forecast({int(id) for id in ids if id is not None})
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_changed_aircraft(session, previous_transaction):
+    session.info.pop('maintenance_forecast_aircraft', None)
+
+
+def init_app(app):
+    """Register the ``flask refresh-maintenance-forecast`` command."""
+    @app.cli.command('refresh-maintenance-forecast')
+    def refresh_maintenance_forecast_command():
+        """Recompute the maintenance forecast for the whole fleet."""
+        count = refresh_forecast()
+        db.session.commit()
+        print(f'Forecast {count} maintenance items')
@@ -0,0 +1,60 @@
+"""
+Before/after values of model attributes during a flush.
+
+The flush hooks that keep derived tables (dashboard counters, logbook
+rollups, payroll and report facts, the waitlist matcher) work out what a
+write changed by comparing an attribute's value before the flush with its
+value after.  Assigning to an attribute that an earlier commit expired
+normally records no previous value, so those attributes are registered
+with ``track_previous_values``, which makes the assignment load the old
+value first.  Each attribute gets a single listener however many modules
+track it, and the tracked attributes of a deleted object are loaded before
+the flush removes its row.
+"""
+
+from collections import defaultdict
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+_tracked = defaultdict(set)
+_lock = threading.Lock()
+
+
+def attribute_values(state, attribute):
+    """Return (value before this flush, value after it) for an attribute."""
+    history = state.attrs[attribute].history
+    if not (history.added or history.unchanged or history.deleted):
+        # Expired and untouched, so the stored value is both
+        value = getattr(state.obj(), attribute)
+        return value, value
+    unchanged = history.unchanged[0] if history.unchanged else None
+    before = history.deleted[0] if history.deleted else unchanged
+    after = history.added[0] if history.added else unchanged
+    return before, after
+
+
+def _load_previous_value(target, value, oldvalue, initiator):
+    pass
+
+
+def track_previous_values(*attributes):
+    """Make assignments to the given model attributes load the value they replace."""
+    with _lock:
+        for attribute in attributes:
+            keys = _tracked[attribute.class_]
+            if attribute.key in keys:
+                continue
+            event.listen(attribute, 'set', _load_previous_value, active_history=True)
+            keys.add(attribute.key)
+
+
+@event.listens_for(Session, 'before_flush')
+def _load_deleted_values(session, flush_context, instances):
+    # A deleted row's old values must be read before the row is gone
+    for obj in session.deleted:
+        for model, keys in list(_tracked.items()):
+            if isinstance(obj, model):
+                for key in keys:
+                    getattr(obj, key)
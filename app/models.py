@@ -1,8 +1,9 @@
 from flask_login import UserMixin, AnonymousUserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timezone
-from flask import url_for
+from flask import url_for, current_app, has_app_context, g
 from app import db, login_manager
+from app.aircraft_images import AircraftImageResolver
 import os
 import requests
 import logging
@@ -21,6 +22,21 @@ if not logger.handlers:
     logger.addHandler(handler)
 
 
+def grounding_memo():
+    """
+    Return the per-request map of aircraft id -> grounded-by-squawk flag.
+
+    Filled in bulk by ``compute_fleet_availability`` or one aircraft at a
+    time by ``Aircraft.has_grounding_squawk``; returns None outside an
+    application context.
+    """
+    if not has_app_context():
+        return None
+    if '_grounding_memo' not in g:
+        g._grounding_memo = {}
+    return g._grounding_memo
+
+
 class AnonymousUser(AnonymousUserMixin):
     """Anonymous user class for unauthenticated users."""
     def __init__(self):
@@ -78,6 +94,8 @@ class User(UserMixin, db.Model):
     status = db.Column(db.String(20), default='active')
     # Instructor rate per hour
     instructor_rate_per_hour = db.Column(db.Float)
+    # IANA timezone name for displaying times; falls back to SCHOOL_TIMEZONE
+    timezone = db.Column(db.String(64))
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
 
     # Google Calendar integration
@@ -88,6 +106,8 @@ class User(UserMixin, db.Model):
     google_calendar_refresh_token = db.Column(db.String(500))
     google_calendar_token_expiry = db.Column(db.DateTime)
     google_calendar_id = db.Column(db.String(100))
+    # High-water mark: newest Booking.updated_at already pushed to the calendar
+    google_calendar_synced_at = db.Column(db.DateTime)
 
     # Relationships
     bookings_as_student = db.relationship(
@@ -267,6 +287,11 @@ class EquipmentStatus(db.Model):
 
 
 class MaintenanceRecord(db.Model):
+    __table_args__ = (
+        # Sort key for keyset-paginated listings
+        db.Index('ix_maintenance_record_performed_id', 'performed_at', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     aircraft_id = db.Column(
         db.Integer,
@@ -348,6 +373,11 @@ class Squawk(db.Model):
 
 class Aircraft(db.Model):
     """Aircraft model."""
+    __table_args__ = (
+        # Fleet scans for aircraft still airworthy at the end of a window
+        db.Index('ix_aircraft_available_until', 'available_until'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     registration = db.Column(db.String(10), unique=True, nullable=False)
     make = db.Column(db.String(50), nullable=False)
@@ -374,6 +404,11 @@ class Aircraft(db.Model):
     time_to_next_100hr = db.Column(db.Float, nullable=True)
     # Date of next annual inspection (calendar date)
     date_of_next_annual = db.Column(db.Date, nullable=True)
+    # When the aircraft next reaches a maintenance limit or planned
+    # maintenance, kept up to date by app.maintenance_forecast; None means
+    # nothing is in sight
+    available_until = db.Column(db.DateTime, nullable=True)
+    available_until_reason = db.Column(db.String(100), nullable=True)
 
     # Relationships
     recurring_bookings = db.relationship(
@@ -401,33 +436,38 @@ class Aircraft(db.Model):
         backref='aircraft',
         lazy='dynamic'
     )
+    maintenance_forecasts = db.relationship(
+        'MaintenanceForecast',
+        backref='aircraft',
+        lazy='dynamic',
+        cascade='all, delete-orphan'
+    )
 
     @property
     def image_url(self):
-        """Get the URL for the aircraft's image, ensuring it exists and is non-empty."""
+        """Get the URL for the aircraft's image without blocking on disk or network I/O."""
         if self.image_filename:
-            img_path = ensure_aircraft_image(self.image_filename, self.make, self.model)
+            img_path = resolve_aircraft_image(self.image_filename, self.make, self.model)
             return url_for('static', filename=img_path)
         # Default images based on category and engine type
         if self.category == 'single_engine_land':
             if self.engine_type == 'piston':
-                img_path = ensure_aircraft_image('cessna172.jpg', 'Cessna', '172')
+                img_path = resolve_aircraft_image('cessna172.jpg', 'Cessna', '172')
                 return url_for('static', filename=img_path)
             elif self.engine_type == 'turboprop':
-                img_path = ensure_aircraft_image('tbm930.jpg', 'Daher', 'TBM 930')
+                img_path = resolve_aircraft_image('tbm930.jpg', 'Daher', 'TBM 930')
                 return url_for('static', filename=img_path)
         elif self.category == 'multi_engine_land':
             if self.engine_type == 'piston':
-                img_path = ensure_aircraft_image('baron58.jpg', 'Beechcraft', 'Baron 58')
+                img_path = resolve_aircraft_image('baron58.jpg', 'Beechcraft', 'Baron 58')
                 return url_for('static', filename=img_path)
             elif self.engine_type == 'turboprop':
-                img_path = ensure_aircraft_image('kingair350.jpg', 'Beechcraft', 'King Air 350')
+                img_path = resolve_aircraft_image('kingair350.jpg', 'Beechcraft', 'King Air 350')
                 return url_for('static', filename=img_path)
             elif self.engine_type == 'jet':
-                img_path = ensure_aircraft_image('citation.jpg', 'Cessna', 'Citation')
+                img_path = resolve_aircraft_image('citation.jpg', 'Cessna', 'Citation')
                 return url_for('static', filename=img_path)
-        img_path = ensure_aircraft_image('default.jpg')
-        return url_for('static', filename=img_path)
+        return url_for('static', filename='images/aircraft/default.jpg')
 
     @property
     def display_name(self):
@@ -448,83 +488,72 @@ class Aircraft(db.Model):
             return None
         return (datetime.now(timezone.utc) - self.last_maintenance).days
 
-    @property
-    def is_available(self):
-        """Check if aircraft is available for booking."""
-        # Check if aircraft status is explicitly set to available
-        if self.status != 'available':
-            return False
-            
-        # Check if time to next 100hr inspection is less than 1 hour
-        if self.time_to_next_100hr is not None and self.time_to_next_100hr < 1.0:
-            return False
-            
-        # Check if annual inspection is due or overdue
-        if self.date_of_next_annual is not None:
+    @staticmethod
+    def describe_availability(status, time_to_next_100hr, date_of_next_annual, grounded):
+        """Return the availability summary for a set of aircraft status flags."""
+        if status != 'available':
+            return f"Unavailable: {(status or 'unknown').replace('_', ' ').title()}"
+
+        if time_to_next_100hr is not None and time_to_next_100hr < 1.0:
+            return "Unavailable: 100hr inspection due"
+
+        if date_of_next_annual is not None:
             # Get current date in UTC to compare with annual inspection date
             current_date = datetime.now(timezone.utc).date()
-            if self.date_of_next_annual <= current_date:
-                return False
-            
-        # Check if there are any open squawks that ground the aircraft
+            if date_of_next_annual <= current_date:
+                return "Unavailable: Annual inspection overdue"
+
+        if grounded:
+            return "Grounded: Open squawk requires grounding"
+
+        return "Available"
+
+    @property
+    def has_grounding_squawk(self):
+        """Return True if an open squawk grounds this aircraft."""
         # Only check for grounding squawks if we're in an application context
-        from flask import current_app
-        if current_app:
-            try:
-                grounding_squawks = Squawk.query.filter_by(
-                    aircraft_id=self.id, 
-                    status='open',
-                    ground_airplane=True
-                ).first()
-                
-                if grounding_squawks:
-                    return False
-            except RuntimeError:
-                # If we're outside of application context (e.g., during tests),
-                # just check the other conditions
-                pass
-            
-        return True
-        
+        memo = grounding_memo()
+        if memo is None:
+            return False
+        if self.id not in memo:
+            memo[self.id] = db.session.query(Squawk.id).filter_by(
+                aircraft_id=self.id,
+                status='open',
+                ground_airplane=True
+            ).first() is not None
+        return memo[self.id]
+
+    @property
+    def is_available(self):
+        """Check if aircraft is available for booking."""
+        return self.availability_status == "Available"
+
     @property
     def availability_status(self):
         """Return a detailed availability status for the aircraft."""
-        if self.status != 'available':
-            return f"Unavailable: {self.status.replace('_', ' ').title()}"
-            
-        if self.time_to_next_100hr is not None and self.time_to_next_100hr < 1.0:
-            return "Unavailable: 100hr inspection due"
-            
-        if self.date_of_next_annual is not None:
-            # Get current date in UTC to compare with annual inspection date
-            current_date = datetime.now(timezone.utc).date()
-            if self.date_of_next_annual <= current_date:
-                return "Unavailable: Annual inspection overdue"
-            
-        # Only check for grounding squawks if we're in an application context
-        from flask import current_app
-        if current_app:
-            try:
-                grounding_squawks = Squawk.query.filter_by(
-                    aircraft_id=self.id, 
-                    status='open',
-                    ground_airplane=True
-                ).first()
-                
-                if grounding_squawks:
-                    return "Grounded: Open squawk requires grounding"
-            except RuntimeError:
-                # If we're outside of application context (e.g., during tests),
-                # just check the other conditions
-                pass
-            
-        return "Available"
+        summary = self.describe_availability(
+            self.status, self.time_to_next_100hr, self.date_of_next_annual, grounded=False
+        )
+        if summary == "Available" and self.has_grounding_squawk:
+            return self.describe_availability(
+                self.status, self.time_to_next_100hr, self.date_of_next_annual, grounded=True
+            )
+        return summary
 
     def __repr__(self):
         return f'<Aircraft {self.registration}>'
 
 
 class Booking(db.Model):
+    __table_args__ = (
+        # Composite indexes backing the per-resource conflict checks
+        db.Index('ix_booking_aircraft_window', 'aircraft_id', 'start_time', 'end_time'),
+        db.Index('ix_booking_instructor_window', 'instructor_id', 'start_time', 'end_time'),
+        db.Index('ix_booking_student_window', 'student_id', 'start_time', 'end_time'),
+        # Sort key for keyset-paginated listings
+        db.Index('ix_booking_start_id', 'start_time', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(
         db.Integer,
@@ -552,7 +581,6 @@ class Booking(db.Model):
         default=lambda: datetime.now(timezone.utc),
         onupdate=lambda: datetime.now(timezone.utc)
     )
-    google_calendar_event_id = db.Column(db.String(255), nullable=True)
     cancellation_reason = db.Column(db.String(50))
     cancellation_notes = db.Column(db.Text)
     weather_briefing = db.Column(db.JSON)
@@ -626,6 +654,11 @@ class CheckOut(db.Model):
 
 
 class FlightLog(db.Model):
+    __table_args__ = (
+        # A pilot's flights by date, for logbook rollups and recency checks
+        db.Index('ix_flight_log_user_date', 'user_id', 'flight_date'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     booking_id = db.Column(
         db.Integer,
@@ -677,10 +710,12 @@ class FlightLog(db.Model):
 
 class Invoice(db.Model):
     id = db.Column(db.Integer, primary_key=True)
+    # A flight is billed once
     booking_id = db.Column(
         db.Integer,
         db.ForeignKey('booking.id'),
-        nullable=False
+        nullable=False,
+        unique=True
     )
     aircraft_id = db.Column(
         db.Integer,
@@ -808,6 +843,11 @@ class AuditLog(db.Model):
 
 
 class WaitlistEntry(db.Model):
+    __table_args__ = (
+        # Candidate lookup when a booking frees time on an aircraft
+        db.Index('ix_waitlist_entry_aircraft_date_status', 'aircraft_id', 'requested_date', 'status'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(
         db.Integer,
@@ -828,9 +868,15 @@ class WaitlistEntry(db.Model):
     # morning, afternoon, evening
     time_preference = db.Column(db.String(20))
     duration_hours = db.Column(db.Float, nullable=False)
-    # active, fulfilled, expired
+    # active, offered, fulfilled, expired
     status = db.Column(db.String(20), default='active')
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    # Pending booking held for the student when a freed slot was offered
+    offered_booking_id = db.Column(db.Integer, db.ForeignKey('booking.id'), nullable=True)
+    offered_at = db.Column(db.DateTime, nullable=True)
+
+    instructor = db.relationship('User', foreign_keys=[instructor_id])
+    offered_booking = db.relationship('Booking', foreign_keys=[offered_booking_id])
 
     def __repr__(self):
         return f'<WaitlistEntry {self.id}>'
@@ -860,12 +906,258 @@ class RecurringBooking(db.Model):
     start_date = db.Column(db.DateTime, nullable=False)
     end_date = db.Column(db.DateTime, nullable=True)
     status = db.Column(db.String(20), default='active')
+    # Occurrences starting before this UTC time exist as Booking rows;
+    # later ones are expanded on read
+    materialized_until = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
 
+    # Relationships (student and aircraft are backrefs from User and Aircraft)
+    instructor = db.relationship('User', foreign_keys=[instructor_id])
+    occurrences = db.relationship('Booking', backref='recurring_booking', lazy='dynamic')
+
     def __repr__(self):
         return f'<RecurringBooking {self.id}>'
 
 
+class DashboardStats(db.Model):
+    """Single-row snapshot of the admin dashboard counters."""
+    __tablename__ = 'dashboard_stats'
+    id = db.Column(db.Integer, primary_key=True)
+    total_users = db.Column(db.Integer, nullable=False, default=0)
+    active_users = db.Column(db.Integer, nullable=False, default=0)
+    total_aircraft = db.Column(db.Integer, nullable=False, default=0)
+    available_aircraft = db.Column(db.Integer, nullable=False, default=0)
+    pending_bookings = db.Column(db.Integer, nullable=False, default=0)
+    maintenance_due = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(
+        db.DateTime,
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc)
+    )
+
+    def __repr__(self):
+        return f'<DashboardStats {self.id}>'
+
+
+class GoogleCalendarEvent(db.Model):
+    """The event a booking was copied to in one user's Google Calendar."""
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'booking_id', name='uq_google_calendar_event_user_booking'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    booking_id = db.Column(db.Integer, db.ForeignKey('booking.id'), nullable=False)
+    event_id = db.Column(db.String(255), nullable=False)
+    # Booking.updated_at as of the last push, so unchanged bookings are not resent
+    booking_updated_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f'<GoogleCalendarEvent {self.booking_id} -> {self.event_id}>'
+
+
+class Job(db.Model):
+    """A unit of background work run by ``app.jobs``."""
+    __table_args__ = (
+        # Queue scan: next runnable job
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.JSON)
+    # queued, running, done, dead
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    locked_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.name}>'
+
+
+class LogbookRollup(db.Model):
+    """One pilot's logbook totals over one period, kept by ``app.logbook``."""
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'period', name='uq_logbook_rollup_user_period'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    # all, 30d, 90d, 12m
+    period = db.Column(db.String(10), nullable=False)
+    flights = db.Column(db.Integer, nullable=False, default=0)
+    pic_time = db.Column(db.Float, nullable=False, default=0.0)
+    sic_time = db.Column(db.Float, nullable=False, default=0.0)
+    dual_received = db.Column(db.Float, nullable=False, default=0.0)
+    cross_country = db.Column(db.Float, nullable=False, default=0.0)
+    night = db.Column(db.Float, nullable=False, default=0.0)
+    actual_instrument = db.Column(db.Float, nullable=False, default=0.0)
+    simulated_instrument = db.Column(db.Float, nullable=False, default=0.0)
+    hood_time = db.Column(db.Float, nullable=False, default=0.0)
+    ground_instruction = db.Column(db.Float, nullable=False, default=0.0)
+    landings_day = db.Column(db.Integer, nullable=False, default=0)
+    landings_night = db.Column(db.Integer, nullable=False, default=0)
+    approaches = db.Column(db.Integer, nullable=False, default=0)
+    holds = db.Column(db.Integer, nullable=False, default=0)
+    # When the oldest flight counted leaves a windowed period; the row must
+    # be rebuilt from then on.  None if no flight is counted.
+    stale_after = db.Column(db.DateTime)
+    updated_at = db.Column(
+        db.DateTime,
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc)
+    )
+
+    @property
+    def total_time(self):
+        return self.pic_time + self.dual_received
+
+    @property
+    def instrument_time(self):
+        return self.actual_instrument + self.simulated_instrument
+
+    @property
+    def landings(self):
+        return self.landings_day + self.landings_night
+
+    def __repr__(self):
+        return f'<LogbookRollup {self.user_id} {self.period}>'
+
+
+class MaintenanceForecast(db.Model):
+    """When one maintenance item on one aircraft is projected to come due."""
+    __tablename__ = 'maintenance_forecast'
+    __table_args__ = (
+        db.UniqueConstraint('aircraft_id', 'item', name='uq_maintenance_forecast_aircraft_item'),
+        db.Index('ix_maintenance_forecast_due', 'projected_due_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    aircraft_id = db.Column(db.Integer, db.ForeignKey('aircraft.id'), nullable=False)
+    maintenance_type_id = db.Column(db.Integer, db.ForeignKey('maintenance_type.id'), nullable=True)
+    # 'type-<id>' for a MaintenanceType, or oil_change, 100hr, annual for
+    # the aircraft's own countdowns
+    item = db.Column(db.String(50), nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    hours_remaining = db.Column(db.Float)
+    # Trailing Hobbs hours flown per day
+    daily_hours = db.Column(db.Float)
+    due_by_hours_at = db.Column(db.DateTime)
+    due_by_date_at = db.Column(db.DateTime)
+    # The earlier of the two; None if neither can be projected
+    projected_due_at = db.Column(db.DateTime)
+    computed_at = db.Column(db.DateTime, nullable=False)
+
+    maintenance_type = db.relationship('MaintenanceType')
+
+    def __repr__(self):
+        return f'<MaintenanceForecast {self.aircraft_id} {self.item}>'
+
+
+class LedgerEntry(db.Model):
+    """One movement on a student's prepaid account; rows are never changed."""
+    __tablename__ = 'account_ledger'
+    __table_args__ = (
+        db.Index('ix_account_ledger_student_id', 'student_id', 'id'),
+        # An invoice is charged once
+        db.UniqueConstraint('invoice_id', name='uq_account_ledger_invoice'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    # deposit, charge, refund, adjustment
+    entry_type = db.Column(db.String(20), nullable=False)
+    # Signed: deposits add to the balance, charges and refunds take away
+    amount = db.Column(db.Float, nullable=False)
+    invoice_id = db.Column(db.Integer, db.ForeignKey('invoice.id'), nullable=True)
+    description = db.Column(db.String(200))
+    created_by_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    created_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=lambda: datetime.now(timezone.utc)
+    )
+
+    invoice = db.relationship('Invoice')
+
+    def __repr__(self):
+        return f'<LedgerEntry {self.student_id} {self.entry_type} {self.amount}>'
+
+
+class LedgerSnapshot(db.Model):
+    """A student's balance through one ledger entry, so balances need only the tail."""
+    __tablename__ = 'account_ledger_snapshot'
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'through_entry_id', name='uq_ledger_snapshot_student_entry'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    through_entry_id = db.Column(db.Integer, db.ForeignKey('account_ledger.id'), nullable=False)
+    balance = db.Column(db.Float, nullable=False)
+    created_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=lambda: datetime.now(timezone.utc)
+    )
+
+    def __repr__(self):
+        return f'<LedgerSnapshot {self.student_id} {self.through_entry_id}>'
+
+
+class InstructorDayFact(db.Model):
+    """One instructor's instruction on one day, kept by ``app.payroll``."""
+    __tablename__ = 'instructor_day_facts'
+    __table_args__ = (
+        db.UniqueConstraint('instructor_id', 'day', name='uq_instructor_day_facts_instructor_day'),
+        db.Index('ix_instructor_day_facts_day', 'day', 'instructor_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    instructor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    flights = db.Column(db.Integer, nullable=False, default=0)
+    flight_hours = db.Column(db.Float, nullable=False, default=0.0)
+    # Instruction billed on the day's invoices
+    flight_pay = db.Column(db.Float, nullable=False, default=0.0)
+    ground_hours = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f'<InstructorDayFact {self.instructor_id} {self.day}>'
+
+
+class DailyFact(db.Model):
+    """Bookings and flying for one aircraft and instructor on one day, kept by ``app.reports``."""
+    __tablename__ = 'daily_facts'
+    __table_args__ = (
+        # Solo flying is keyed as instructor 0 so its rows are unique too
+        db.Index('uq_daily_facts_day_aircraft_instructor', 'day', 'aircraft_id',
+                 db.func.coalesce(db.text('instructor_id'), db.literal_column('0')), unique=True),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    aircraft_id = db.Column(db.Integer, db.ForeignKey('aircraft.id'), nullable=False)
+    # None for solo flying
+    instructor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    # Bookings starting on the day, and how many of those were cancelled
+    bookings = db.Column(db.Integer, nullable=False, default=0)
+    cancellations = db.Column(db.Integer, nullable=False, default=0)
+    # Flights invoiced on the day, their Hobbs hours and invoice totals
+    flights = db.Column(db.Integer, nullable=False, default=0)
+    hours = db.Column(db.Float, nullable=False, default=0.0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f'<DailyFact {self.day} {self.aircraft_id} {self.instructor_id}>'
+
+
 def ensure_default_aircraft_image():
     """Ensure the fallback default aircraft image exists. Creates a 1x1 transparent PNG if missing."""
     import base64
@@ -945,3 +1237,23 @@ def ensure_aircraft_image(filename, make=None, model=None):
         logger.error(f"Error fetching image for {filename}: {e}")
     logger.info("Falling back to default image.")
     return 'images/aircraft/default.jpg'
+
+
+# Validated-image cache shared by every request; repairs run on a worker thread
+image_resolver = AircraftImageResolver(
+    STATIC_IMAGE_DIR,
+    fetch=lambda filename, make, model: ensure_aircraft_image(filename, make, model)
+)
+
+
+def resolve_aircraft_image(filename, make=None, model=None):
+    """
+    Return the static path for an aircraft image from the resolver cache.
+
+    Never touches the network: missing images render as the default and are
+    fetched in the background unless AIRCRAFT_IMAGE_FETCH_ENABLED is off.
+    """
+    fetch_missing = True
+    if has_app_context():
+        fetch_missing = current_app.config.get('AIRCRAFT_IMAGE_FETCH_ENABLED', True)
+    return image_resolver.resolve(filename, make, model, fetch_missing=fetch_missing)
@@ -0,0 +1,25 @@
+"""
+Outgoing email.
+
+Messages are queued as ``send_email`` jobs so SMTP round-trips never run
+inside a request, and a mail server outage turns into retries instead of
+errors.
+"""
+
+from flask import current_app
+from flask_mail import Message
+
+from app import mail
+from app.jobs import enqueue, task
+
+
+def send_email(subject, recipients, body):
+    """Queue a plain-text email; the caller commits."""
+    return enqueue('send_email', subject=subject, recipients=list(recipients), body=body)
+
+
+@task('send_email')
+def deliver_email(subject, recipients, body):
+    """Job handler: send the message through Flask-Mail."""
+    sender = current_app.config.get('MAIL_DEFAULT_SENDER') or current_app.config['CONTACT_EMAIL']
+    mail.send(Message(subject=subject, recipients=recipients, body=body, sender=sender))
@@ -0,0 +1,146 @@
+"""
+Keyset (seek) pagination for long listings.
+
+Offset pagination gets slower the deeper a user pages because the database
+still has to walk every skipped row.  Keyset pagination instead remembers
+the sort key of the last row shown and asks for rows strictly past it, so
+each page is a bounded index range scan no matter how much history exists.
+"""
+
+import base64
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_
+
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 200
+
+
+def encode_cursor(sort_value, row_id):
+    """Encode a (datetime, id) sort key as an opaque URL-safe token."""
+    raw = f'{sort_value.isoformat()}|{row_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Decode a cursor token, returning None if it is missing or malformed."""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        sort_value, row_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(sort_value), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+class KeysetPage:
+    """One page of a keyset-paginated listing, newest first."""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None, per_page=DEFAULT_PER_PAGE):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.per_page = per_page
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def keyset_paginate(query, sort_column, id_column, after=None, before=None,
+                    per_page=DEFAULT_PER_PAGE):
+    """
+    Return a KeysetPage of ``query`` ordered by (sort_column, id_column) descending.
+
+    ``after`` continues past the last row of the previous page; ``before``
+    walks back towards newer rows.  Both are tokens produced by
+    ``encode_cursor`` and exposed on the returned page.
+    """
+    per_page = max(1, min(int(per_page or DEFAULT_PER_PAGE), MAX_PER_PAGE))
+    sort_key = sort_column.key
+    id_key = id_column.key
+
+    after_key = decode_cursor(after)
+    before_key = None if after_key else decode_cursor(before)
+
+    if before_key:
+        sort_value, row_id = before_key
+        query = query.filter(or_(
+            sort_column > sort_value,
+            and_(sort_column == sort_value, id_column > row_id)
+        )).order_by(sort_column.asc(), id_column.asc())
+    else:
+        if after_key:
+            sort_value, row_id = after_key
+            query = query.filter(or_(
+                sort_column < sort_value,
+                and_(sort_column == sort_value, id_column < row_id)
+            ))
+        query = query.order_by(sort_column.desc(), id_column.desc())
+
+    # Fetch one extra row to learn whether another page exists
+    rows = query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if before_key:
+        rows.reverse()
+
+    def cursor_for(row):
+        return encode_cursor(getattr(row, sort_key), getattr(row, id_key))
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if has_more or before_key:
+            next_cursor = cursor_for(rows[-1])
+        if after_key or (before_key and has_more):
+            prev_cursor = cursor_for(rows[0])
+    return KeysetPage(rows, next_cursor=next_cursor, prev_cursor=prev_cursor, per_page=per_page)
+
+
+def parse_listing_filters(args):
+    """
+    Read the shared listing filters from request arguments.
+
+    Supports ``from``/``to`` (YYYY-MM-DD), ``aircraft_id``, ``instructor_id``
+    and ``status``; unparseable values are ignored.
+    """
+    filters = {}
+    for arg, key in (('from', 'start_date'), ('to', 'end_date')):
+        value = args.get(arg)
+        if value:
+            try:
+                filters[key] = datetime.strptime(value, '%Y-%m-%d')
+            except ValueError:
+                pass
+    for key in ('aircraft_id', 'instructor_id'):
+        value = args.get(key, type=int)
+        if value:
+            filters[key] = value
+    if args.get('status'):
+        filters['status'] = args.get('status')
+    return filters
+
+
+def apply_listing_filters(query, model, date_column, filters):
+    """Apply filters from ``parse_listing_filters`` to a query over ``model``."""
+    if 'start_date' in filters:
+        query = query.filter(date_column >= filters['start_date'])
+    if 'end_date' in filters:
+        # The end date is inclusive of the whole day
+        query = query.filter(date_column < filters['end_date'] + timedelta(days=1))
+    for key in ('aircraft_id', 'instructor_id', 'status'):
+        if key in filters and hasattr(model, key):
+            query = query.filter(getattr(model, key) == filters[key])
+    return query
@@ -0,0 +1,169 @@
+"""
+Instructor payroll.
+
+Instructors are paid for the instruction billed on their students'
+invoices and for the ground instruction logged on their flights.  Each
+instructor has one ``InstructorDayFact`` row per day holding the flights,
+flight hours and instruction billed on that day's invoices, and the ground
+hours logged on the day's flights.  An invoice with an instructor, from
+check-out or the billing run, adds to the day it is dated.  A flight log
+whose ground instruction, date or booking changes moves its hours from
+one day of the booking's instructor to another.
+
+A payroll period is then one grouped query over the (day, instructor_id)
+index.  Flight pay is what was billed; ground hours are paid at the
+instructor's current ``instructor_rate_per_hour``.  ``flask
+rebuild-instructor-facts`` recomputes the table from invoices and flight
+logs, and ``flask payroll START END`` prints a period as CSV.
+"""
+
+from collections import defaultdict, namedtuple
+import csv
+import io
+
+import click
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from app import db
+from app.availability_service import normalize_datetime
+from app.logbook import flight_changes
+from app.model_history import track_previous_values
+from app.models import Booking, FlightLog, InstructorDayFact, Invoice, User
+from app.upserts import add_to_rows
+
+PayrollLine = namedtuple(
+    'PayrollLine',
+    'instructor_id name rate flights flight_hours ground_hours flight_pay ground_pay total_pay'
+)
+
+CSV_HEADER = ('Instructor ID', 'Instructor', 'Hourly Rate', 'Flights', 'Flight Hours',
+              'Ground Hours', 'Flight Pay', 'Ground Pay', 'Total Pay')
+
+GROUND_ATTRIBUTES = ('booking_id', 'flight_date', 'ground_instruction')
+
+
+def _add_to_facts(connection, deltas):
+    """Add {(instructor_id, day): {column: delta}} to the fact rows, creating missing ones."""
+    rows = []
+    for (instructor_id, day), values in deltas.items():
+        row = dict(instructor_id=instructor_id, day=day, flights=0, flight_hours=0.0,
+                   flight_pay=0.0, ground_hours=0.0)
+        row.update(values)
+        rows.append(row)
+    add_to_rows(connection, InstructorDayFact.__table__, ('instructor_id', 'day'), rows)
+
+
+def record_invoices(connection, *criteria):
+    """Add the instruction on the invoices matching ``criteria`` to the facts."""
+    rows = connection.execute(select(
+        Invoice.instructor_id, Invoice.invoice_date, Invoice.instructor_time, Invoice.instructor_total
+    ).where(Invoice.instructor_id.isnot(None), *criteria))
+    deltas = defaultdict(lambda: defaultdict(float))
+    for instructor_id, invoice_date, hours, pay in rows:
+        values = deltas[(instructor_id, normalize_datetime(invoice_date).date())]
+        values['flights'] += 1
+        values['flight_hours'] += hours or 0.0
+        values['flight_pay'] += pay or 0.0
+    _add_to_facts(connection, deltas)
+
+
+def _record_ground_changes(connection, changes):
+    booking_ids = {values['booking_id'] for _, values in changes if values['booking_id']}
+    if not booking_ids:
+        return
+    instructors = dict(connection.execute(
+        select(Booking.id, Booking.instructor_id).where(Booking.id.in_(booking_ids))
+    ).all())
+    deltas = defaultdict(lambda: defaultdict(float))
+    for sign, values in changes:
+        instructor_id = instructors.get(values['booking_id'])
+        flight_date = normalize_datetime(values['flight_date'])
+        if instructor_id and flight_date is not None and values['ground_instruction']:
+            deltas[(instructor_id, flight_date.date())]['ground_hours'] += (
+                sign * values['ground_instruction']
+            )
+    _add_to_facts(connection, deltas)
+
+
+def payroll(start, end):
+    """
+    Return a ``PayrollLine`` per instructor for the days ``start`` to ``end``.
+
+    Both ends are dates and are included.
+    """
+    facts = InstructorDayFact
+    rate = func.coalesce(User.instructor_rate_per_hour, 0.0)
+    ground_hours = func.sum(facts.ground_hours)
+    flight_pay = func.sum(facts.flight_pay)
+    rows = db.session.query(
+        facts.instructor_id, User.first_name, User.last_name, rate,
+        func.sum(facts.flights), func.sum(facts.flight_hours), ground_hours,
+        flight_pay, ground_hours * rate, flight_pay + ground_hours * rate
+    ).join(User, User.id == facts.instructor_id).filter(
+        facts.day >= start, facts.day <= end
+    ).group_by(
+        facts.instructor_id, User.first_name, User.last_name, User.instructor_rate_per_hour
+    ).order_by(User.last_name, User.first_name)
+    return [
+        PayrollLine(instructor_id, f'{first_name} {last_name}', rate, flights,
+                    round(flight_hours, 2), round(ground_hours, 2), round(flight_pay, 2),
+                    round(ground_pay, 2), round(total_pay, 2))
+        for (instructor_id, first_name, last_name, rate, flights, flight_hours, ground_hours,
+             flight_pay, ground_pay, total_pay) in rows
+    ]
+
+
+def write_payroll_csv(lines, stream):
+    """Write payroll lines to a text stream as CSV."""
+    writer = csv.writer(stream)
+    writer.writerow(CSV_HEADER)
+    for line in lines:
+        writer.writerow(line)
+
+
+def rebuild_instructor_facts():
+    """Recompute every fact row from invoices and flight logs; the caller commits."""
+    connection = db.session.connection()
+    connection.execute(InstructorDayFact.__table__.delete())
+    record_invoices(connection)
+    logs = connection.execute(select(
+        FlightLog.booking_id, FlightLog.flight_date, FlightLog.ground_instruction
+    ).where(FlightLog.ground_instruction > 0))
+    _record_ground_changes(connection, [(1, dict(zip(GROUND_ATTRIBUTES, row))) for row in logs])
+
+
+@event.listens_for(Session, 'after_flush')
+def _update_facts(session, flush_context):
+    """Add the flush's invoices and ground instruction to the facts."""
+    invoice_ids = [obj.id for obj in session.new
+                   if isinstance(obj, Invoice) and obj.instructor_id is not None]
+    if invoice_ids:
+        record_invoices(session.connection(), Invoice.id.in_(invoice_ids))
+    changes = flight_changes(session, GROUND_ATTRIBUTES)
+    if changes:
+        _record_ground_changes(session.connection(), changes)
+
+
+# Load the old values before they are overwritten so the hours can be
+# taken off the day and instructor they were counted for
+track_previous_values(*(getattr(FlightLog, name) for name in GROUND_ATTRIBUTES))
+
+
+def init_app(app):
+    """Register the ``flask payroll`` and ``flask rebuild-instructor-facts`` commands."""
+    @app.cli.command('payroll')
+    @click.argument('start', type=click.DateTime(formats=['%Y-%m-%d']))
+    @click.argument('end', type=click.DateTime(formats=['%Y-%m-%d']))
+    def payroll_command(start, end):
+        """Print instructor pay for the days START to END as CSV."""
+        output = io.StringIO()
+        write_payroll_csv(payroll(start.date(), end.date()), output)
+        click.echo(output.getvalue(), nl=False)
+
+    @app.cli.command('rebuild-instructor-facts')
+    def rebuild_instructor_facts_command():
+        """Recompute the per-day instructor facts from invoices and flight logs."""
+        rebuild_instructor_facts()
+        db.session.commit()
+        print(f'Rebuilt {InstructorDayFact.query.count()} instructor days')
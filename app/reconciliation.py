@@ -0,0 +1,276 @@
+"""
+Payment reconciliation from bank and card processor CSV exports.
+
+``reconcile_payments`` reads an export one line at a time and matches each
+credit to an open (pending or overdue) invoice.  Open invoices are loaded
+once as plain tuples and indexed in dictionaries, without ORM objects.
+Lines are matched in this order:
+
+1. an invoice number in the reference text with the exact amount;
+2. the payer's name or email with the exact amount, when only one open
+   invoice of that student has that amount;
+3. an invoice number with a different amount.  This is reported as a
+   mismatch rather than paid.
+
+Each invoice is matched at most once.  Matches are written in batches.
+One UPDATE ... RETURNING marks the invoices paid, and one INSERT records
+the payments as deposits on the students' accounts, which balances their
+invoice charges.  Only the invoices the UPDATE actually changed get a
+deposit; one paid by someone else since the index was built is reported
+instead.  Lines that match nothing are returned with the reason, for a
+human to look at.
+"""
+
+from collections import defaultdict, namedtuple
+import csv
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
+import re
+
+import click
+from sqlalchemy import case, insert, update
+
+from app import db
+from app.ledger import lock_accounts, snapshot_accounts
+from app.models import Invoice, LedgerEntry, User
+
+DEFAULT_BATCH_SIZE = 500
+
+OPEN_INVOICE_STATUSES = ('pending', 'overdue')
+
+# Field -> header names it goes by in common exports, lower-cased
+COLUMN_ALIASES = {
+    'date': ('date', 'posted date', 'posting date', 'transaction date', 'created'),
+    'amount': ('amount', 'credit', 'deposit', 'net', 'gross'),
+    'reference': ('reference', 'description', 'memo', 'details', 'invoice', 'invoice number'),
+    'payer': ('payer', 'name', 'customer', 'customer name', 'email', 'customer email'),
+}
+
+DATE_FORMATS = ('%Y-%m-%d', '%Y-%m-%d %H:%M:%S', '%m/%d/%Y', '%m/%d/%y')
+
+INVOICE_NUMBER_PATTERN = re.compile(r'\bINV[-\s#]?(\d+)\b', re.IGNORECASE)
+
+UnmatchedLine = namedtuple('UnmatchedLine', 'line_number reason row')
+
+
+class ReconciliationError(ValueError):
+    """Raised when a file cannot be reconciled at all."""
+
+
+class ReconciliationResult:
+    """What one reconciliation run matched and what it left over."""
+
+    def __init__(self):
+        self.lines = 0
+        self.matched = 0
+        self.amount_matched = Decimal('0.00')
+        self.unmatched = []
+
+    def __repr__(self):
+        return f'<ReconciliationResult {self.matched}/{self.lines} matched>'
+
+
+def _invoice_key(number):
+    """Return the number an invoice is filed under: 42 for INV-000042."""
+    found = INVOICE_NUMBER_PATTERN.search(number)
+    return int(found.group(1)) if found else number
+
+
+def _cents(value):
+    return int((value * 100).to_integral_value())
+
+
+def parse_amount(text):
+    """Return a CSV amount as a Decimal, or None; (12.50) and -12.50 are negative."""
+    text = (text or '').strip().replace(',', '').replace('$', '')
+    negative = text.startswith('(') and text.endswith(')')
+    try:
+        amount = Decimal(text.strip('()'))
+    except InvalidOperation:
+        return None
+    if not amount.is_finite():
+        return None
+    return -amount if negative else amount
+
+
+def parse_date(text):
+    """Return a CSV date as a naive UTC datetime, or None if unreadable."""
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime((text or '').strip(), date_format)
+        except ValueError:
+            continue
+    return None
+
+
+def normalize_name(text):
+    """Return a name or email reduced to lower-case letters and digits."""
+    return re.sub(r'[^a-z0-9@.]+', ' ', (text or '').lower()).strip()
+
+
+def map_columns(fieldnames):
+    """Return {field: header} for the headers of an export."""
+    headers = {name.strip().lower(): name for name in fieldnames or () if name}
+    columns = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in headers:
+                columns[field] = headers[alias]
+                break
+    if 'amount' not in columns or not ({'reference', 'payer'} & columns.keys()):
+        raise ReconciliationError('The file needs an amount column and a reference or payer column.')
+    return columns
+
+
+def _field(row, columns, field):
+    header = columns.get(field)
+    return (row.get(header) or '') if header else ''
+
+
+class OpenInvoiceIndex:
+    """Hash indexes over the open invoices, built from one query."""
+
+    def __init__(self):
+        self.by_number = {}
+        self.by_payer = defaultdict(list)
+        rows = db.session.query(
+            Invoice.id, Invoice.invoice_number, Invoice.total_amount, Invoice.student_id,
+            User.first_name, User.last_name, User.email
+        ).join(User, User.id == Invoice.student_id).filter(
+            Invoice.status.in_(OPEN_INVOICE_STATUSES)
+        )
+        for invoice_id, number, total, student_id, first_name, last_name, email in rows:
+            cents = _cents(Decimal(str(total)))
+            invoice = (invoice_id, number, cents, student_id)
+            self.by_number[_invoice_key(number)] = invoice
+            for payer in (normalize_name(f'{first_name} {last_name}'), normalize_name(email)):
+                self.by_payer[(payer, cents)].append(invoice)
+        self.taken = set()
+
+    def match(self, reference, payer, cents):
+        """Return (invoice, None) for a match or (None, reason) for none."""
+        mismatch = None
+        for number in INVOICE_NUMBER_PATTERN.findall(reference or ''):
+            invoice = self.by_number.get(int(number))
+            if invoice is None or invoice[0] in self.taken:
+                continue
+            if invoice[2] == cents:
+                return self._take(invoice), None
+            mismatch = f'Amount differs from invoice {invoice[1]}'
+        if payer:
+            candidates = [
+                invoice for invoice in self.by_payer.get((normalize_name(payer), cents), ())
+                if invoice[0] not in self.taken
+            ]
+            if len(candidates) == 1:
+                return self._take(candidates[0]), None
+            if len(candidates) > 1:
+                return None, 'Several open invoices for this payer have this amount'
+        return None, mismatch or 'No open invoice matches'
+
+    def _take(self, invoice):
+        self.taken.add(invoice[0])
+        return invoice
+
+
+def _mark_paid(matches, payment_method):
+    """
+    Mark a batch of matched invoices paid and deposit the payments.
+
+    ``matches`` holds (invoice, paid_at) pairs.  Returns the ids of the
+    invoices that were still open and are now paid.
+    """
+    if not matches:
+        return set()
+    table = Invoice.__table__
+    paid_dates = {invoice[0]: paid_at for invoice, paid_at in matches}
+    paid = {invoice_id for invoice_id, in db.session.execute(
+        update(table).where(
+            table.c.id.in_(list(paid_dates)), table.c.status.in_(OPEN_INVOICE_STATUSES)
+        ).values(
+            status='paid', payment_method=payment_method,
+            payment_date=case(paid_dates, value=table.c.id)
+        ).returning(table.c.id)
+    )}
+    deposits = [(invoice, paid_at) for invoice, paid_at in matches if invoice[0] in paid]
+    if deposits:
+        lock_accounts(db.session.connection(), {invoice[3] for invoice, _ in deposits})
+        db.session.execute(insert(LedgerEntry), [
+            dict(student_id=invoice[3], entry_type='deposit', amount=invoice[2] / 100,
+                 description=f'Payment for {invoice[1]}', created_at=paid_at)
+            for invoice, paid_at in deposits
+        ])
+        snapshot_accounts(db.session.connection(), {invoice[3] for invoice, _ in deposits})
+    return paid
+
+
+def reconcile_payments(stream, payment_method='bank', batch_size=DEFAULT_BATCH_SIZE, now=None):
+    """
+    Reconcile a CSV export read from a text ``stream`` and commit.
+
+    Returns a ``ReconciliationResult``.  Debits, zero amounts and lines
+    with no amount, such as debits in an export with a separate credit
+    column, are skipped and not reported.
+    """
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    reader = csv.DictReader(stream)
+    columns = map_columns(reader.fieldnames)
+    index = OpenInvoiceIndex()
+    result = ReconciliationResult()
+    batch = []  # (invoice, paid_at, UnmatchedLine if it turns out paid already, amount)
+
+    def mark_paid():
+        paid = _mark_paid([(invoice, paid_at) for invoice, paid_at, _, _ in batch], payment_method)
+        for invoice, _, line, amount in batch:
+            if invoice[0] in paid:
+                result.matched += 1
+                result.amount_matched += amount
+            else:
+                result.unmatched.append(line)
+        batch.clear()
+
+    try:
+        for row in reader:
+            result.lines += 1
+            text = _field(row, columns, 'amount')
+            if not text.strip():
+                continue
+            amount = parse_amount(text)
+            if amount is None:
+                result.unmatched.append(UnmatchedLine(reader.line_num, 'Unreadable amount', row))
+                continue
+            if amount <= 0:
+                continue
+            invoice, reason = index.match(_field(row, columns, 'reference'),
+                                          _field(row, columns, 'payer'), _cents(amount))
+            if invoice is None:
+                result.unmatched.append(UnmatchedLine(reader.line_num, reason, row))
+                continue
+            paid_at = parse_date(_field(row, columns, 'date')) or now
+            already_paid = UnmatchedLine(reader.line_num, f'Invoice {invoice[1]} is no longer open', row)
+            batch.append((invoice, paid_at, already_paid, amount))
+            if len(batch) >= batch_size:
+                mark_paid()
+        mark_paid()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return result
+
+
+def init_app(app):
+    """Register the ``flask reconcile-payments`` command."""
+    @app.cli.command('reconcile-payments')
+    @click.argument('export', type=click.File('r', encoding='utf-8-sig'))
+    @click.option('--method', default='bank', show_default=True,
+                  help='Payment method recorded on the invoices paid.')
+    def reconcile_payments_command(export, method):
+        """Mark invoices paid from a bank or processor CSV export."""
+        try:
+            result = reconcile_payments(export, payment_method=method)
+        except ReconciliationError as e:
+            raise click.ClickException(str(e))
+        print(f'Matched {result.matched} of {result.lines} lines (${result.amount_matched:.2f})')
+        for line in result.unmatched:
+            print(f'Line {line.line_number}: {line.reason}')
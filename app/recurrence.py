@@ -0,0 +1,223 @@
+"""
+Recurring booking expansion.
+
+A ``RecurringBooking`` describes a weekly slot (weekday, wall-clock start
+time in the student's timezone, duration) over a date range.  Occurrences
+inside a rolling horizon are materialized as ``Booking`` rows with one bulk
+insert per series, after a single set-based query has found which of them
+clash with existing bookings.  Occurrences past a series'
+``materialized_until`` are not stored; ``virtual_occurrences`` expands them
+on read so availability and conflict checks still see them.
+"""
+
+from datetime import datetime, timedelta, timezone
+import logging
+
+from flask import current_app
+from sqlalchemy import DateTime, Integer, and_, column, or_, values
+from sqlalchemy.orm import joinedload
+
+from app import db
+from app.models import Booking, RecurringBooking
+from app.availability_service import ACTIVE_BOOKING_STATUSES, normalize_datetime
+from app.bulk_inserts import bulk_insert
+from app.utils.datetime_utils import get_local_timezone, to_utc
+
+logger = logging.getLogger("recurrence")
+
+DEFAULT_HORIZON_DAYS = 56
+
+# Status given to materialized occurrences; the series itself was accepted
+# when it was created
+OCCURRENCE_STATUS = 'confirmed'
+
+
+def get_horizon():
+    """Return how far ahead recurring bookings are stored as rows."""
+    return timedelta(days=current_app.config.get('RECURRING_BOOKING_HORIZON_DAYS',
+                                                 DEFAULT_HORIZON_DAYS))
+
+
+def _as_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+def iter_occurrences(series, after, before):
+    """
+    Yield (start, end) naive UTC pairs for occurrences starting in [after, before).
+
+    The series' start time is read as wall-clock time in the student's
+    timezone, so lessons stay at the same local time across DST changes.
+    """
+    after = normalize_datetime(after)
+    before = normalize_datetime(before)
+    tz = get_local_timezone(series.student)
+    duration = timedelta(hours=series.duration_hours)
+
+    # Widen the local date range by a day each way to absorb the UTC offset
+    first = max(after.date() - timedelta(days=1), _as_date(series.start_date))
+    last = before.date() + timedelta(days=1)
+    if series.end_date is not None:
+        last = min(last, _as_date(series.end_date))
+    day = first + timedelta(days=(series.day_of_week - first.weekday()) % 7)
+    while day <= last:
+        start = to_utc(datetime.combine(day, series.start_time), tz=tz).replace(tzinfo=None)
+        if after <= start < before:
+            yield start, start + duration
+        day += timedelta(weeks=1)
+
+
+def conflicting_slots(series, slots):
+    """
+    Return the indexes of ``slots`` that overlap an active booking.
+
+    All candidate slots are sent as one VALUES list and joined against the
+    booking windows of the series' aircraft, instructor and student, so the
+    check is a single query however many occurrences are tested.
+    """
+    if not slots:
+        return set()
+    candidates = values(
+        column('slot', Integer), column('slot_start', DateTime), column('slot_end', DateTime),
+        name='candidate_slots'
+    ).data([(index, start, end) for index, (start, end) in enumerate(slots)]).cte()
+
+    resources = [Booking.aircraft_id == series.aircraft_id,
+                 Booking.student_id == series.student_id]
+    if series.instructor_id:
+        resources.append(Booking.instructor_id == series.instructor_id)
+
+    rows = db.session.query(candidates.c.slot).join(Booking, and_(
+        Booking.start_time < candidates.c.slot_end,
+        Booking.end_time > candidates.c.slot_start
+    )).filter(
+        Booking.status.in_(ACTIVE_BOOKING_STATUSES),
+        or_(*resources)
+    ).distinct()
+    return {slot for slot, in rows}
+
+
+def materialize_series(series, until):
+    """
+    Store the series' occurrences up to ``until`` as Booking rows.
+
+    Occurrences that clash with existing bookings are skipped.  Returns
+    (number of bookings created, list of skipped (start, end) pairs).  The
+    caller commits.
+    """
+    until = normalize_datetime(until)
+    since = series.materialized_until
+    if since is None:
+        since = datetime.combine(_as_date(series.start_date), datetime.min.time())
+    if series.status != 'active' or until <= since:
+        return 0, []
+
+    slots = list(iter_occurrences(series, since, until))
+    blocked = conflicting_slots(series, slots)
+    rows = [
+        {
+            'student_id': series.student_id,
+            'instructor_id': series.instructor_id,
+            'aircraft_id': series.aircraft_id,
+            'start_time': start,
+            'end_time': end,
+            'status': OCCURRENCE_STATUS,
+            'recurring_booking_id': series.id,
+        }
+        for index, (start, end) in enumerate(slots) if index not in blocked
+    ]
+    bulk_insert(db.session, Booking, rows)
+    series.materialized_until = until
+    return len(rows), [slots[index] for index in sorted(blocked)]
+
+
+def extend_all_series(now=None):
+    """
+    Materialize every active series up to the rolling horizon and commit.
+
+    Returns (number of bookings created, {series id: skipped (start, end)
+    pairs}) for the occurrences that clashed with existing bookings; each
+    skipped occurrence is also logged, since nobody is waiting on the result.
+    """
+    now = normalize_datetime(now or datetime.now(timezone.utc))
+    until = now + get_horizon()
+    created = 0
+    skipped = {}
+    for series in RecurringBooking.query.options(joinedload(RecurringBooking.student)) \
+            .filter_by(status='active').all():
+        count, clashes = materialize_series(series, until)
+        created += count
+        if clashes:
+            skipped[series.id] = clashes
+            for start, end in clashes:
+                logger.warning(f"Recurring booking {series.id}: occurrence {start} - {end} "
+                               f"clashes with an existing booking and was not booked")
+    db.session.commit()
+    return created, skipped
+
+
+def virtual_occurrences(start_time, end_time, aircraft_ids=None, instructor_ids=None,
+                        student_ids=None):
+    """
+    Expand unmaterialized occurrences that overlap [start_time, end_time).
+
+    Returns (series, start, end) triples for active series touching any of
+    the given resources (None means any).  Only occurrences at or after each
+    series' ``materialized_until`` are returned, since earlier ones are rows.
+    """
+    start_time = normalize_datetime(start_time)
+    end_time = normalize_datetime(end_time)
+    id_lists = ((RecurringBooking.aircraft_id, aircraft_ids),
+                (RecurringBooking.instructor_id, instructor_ids),
+                (RecurringBooking.student_id, student_ids))
+    query = RecurringBooking.query.options(joinedload(RecurringBooking.student)).filter(
+        RecurringBooking.status == 'active',
+        RecurringBooking.start_date < end_time,
+        or_(RecurringBooking.end_date.is_(None),
+            RecurringBooking.end_date >= start_time - timedelta(days=1)),
+        or_(RecurringBooking.materialized_until.is_(None),
+            RecurringBooking.materialized_until < end_time)
+    )
+    # A None list matches every series, so only filter when all are given
+    if all(ids is not None for _, ids in id_lists):
+        resource_filters = [attribute.in_(ids) for attribute, ids in id_lists if ids]
+        if not resource_filters:
+            return []
+        query = query.filter(or_(*resource_filters))
+
+    occurrences = []
+    for series in query.all():
+        after = start_time - timedelta(hours=series.duration_hours)
+        if series.materialized_until is not None:
+            after = max(after, series.materialized_until)
+        for start, end in iter_occurrences(series, after, end_time):
+            if end > start_time:
+                occurrences.append((series, start, end))
+    return occurrences
+
+
+def cancel_series(series, now=None):
+    """End a series and cancel its future occurrences.  The caller commits."""
+    now = normalize_datetime(now or datetime.now(timezone.utc))
+    series.status = 'cancelled'
+    series.end_date = now
+    future = series.occurrences.filter(
+        Booking.start_time >= now,
+        Booking.status.in_(ACTIVE_BOOKING_STATUSES)
+    ).all()
+    for booking in future:
+        booking.status = 'cancelled'
+        booking.cancellation_reason = 'series_cancelled'
+    return len(future)
+
+
+def init_app(app):
+    """Register the ``flask extend-recurring-bookings`` command."""
+    @app.cli.command('extend-recurring-bookings')
+    def extend_recurring_bookings_command():
+        """Materialize recurring bookings up to the rolling horizon."""
+        created, skipped = extend_all_series()
+        print(f'Created {created} bookings')
+        for series_id, slots in skipped.items():
+            for start, end in slots:
+                print(f'Skipped series {series_id} at {start:%Y-%m-%d %H:%M}-{end:%H:%M} (conflict)')
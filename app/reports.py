@@ -0,0 +1,243 @@
+"""
+Admin reports.
+
+The reports read only the ``daily_facts`` table.  It has one row per day,
+aircraft and instructor (none for solo flying) with these counts:
+
+* bookings starting that day, and how many of them are cancelled;
+* flights invoiced that day, their Hobbs hours and the invoice totals.
+
+A booking that is added, cancelled, reinstated, moved or deleted takes
+itself out of the counts of the row it was in and adds itself to the row
+it is in now.  An invoice from check-out or the billing run adds its
+flight.  Any report over any range is therefore a grouped sum over a range
+of days, whatever the size of the booking history.
+
+Bulk inserts of bookings and invoices skip the flush hooks and reach the
+table through ``app.bulk_inserts`` instead.  ``flask rebuild-daily-facts``
+recomputes the table from bookings and invoices.
+"""
+
+from collections import defaultdict, namedtuple
+import csv
+
+from sqlalchemy import event, func, inspect, literal_column, select
+from sqlalchemy.orm import Session
+
+from app import db
+from app.availability_service import normalize_datetime
+from app.bulk_inserts import bulk_insert_listener
+from app.model_history import attribute_values, track_previous_values
+from app.models import Aircraft, Booking, DailyFact, Invoice, User
+from app.upserts import add_to_rows
+
+Report = namedtuple('Report', 'title columns rows')
+
+# Report name -> title, in the order the reports page lists them
+REPORTS = {
+    'revenue': 'Revenue',
+    'aircraft': 'Aircraft Utilization',
+    'instructors': 'Instructor Utilization',
+    'cancellations': 'Cancellations',
+}
+
+# Booking attributes that decide which row a booking counts in, and how
+BOOKING_ATTRIBUTES = ('start_time', 'aircraft_id', 'instructor_id', 'status')
+
+COLUMNS = ('bookings', 'cancellations', 'flights', 'hours', 'revenue')
+FLOAT_COLUMNS = ('hours', 'revenue')
+
+
+def _key(day, aircraft_id, instructor_id):
+    return (normalize_datetime(day).date(), int(aircraft_id),
+            int(instructor_id) if instructor_id else None)
+
+
+def _add_to_facts(connection, deltas):
+    """Add {(day, aircraft_id, instructor_id): {column: delta}} to the rows, creating missing ones."""
+    table = DailyFact.__table__
+    rows = []
+    for (day, aircraft_id, instructor_id), values in deltas.items():
+        values = {
+            column: round(values.get(column, 0), 4) if column in FLOAT_COLUMNS
+            else int(round(values.get(column, 0)))
+            for column in COLUMNS
+        }
+        if any(values.values()):
+            rows.append(dict(values, day=day, aircraft_id=aircraft_id, instructor_id=instructor_id))
+    # Solo rows have no instructor, and NULLs never clash in a unique index
+    add_to_rows(connection, table, ('day', 'aircraft_id', 'instructor_id'), rows, index_elements=[
+        table.c.day, table.c.aircraft_id, func.coalesce(table.c.instructor_id, literal_column('0'))
+    ])
+
+
+def _add_booking(deltas, sign, values):
+    if values['start_time'] is None or values['aircraft_id'] is None:
+        return
+    row = deltas[_key(values['start_time'], values['aircraft_id'], values['instructor_id'])]
+    row['bookings'] += sign
+    row['cancellations'] += sign * (values['status'] == 'cancelled')
+
+
+def _add_invoice(deltas, values):
+    row = deltas[_key(values['invoice_date'], values['aircraft_id'], values['instructor_id'])]
+    row['flights'] += 1
+    row['hours'] += values['aircraft_time'] or 0.0
+    row['revenue'] += values['total_amount'] or 0.0
+
+
+@bulk_insert_listener(Booking)
+def _record_bulk_bookings(session, rows):
+    """Count bookings added by a bulk ``insert(Booking)``."""
+    deltas = defaultdict(lambda: defaultdict(float))
+    for row in rows:
+        _add_booking(deltas, 1, {name: row.get(name) for name in BOOKING_ATTRIBUTES})
+    _add_to_facts(session.connection(), deltas)
+
+
+@bulk_insert_listener(Invoice)
+def _record_bulk_invoices(session, rows):
+    """Count invoices added by a bulk ``insert(Invoice)``."""
+    deltas = defaultdict(lambda: defaultdict(float))
+    for row in rows:
+        _add_invoice(deltas, row)
+    _add_to_facts(session.connection(), deltas)
+
+
+def _fact_deltas(session):
+    deltas = defaultdict(lambda: defaultdict(float))
+    for obj in session.new:
+        if isinstance(obj, Booking):
+            _add_booking(deltas, 1, {name: getattr(obj, name) for name in BOOKING_ATTRIBUTES})
+        elif isinstance(obj, Invoice):
+            _add_invoice(deltas, {name: getattr(obj, name) for name in (
+                'invoice_date', 'aircraft_id', 'instructor_id', 'aircraft_time', 'total_amount'
+            )})
+    for obj in session.dirty | session.deleted:
+        if not isinstance(obj, Booking):
+            continue
+        state = inspect(obj)
+        if obj not in session.deleted and not any(
+            state.attrs[name].history.has_changes() for name in BOOKING_ATTRIBUTES
+        ):
+            continue
+        values = {name: attribute_values(state, name) for name in BOOKING_ATTRIBUTES}
+        _add_booking(deltas, -1, {name: before for name, (before, _) in values.items()})
+        if obj not in session.deleted:
+            _add_booking(deltas, 1, {name: after for name, (_, after) in values.items()})
+    return deltas
+
+
+@event.listens_for(Session, 'after_flush')
+def _apply_fact_deltas(session, flush_context):
+    """Adjust the daily facts inside the flush's own transaction."""
+    deltas = _fact_deltas(session)
+    if deltas:
+        _add_to_facts(session.connection(), deltas)
+
+
+# Load the old value before it is overwritten so the booking can be taken
+# out of the row it was counted in
+track_previous_values(*(getattr(Booking, name) for name in BOOKING_ATTRIBUTES))
+
+
+def rebuild_daily_facts():
+    """Recompute the whole table from bookings and invoices; the caller commits."""
+    connection = db.session.connection()
+    connection.execute(DailyFact.__table__.delete())
+    deltas = defaultdict(lambda: defaultdict(float))
+    for row in connection.execute(select(*(getattr(Booking, name) for name in BOOKING_ATTRIBUTES))):
+        _add_booking(deltas, 1, dict(zip(BOOKING_ATTRIBUTES, row)))
+    for row in connection.execute(select(
+        Invoice.invoice_date, Invoice.aircraft_id, Invoice.instructor_id,
+        Invoice.aircraft_time, Invoice.total_amount
+    )):
+        _add_invoice(deltas, row._mapping)
+    _add_to_facts(connection, deltas)
+
+
+def _sums(*columns):
+    return [func.sum(getattr(DailyFact, column)) for column in columns]
+
+
+def _in_range(query, start, end):
+    return query.filter(DailyFact.day >= start, DailyFact.day <= end)
+
+
+def revenue_report(start, end):
+    """Flights, hours and revenue per day."""
+    rows = _in_range(db.session.query(DailyFact.day, *_sums('flights', 'hours', 'revenue')),
+                     start, end).group_by(DailyFact.day).order_by(DailyFact.day)
+    return Report(REPORTS['revenue'], ('Date', 'Flights', 'Hours', 'Revenue'), [
+        (day, flights, round(hours, 1), round(revenue, 2)) for day, flights, hours, revenue in rows
+    ])
+
+
+def aircraft_report(start, end):
+    """Flights, hours, hours per day and revenue per aircraft."""
+    days = (end - start).days + 1
+    rows = _in_range(db.session.query(
+        Aircraft.registration, *_sums('bookings', 'flights', 'hours', 'revenue')
+    ).join(Aircraft, Aircraft.id == DailyFact.aircraft_id), start, end).group_by(
+        Aircraft.id, Aircraft.registration
+    ).order_by(Aircraft.registration)
+    return Report(REPORTS['aircraft'],
+                  ('Aircraft', 'Bookings', 'Flights', 'Hours', 'Hours per Day', 'Revenue'), [
+        (registration, bookings, flights, round(hours, 1), round(hours / days, 2), round(revenue, 2))
+        for registration, bookings, flights, hours, revenue in rows
+    ])
+
+
+def instructor_report(start, end):
+    """Bookings, flights, hours and revenue per instructor."""
+    rows = _in_range(db.session.query(
+        User.first_name, User.last_name, *_sums('bookings', 'cancellations', 'flights', 'hours', 'revenue')
+    ).join(User, User.id == DailyFact.instructor_id), start, end).group_by(
+        User.id, User.first_name, User.last_name
+    ).order_by(User.last_name, User.first_name)
+    return Report(REPORTS['instructors'],
+                  ('Instructor', 'Bookings', 'Cancellations', 'Flights', 'Hours', 'Revenue'), [
+        (f'{first_name} {last_name}', bookings, cancellations, flights, round(hours, 1),
+         round(revenue, 2))
+        for first_name, last_name, bookings, cancellations, flights, hours, revenue in rows
+    ])
+
+
+def cancellation_report(start, end):
+    """Bookings, cancellations and the cancellation rate per day."""
+    rows = _in_range(db.session.query(DailyFact.day, *_sums('bookings', 'cancellations')),
+                     start, end).group_by(DailyFact.day).order_by(DailyFact.day)
+    return Report(REPORTS['cancellations'], ('Date', 'Bookings', 'Cancellations', 'Rate (%)'), [
+        (day, bookings, cancellations, round(100.0 * cancellations / bookings, 1) if bookings else 0.0)
+        for day, bookings, cancellations in rows
+    ])
+
+
+REPORT_BUILDERS = {
+    'revenue': revenue_report,
+    'aircraft': aircraft_report,
+    'instructors': instructor_report,
+    'cancellations': cancellation_report,
+}
+
+
+def build_report(name, start, end):
+    """Return the named ``Report`` for the days ``start`` to ``end``, both included."""
+    return REPORT_BUILDERS[name](start, end)
+
+
+def write_report_csv(report, stream):
+    """Write a report to a text stream as CSV."""
+    writer = csv.writer(stream)
+    writer.writerow(report.columns)
+    writer.writerows(report.rows)
+
+
+def init_app(app):
+    """Register the ``flask rebuild-daily-facts`` command."""
+    @app.cli.command('rebuild-daily-facts')
+    def rebuild_daily_facts_command():
+        """Recompute the daily report facts from bookings and invoices."""
+        rebuild_daily_facts()
+        db.session.commit()
+        print(f'Rebuilt {DailyFact.query.count()} daily facts')
@@ -1,9 +1,25 @@
-from flask import Blueprint, render_template, flash, redirect, url_for, request
+from flask import Blueprint, Response, render_template, flash, redirect, url_for, request, abort, jsonify
 from flask_login import login_required, current_user
-from app.models import User, Aircraft, Booking, MaintenanceRecord, MaintenanceType
+from app.models import (
+    User, Aircraft, Booking, LedgerEntry, MaintenanceRecord, MaintenanceType, RecurringBooking, WaitlistEntry
+)
 from datetime import datetime, timedelta
 from app import db
+from app.booking_queries import BookingQueries
+from app.pagination import keyset_paginate, parse_listing_filters, apply_listing_filters
+from app.dashboard_stats import get_dashboard_stats
+from app.availability_service import (
+    ACTIVE_BOOKING_STATUSES, find_conflicts, conflict_message, compute_fleet_availability
+)
+from app.recurrence import cancel_series
+from app.utils.datetime_utils import utcnow
+from app.billing import run_billing
+from app.ledger import ENTRY_TYPES, LedgerError, account_balance, post_entry
+from app.payroll import payroll as compute_payroll, write_payroll_csv
+from app.reports import REPORTS, build_report, write_report_csv
+from sqlalchemy.orm import joinedload
 from functools import wraps
+import io
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -24,26 +40,26 @@ def admin_required(f):
 @admin_required
 def dashboard():
     """Display admin dashboard."""
-    # Get statistics
-    stats = {
-        'total_users': User.query.count(),
-        'active_users': User.query.filter_by(status='active').count(),
-        'total_aircraft': Aircraft.query.count(),
-        'available_aircraft': Aircraft.query.filter_by(status='available').count(),
-        'pending_bookings': Booking.query.filter_by(status='pending').count(),
-        'maintenance_due': MaintenanceRecord.query.filter_by(status='due').count()
-    }
-    
-    # Get lists of instructors, students, and aircraft for the dashboard tabs
-    instructors = User.query.filter_by(is_instructor=True).all()
-    students = User.query.filter_by(is_instructor=False, is_admin=False).all()
-    aircraft_list = Aircraft.query.all()
-    
-    return render_template('admin/dashboard.html', 
-                          stats=stats, 
-                          instructors=instructors, 
-                          students=students, 
-                          aircraft_list=aircraft_list)
+    # Statistics come from the incrementally maintained snapshot row;
+    # the tab lists are fetched from dashboard_tab when a tab is opened
+    stats = get_dashboard_stats()
+    return render_template('admin/dashboard.html', stats=stats)
+
+
+@admin_bp.route('/dashboard/tab/<tab>')
+@login_required
+@admin_required
+def dashboard_tab(tab):
+    """Render the rows of one admin dashboard tab."""
+    if tab == 'instructors':
+        rows = User.query.filter_by(is_instructor=True).order_by(User.last_name).all()
+    elif tab == 'students':
+        rows = User.query.filter_by(is_instructor=False, is_admin=False).order_by(User.last_name).all()
+    elif tab == 'aircraft':
+        rows = Aircraft.query.order_by(Aircraft.registration).all()
+    else:
+        abort(404)
+    return render_template(f'admin/dashboard_tabs/{tab}.html', rows=rows)
 
 
 @admin_bp.route('/users')
@@ -68,8 +84,63 @@ def aircraft():
 @login_required
 @admin_required
 def reports():
-    """Display reports page."""
-    return render_template('admin/reports.html')
+    """Show a report over a date range, or download it as CSV."""
+    name = request.args.get('report', 'revenue')
+    if name not in REPORTS:
+        abort(404)
+    today = utcnow().date()
+    try:
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d').date()
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d').date()
+    except (KeyError, ValueError):
+        # Default to the last 30 days
+        start, end = today - timedelta(days=29), today
+    report = build_report(name, start, end)
+
+    if request.args.get('format') == 'csv':
+        output = io.StringIO()
+        write_report_csv(report, output)
+        return Response(output.getvalue(), mimetype='text/csv', headers={
+            'Content-Disposition': f'attachment; filename={name}-{start}-{end}.csv'
+        })
+    return render_template('admin/reports.html', report=report, report_name=name,
+                          reports=REPORTS, start=start, end=end)
+
+
+@admin_bp.route('/billing/run', methods=['POST'])
+@login_required
+@admin_required
+def billing_run():
+    """Invoice completed flights that have not been billed."""
+    try:
+        created = run_billing()
+        flash(f'Created {created} invoices.', 'success')
+    except Exception as e:
+        flash(f'Error running billing: {str(e)}', 'error')
+    return redirect(url_for('admin.dashboard'))
+
+
+@admin_bp.route('/payroll')
+@login_required
+@admin_required
+def payroll():
+    """Show instructor pay for a period, or download it as CSV."""
+    today = utcnow().date()
+    try:
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d').date()
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d').date()
+    except (KeyError, ValueError):
+        # Default to the current month so far
+        start, end = today.replace(day=1), today
+    lines = compute_payroll(start, end)
+
+    if request.args.get('format') == 'csv':
+        output = io.StringIO()
+        write_payroll_csv(lines, output)
+        return Response(output.getvalue(), mimetype='text/csv', headers={
+            'Content-Disposition': f'attachment; filename=payroll-{start}-{end}.csv'
+        })
+    return render_template('admin/payroll.html', lines=lines, start=start, end=end)
 
 
 @admin_bp.route('/settings')
@@ -87,10 +158,7 @@ def schedule():
     """Display master schedule."""
     start_date = datetime.now()
     end_date = start_date + timedelta(days=30)
-    bookings = Booking.query.filter(
-        Booking.start_time >= start_date,
-        Booking.start_time <= end_date
-    ).order_by(Booking.start_time).all()
+    bookings = BookingQueries.in_window(start_date, end_date).all()
     return render_template('admin/schedule.html', bookings=bookings)
 
 
@@ -99,8 +167,22 @@ def schedule():
 @admin_required
 def maintenance_records():
     """Display maintenance records."""
-    records = MaintenanceRecord.query.order_by(MaintenanceRecord.performed_at.desc()).all()
-    return render_template('admin/maintenance_list.html', maintenance_records=records)
+    filters = parse_listing_filters(request.args)
+    query = apply_listing_filters(
+        MaintenanceRecord.query, MaintenanceRecord, MaintenanceRecord.performed_at, filters
+    )
+    page = keyset_paginate(
+        query, MaintenanceRecord.performed_at, MaintenanceRecord.id,
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        per_page=request.args.get('per_page', type=int)
+    )
+    aircraft_list = Aircraft.query.order_by(Aircraft.registration).all()
+    return render_template('admin/maintenance_list.html',
+                          maintenance_records=page.items,
+                          page=page,
+                          filters=filters,
+                          aircraft_list=aircraft_list)
 
 
 @admin_bp.route('/squawks')
@@ -464,12 +546,51 @@ def delete_user(id):
         return jsonify({'error': str(e)}), 500
 
 
+@admin_bp.route('/user/<int:id>/account', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def student_account(id):
+    """Show a student's prepaid account and record deposits and refunds."""
+    student = User.query.get_or_404(id)
+
+    if request.method == 'POST':
+        try:
+            post_entry(student.id, request.form['entry_type'], float(request.form['amount']),
+                       description=request.form.get('description') or None,
+                       created_by_id=current_user.id)
+            db.session.commit()
+            flash('Account entry recorded.', 'success')
+            return redirect(url_for('admin.student_account', id=student.id))
+        except (KeyError, ValueError) as e:
+            db.session.rollback()
+            message = str(e) if isinstance(e, LedgerError) else 'Enter an entry type and amount.'
+            flash(message, 'error')
+
+    page = keyset_paginate(
+        LedgerEntry.query.filter_by(student_id=student.id),
+        LedgerEntry.created_at, LedgerEntry.id,
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        per_page=request.args.get('per_page', type=int)
+    )
+    return render_template('admin/student_account.html',
+                          student=student,
+                          balance=account_balance(student.id),
+                          entries=page.items,
+                          page=page,
+                          entry_types=ENTRY_TYPES)
+
+
 @admin_bp.route('/waitlist')
 @login_required
 @admin_required
 def waitlist():
     """Display waitlist management page."""
-    waitlist_entries = Booking.query.filter_by(status='waitlist').order_by(Booking.created_at).all()
+    waitlist_entries = WaitlistEntry.query.options(
+        joinedload(WaitlistEntry.student),
+        joinedload(WaitlistEntry.instructor),
+        joinedload(WaitlistEntry.aircraft)
+    ).order_by(WaitlistEntry.created_at, WaitlistEntry.id).all()
     return render_template('admin/waitlist.html', entries=waitlist_entries)
 
 
@@ -478,8 +599,28 @@ def waitlist():
 @admin_required
 def recurring_bookings():
     """Display recurring bookings management page."""
-    recurring = Booking.query.filter_by(is_recurring=True).order_by(Booking.start_time).all()
-    return render_template('admin/recurring_bookings.html', bookings=recurring)
+    recurring = RecurringBooking.query.options(
+        joinedload(RecurringBooking.student),
+        joinedload(RecurringBooking.instructor),
+        joinedload(RecurringBooking.aircraft)
+    ).order_by(RecurringBooking.day_of_week, RecurringBooking.start_time).all()
+    return render_template(
+        'admin/recurring_bookings.html',
+        bookings=recurring,
+        instructors=User.query.filter_by(is_instructor=True, status='active').all(),
+        aircraft_list=Aircraft.query.all()
+    )
+
+
+@admin_bp.route('/recurring-bookings/<int:id>', methods=['DELETE'])
+@login_required
+@admin_required
+def delete_recurring_booking(id):
+    """End a recurring booking and cancel its future lessons."""
+    series = RecurringBooking.query.get_or_404(id)
+    cancelled = cancel_series(series)
+    db.session.commit()
+    return jsonify({'message': f'Recurring booking ended; {cancelled} future lessons cancelled.'})
 
 
 @admin_bp.route('/flight-logs')
@@ -495,13 +636,24 @@ def flight_logs():
 @admin_required
 def bookings():
     """Display booking management page."""
-    bookings = Booking.query.order_by(Booking.start_time.desc()).all()
+    filters = parse_listing_filters(request.args)
+    query = apply_listing_filters(
+        BookingQueries.with_parties(), Booking, Booking.start_time, filters
+    )
+    page = keyset_paginate(
+        query, Booking.start_time, Booking.id,
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        per_page=request.args.get('per_page', type=int)
+    )
     students = User.query.filter_by(is_instructor=False, is_admin=False).all()
     instructors = User.query.filter_by(is_instructor=True).all()
     aircraft_list = Aircraft.query.all()
     
     return render_template('admin/bookings.html', 
-                          bookings=bookings,
+                          bookings=page.items,
+                          page=page,
+                          filters=filters,
                           students=students,
                           instructors=instructors,
                           aircraft_list=aircraft_list)
@@ -526,16 +678,16 @@ def create_booking():
             # Calculate end time
             end_time = start_time + timedelta(minutes=duration)
             
-            # Check if aircraft is available
-            conflicting_bookings = Booking.query.filter(
-                Booking.aircraft_id == aircraft_id,
-                Booking.status.in_(['confirmed', 'in_progress']),
-                Booking.start_time < end_time,
-                Booking.end_time > start_time
-            ).all()
+            # Check that the aircraft, instructor and student are available
+            conflicts = find_conflicts(
+                start_time, end_time,
+                aircraft_id=aircraft_id,
+                instructor_id=instructor_id,
+                student_id=student_id
+            )
             
-            if conflicting_bookings:
-                flash('This aircraft is already booked during the selected time.', 'error')
+            if conflicts:
+                flash(conflict_message(conflicts), 'error')
                 return redirect(url_for('admin.bookings'))
             
             # Create booking
@@ -564,11 +716,13 @@ def create_booking():
     students = User.query.filter_by(is_instructor=False, is_admin=False).all()
     instructors = User.query.filter_by(is_instructor=True).all()
     aircraft_list = Aircraft.query.all()  # Show all aircraft, including unavailable ones
+    fleet_availability = compute_fleet_availability([a.id for a in aircraft_list])
     
     return render_template('admin/booking_form.html',
                           students=students,
                           instructors=instructors,
                           aircraft_list=aircraft_list,
+                          fleet_availability=fleet_availability,
                           booking=None)
 
 
@@ -594,17 +748,19 @@ def edit_booking(id):
             # Calculate end time
             end_time = start_time + timedelta(minutes=duration)
             
-            # Check if aircraft is available (excluding this booking)
-            conflicting_bookings = Booking.query.filter(
-                Booking.id != id,
-                Booking.aircraft_id == aircraft_id,
-                Booking.status.in_(['confirmed', 'in_progress']),
-                Booking.start_time < end_time,
-                Booking.end_time > start_time
-            ).all()
-            
-            if conflicting_bookings:
-                flash('This aircraft is already booked during the selected time.', 'error')
+            # Check that the resources are available (excluding this booking)
+            conflicts = {}
+            if status in ACTIVE_BOOKING_STATUSES:
+                conflicts = find_conflicts(
+                    start_time, end_time,
+                    aircraft_id=aircraft_id,
+                    instructor_id=instructor_id,
+                    student_id=student_id,
+                    exclude_booking_id=id
+                )
+            
+            if conflicts:
+                flash(conflict_message(conflicts), 'error')
                 return redirect(url_for('admin.edit_booking', id=id, _fresh=True, t=datetime.now().timestamp()))
             
             # Update booking
@@ -630,6 +786,7 @@ def edit_booking(id):
     students = User.query.filter_by(is_instructor=False, is_admin=False).all()
     instructors = User.query.filter_by(is_instructor=True).all()
     aircraft_list = Aircraft.query.all()  # Show all aircraft, including unavailable ones
+    fleet_availability = compute_fleet_availability([a.id for a in aircraft_list])
     
     # Calculate duration in minutes
     duration = int((booking.end_time - booking.start_time).total_seconds() / 60)
@@ -638,6 +795,7 @@ def edit_booking(id):
                           students=students,
                           instructors=instructors,
                           aircraft_list=aircraft_list,
+                          fleet_availability=fleet_availability,
                           booking=booking,
                           duration=duration)
 
@@ -1,8 +1,11 @@
 from flask import Blueprint, render_template, flash, redirect, url_for, request
 from flask_login import login_required, login_user, logout_user, current_user
-from app.models import User
+from app.models import User, FlightLog
 from app.forms import LoginForm, RegistrationForm, AccountSettingsForm
 from app import db
+from app.logbook import get_logbook_totals
+from app.pagination import keyset_paginate
+from sqlalchemy.orm import joinedload
 import google_auth_oauthlib
 from flask import session
 
@@ -84,6 +87,7 @@ def account_settings():
         current_user.last_name = form.last_name.data
         current_user.phone = form.phone.data
         current_user.address = form.address.data
+        current_user.timezone = form.timezone.data or None
         if form.password.data:
             current_user.set_password(form.password.data)
         db.session.commit()
@@ -102,8 +106,16 @@ def documents():
 @auth_bp.route('/flight-logs')
 @login_required
 def flight_logs():
-    """Display user flight logs."""
-    return render_template('auth/flight_logs.html')
+    """Display user flight logs with their running totals."""
+    query = FlightLog.query.options(joinedload(FlightLog.aircraft)).filter_by(user_id=current_user.id)
+    page = keyset_paginate(
+        query, FlightLog.flight_date, FlightLog.id,
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        per_page=request.args.get('per_page', type=int)
+    )
+    totals = get_logbook_totals(current_user.id)
+    return render_template('auth/flight_logs.html', logs=page.items, page=page, totals=totals)
 
 
 @auth_bp.route('/google-auth')
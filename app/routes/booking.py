@@ -1,15 +1,28 @@
-from flask import Blueprint, render_template, flash, redirect, url_for
+from flask import Blueprint, render_template, flash, redirect, url_for, request, jsonify
 from flask_login import login_required, current_user
-from app.models import Booking, Aircraft, User
+from app.models import Booking, Aircraft, User, RecurringBooking, WaitlistEntry
 from datetime import datetime, timedelta
 from app import db
 from functools import wraps
 from flask import current_app
-from app.forms import BookingForm
+from app.forms import BookingForm, RecurringBookingForm, WaitlistForm
+from app.booking_queries import BookingQueries
+from app.pagination import keyset_paginate, parse_listing_filters, apply_listing_filters
+from app.availability_service import (
+    find_conflicts, conflict_message, busy_intervals, lock_booking_parties, normalize_datetime
+)
+from app.recurrence import materialize_series, cancel_series, get_horizon, iter_occurrences
+from app.calendar_service import schedule_calendar_sync
+from app.currency import evaluate_currency, lapsed_rules
+from app.ledger import estimated_cost, has_sufficient_funds
+from sqlalchemy.orm import joinedload
 from app.utils.datetime_utils import utcnow, to_utc, from_utc, format_datetime
 
 booking_bp = Blueprint('booking', __name__)
 
+# Longest window the availability API will answer in one request
+MAX_AVAILABILITY_WINDOW = timedelta(days=31)
+
 
 def instructor_or_admin_required(f):
     """Decorator to require instructor or admin access."""
@@ -22,6 +35,23 @@ def instructor_or_admin_required(f):
     return decorated_function
 
 
+def populate_party_choices(form):
+    """Fill a booking form's aircraft and instructor choices."""
+    # Populate aircraft choices
+    form.aircraft_id.choices = [
+        (a.id, f"{a.registration} - {a.make} {a.model}")
+        for a in Aircraft.query.filter_by(status='available').all()
+    ]
+    
+    # Populate instructor choices
+    form.instructor_id.choices = [
+        (0, 'No Instructor (Solo Flight)')
+    ] + [
+        (i.id, f"{i.first_name} {i.last_name}")
+        for i in User.query.filter_by(role='instructor', status='active').all()
+    ]
+
+
 def booking_access_required(f):
     """Decorator to check if user has access to the booking."""
     @wraps(f)
@@ -41,11 +71,20 @@ def booking_access_required(f):
 def list_bookings():
     """List all bookings."""
     if current_user.is_admin:
-        bookings = Booking.query.order_by(Booking.start_time.desc()).all()
+        query = BookingQueries.with_parties()
     else:
-        bookings = Booking.query.filter_by(student_id=current_user.id).order_by(Booking.start_time.desc()).all()
+        query = BookingQueries.for_student(current_user.id)
+    
+    filters = parse_listing_filters(request.args)
+    query = apply_listing_filters(query, Booking, Booking.start_time, filters)
+    page = keyset_paginate(
+        query, Booking.start_time, Booking.id,
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        per_page=request.args.get('per_page', type=int)
+    )
     
-    return render_template('booking/list.html', bookings=bookings)
+    return render_template('booking/list.html', bookings=page.items, page=page, filters=filters)
 
 
 @booking_bp.route('/dashboard')
@@ -59,8 +98,7 @@ def dashboard():
     end_date = now + timedelta(days=14)
     
     # Get upcoming bookings for the next 14 days only
-    upcoming_bookings = Booking.query.filter(
-        Booking.student_id == current_user.id,
+    upcoming_bookings = BookingQueries.for_student(current_user.id).filter(
         Booking.status.in_(['confirmed', 'pending']),  # Only show confirmed and pending bookings
     ).order_by(Booking.start_time).all()
     
@@ -87,22 +125,139 @@ def weather_minima():
 @login_required
 def recurring_bookings():
     """Display and manage recurring bookings."""
-    recurring = Booking.query.filter_by(
+    recurring = RecurringBooking.query.options(
+        joinedload(RecurringBooking.student),
+        joinedload(RecurringBooking.instructor),
+        joinedload(RecurringBooking.aircraft)
+    ).filter_by(
+        student_id=current_user.id
+    ).order_by(RecurringBooking.day_of_week, RecurringBooking.start_time).all()
+    form = RecurringBookingForm()
+    populate_party_choices(form)
+    return render_template('booking/recurring_bookings.html', bookings=recurring, form=form)
+
+
+@booking_bp.route('/recurring/create', methods=['POST'])
+@login_required
+def create_recurring_booking():
+    """Create a recurring booking and book its upcoming occurrences."""
+    form = RecurringBookingForm()
+    populate_party_choices(form)
+    if not form.validate_on_submit():
+        for errors in form.errors.values():
+            for error in errors:
+                flash(error, 'error')
+        return redirect(url_for('booking.recurring_bookings'))
+    if form.start_date.data < utcnow().date():
+        flash('Recurring bookings cannot start in the past.', 'error')
+        return redirect(url_for('booking.recurring_bookings'))
+
+    # Held until the commit, so a concurrent booking cannot pass the funds
+    # and conflict checks before these lessons are inserted
+    lock_booking_parties(form.aircraft_id.data, form.instructor_id.data, current_user.id)
+    series = RecurringBooking(
         student_id=current_user.id,
-        is_recurring=True
-    ).order_by(Booking.start_time).all()
-    return render_template('booking/recurring.html', bookings=recurring)
+        aircraft_id=form.aircraft_id.data,
+        instructor_id=form.instructor_id.data or None,
+        day_of_week=form.day_of_week.data,
+        start_time=form.start_time.data,
+        duration_hours=form.duration_hours.data,
+        start_date=datetime.combine(form.start_date.data, datetime.min.time()),
+        end_date=datetime.combine(form.end_date.data, datetime.min.time()) if form.end_date.data else None,
+        status='active'
+    )
+    db.session.add(series)
+    db.session.flush()
+    until = utcnow() + get_horizon()
+    if current_app.config.get('REQUIRE_PREPAID_BALANCE'):
+        lessons = len(list(iter_occurrences(series, series.start_date, until)))
+        cost = lessons * estimated_cost(
+            db.session.get(Aircraft, series.aircraft_id),
+            db.session.get(User, series.instructor_id) if series.instructor_id else None,
+            series.duration_hours
+        )
+        if not has_sufficient_funds(current_user.id, cost):
+            db.session.rollback()
+            flash(f'Your account balance does not cover the {lessons} upcoming lessons '
+                  f'(about ${cost:.2f}).', 'error')
+            return redirect(url_for('booking.recurring_bookings'))
+    created, skipped = materialize_series(series, until)
+    db.session.commit()
+
+    flash(f'Recurring booking created; {created} upcoming lessons booked.', 'success')
+    if skipped:
+        dates = ', '.join(format_datetime(start, '%b %d') for start, _ in skipped)
+        flash(f'These dates were already taken and were skipped: {dates}', 'warning')
+    return redirect(url_for('booking.recurring_bookings'))
+
+
+@booking_bp.route('/recurring/<int:series_id>', methods=['DELETE'])
+@login_required
+def cancel_recurring_booking(series_id):
+    """End a recurring booking and cancel its future lessons."""
+    series = RecurringBooking.query.get_or_404(series_id)
+    if series.student_id != current_user.id and not current_user.is_admin:
+        return jsonify({'status': 'error', 'message': 'Permission denied.'}), 403
+    cancelled = cancel_series(series)
+    db.session.commit()
+    return jsonify({'status': 'success', 'cancelled': cancelled})
 
 
 @booking_bp.route('/waitlist')
 @login_required
 def waitlist():
     """Display and manage waitlist entries."""
-    waitlist_entries = Booking.query.filter_by(
+    form = WaitlistForm()
+    populate_party_choices(form)
+    waitlist_entries = WaitlistEntry.query.options(
+        joinedload(WaitlistEntry.instructor),
+        joinedload(WaitlistEntry.aircraft)
+    ).filter_by(
+        student_id=current_user.id
+    ).order_by(WaitlistEntry.created_at, WaitlistEntry.id).all()
+    return render_template('booking/waitlist.html', entries=waitlist_entries, form=form)
+
+
+@booking_bp.route('/waitlist/join', methods=['POST'])
+@login_required
+def join_waitlist():
+    """Add the current user to the waitlist for an aircraft and day."""
+    form = WaitlistForm()
+    populate_party_choices(form)
+    if not form.validate_on_submit():
+        for errors in form.errors.values():
+            for error in errors:
+                flash(error, 'error')
+        return redirect(url_for('booking.waitlist'))
+    if form.requested_date.data < utcnow().date():
+        flash('The requested date is in the past.', 'error')
+        return redirect(url_for('booking.waitlist'))
+
+    entry = WaitlistEntry(
         student_id=current_user.id,
-        status='waitlist'
-    ).order_by(Booking.created_at).all()
-    return render_template('booking/waitlist.html', entries=waitlist_entries)
+        aircraft_id=form.aircraft_id.data,
+        instructor_id=form.instructor_id.data or None,
+        requested_date=datetime.combine(form.requested_date.data, datetime.min.time()),
+        time_preference=form.time_preference.data or None,
+        duration_hours=form.duration_hours.data,
+        status='active'
+    )
+    db.session.add(entry)
+    db.session.commit()
+    flash('You have been added to the waitlist.', 'success')
+    return redirect(url_for('booking.waitlist'))
+
+
+@booking_bp.route('/waitlist/<int:entry_id>', methods=['DELETE'])
+@login_required
+def delete_waitlist_entry(entry_id):
+    """Remove a waitlist entry."""
+    entry = WaitlistEntry.query.get_or_404(entry_id)
+    if entry.student_id != current_user.id and not current_user.is_admin:
+        return jsonify({'status': 'error', 'message': 'Permission denied.'}), 403
+    db.session.delete(entry)
+    db.session.commit()
+    return jsonify({'status': 'success'})
 
 
 @booking_bp.route('/create', methods=['GET', 'POST'])
@@ -110,95 +265,105 @@ def waitlist():
 def create_booking():
     """Create a new booking."""
     form = BookingForm()
-    
-    # Populate aircraft choices
-    form.aircraft_id.choices = [
-        (a.id, f"{a.registration} - {a.make} {a.model}")
-        for a in Aircraft.query.filter_by(status='available').all()
-    ]
-    
-    # Populate instructor choices
-    form.instructor_id.choices = [
-        (0, 'No Instructor (Solo Flight)')
-    ] + [
-        (i.id, f"{i.first_name} {i.last_name}")
-        for i in User.query.filter_by(role='instructor', status='active').all()
-    ]
+    populate_party_choices(form)
 
     if form.validate_on_submit():
         try:
-            end_time = to_utc(form.start_time.data) + timedelta(minutes=form.duration.data)
-            
-            booking = Booking(
-                student_id=current_user.id,
+            start_time = to_utc(form.start_time.data)
+            end_time = start_time + timedelta(minutes=form.duration.data)
+            instructor_id = form.instructor_id.data if form.instructor_id.data != 0 else None
+
+            # Held until the commit, so a concurrent booking cannot pass the
+            # same checks before this one is inserted
+            lock_booking_parties(form.aircraft_id.data, instructor_id, current_user.id)
+            conflicts = find_conflicts(
+                start_time, end_time,
                 aircraft_id=form.aircraft_id.data,
-                instructor_id=form.instructor_id.data if form.instructor_id.data != 0 else None,
-                start_time=to_utc(form.start_time.data),
-                end_time=end_time,
-                status='pending',
-                notes=form.notes.data
+                instructor_id=instructor_id,
+                student_id=current_user.id
             )
-            db.session.add(booking)
-            db.session.commit()
-            flash('Booking created successfully.', 'success')
-            return redirect(url_for('booking.dashboard'))
+            cost = None
+            if current_app.config.get('REQUIRE_PREPAID_BALANCE'):
+                cost = estimated_cost(
+                    db.session.get(Aircraft, form.aircraft_id.data),
+                    db.session.get(User, instructor_id) if instructor_id else None,
+                    form.duration.data / 60
+                )
+            if conflicts:
+                flash(conflict_message(conflicts), 'error')
+            elif cost is not None and not has_sufficient_funds(current_user.id, cost):
+                flash(f'Your account balance does not cover this flight (about ${cost:.2f}).', 'error')
+            else:
+                booking = Booking(
+                    student_id=current_user.id,
+                    aircraft_id=form.aircraft_id.data,
+                    instructor_id=instructor_id,
+                    start_time=start_time,
+                    end_time=end_time,
+                    status='pending',
+                    notes=form.notes.data
+                )
+                db.session.add(booking)
+                schedule_calendar_sync([booking.student_id, booking.instructor_id])
+                db.session.commit()
+                flash('Booking created successfully.', 'success')
+                return redirect(url_for('booking.dashboard'))
         except Exception as e:
             db.session.rollback()
             flash('Error creating booking.', 'error')
             current_app.logger.error(f'Booking creation error: {str(e)}')
     
-    # Get existing bookings for the calendar UI
-    now = utcnow()
-    start_of_week = now - timedelta(days=now.weekday())
-    end_of_week = start_of_week + timedelta(days=14)  # Show 2 weeks
-    
-    # Get aircraft bookings
-    aircraft_bookings = Booking.query.filter(
-        Booking.start_time >= start_of_week,
-        Booking.start_time <= end_of_week,
-        Booking.status != 'cancelled'
-    ).all()
-    
-    # Get instructor bookings
-    instructor_bookings = Booking.query.filter(
-        Booking.instructor_id.isnot(None),
-        Booking.start_time >= start_of_week,
-        Booking.start_time <= end_of_week,
-        Booking.status != 'cancelled'
-    ).all()
-    
-    # Format booking blocks for the calendar
-    booking_blocks = []
-    
-    # Add aircraft bookings
-    for booking in aircraft_bookings:
-        booking_blocks.append({
-            'type': 'aircraft',
-            'id': booking.aircraft_id,
-            'start': format_datetime(booking.start_time),
-            'end': format_datetime(booking.end_time),
-            'title': f"{booking.aircraft.registration} - Booked"
-        })
-    
-    # Add instructor bookings
-    for booking in instructor_bookings:
-        booking_blocks.append({
-            'type': 'instructor',
-            'id': booking.instructor_id,
-            'start': format_datetime(booking.start_time),
-            'end': format_datetime(booking.end_time),
-            'title': f"{booking.instructor.full_name} - Booked"
-        })
-    
-    import json
+    # The calendar fetches busy intervals from availability() per week
     return render_template(
         'booking/book.html', 
         form=form, 
-        current_time=format_datetime(now),
-        booking_blocks=json.dumps(booking_blocks)
+        current_time=format_datetime(utcnow()),
+        lapsed_currency=lapsed_rules(evaluate_currency([current_user.id])[current_user.id])
     )
 
 
+@booking_bp.route('/api/availability')
+@login_required
+def availability():
+    """
+    Return merged busy intervals per aircraft and instructor as JSON.
+
+    Query arguments: ``from`` and ``to`` (ISO 8601, UTC unless an offset is
+    given; default the next 7 days) and optional repeated ``aircraft`` and
+    ``instructor`` ids.  Responses carry an ETag so unchanged weeks are
+    revalidated with a 304.
+    """
+    try:
+        start = datetime.fromisoformat(request.args['from']) if request.args.get('from') else utcnow()
+        end = datetime.fromisoformat(request.args['to']) if request.args.get('to') else start + timedelta(days=7)
+    except ValueError:
+        return jsonify({'error': 'from and to must be ISO 8601 datetimes'}), 400
+    start, end = normalize_datetime(start), normalize_datetime(end)
+    if end <= start or end - start > MAX_AVAILABILITY_WINDOW:
+        return jsonify({'error': 'Window must be positive and at most 31 days'}), 400
+
+    busy = busy_intervals(
+        start, end,
+        aircraft_ids=request.args.getlist('aircraft', type=int) or None,
+        instructor_ids=request.args.getlist('instructor', type=int) or None
+    )
+
+    def iso(dt):
+        return dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    payload = {'from': iso(start), 'to': iso(end)}
+    for resource, by_resource in busy.items():
+        payload[resource] = {
+            str(resource_id): [[iso(s), iso(e)] for s, e in intervals]
+            for resource_id, intervals in by_resource.items()
+        }
+    response = jsonify(payload)
+    response.add_etag()
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
 @booking_bp.route('/<int:booking_id>/cancel', methods=['POST'])
 @login_required
 @booking_access_required
@@ -206,6 +371,7 @@ def cancel_booking(booking_id):
     """Cancel a booking."""
     booking = Booking.query.get_or_404(booking_id)
     booking.status = 'cancelled'
+    schedule_calendar_sync([booking.student_id, booking.instructor_id])
     db.session.commit()
     flash('Booking cancelled successfully.', 'success')
     return redirect(url_for('booking.dashboard'))
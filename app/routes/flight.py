@@ -1,7 +1,8 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_required, current_user
 from app import db
-from app.models import Booking, Aircraft, CheckIn, CheckOut, MaintenanceRecord, Squawk
+from app.models import Booking, Aircraft, CheckIn, MaintenanceRecord, Squawk
+from app.checkout_service import complete_check_out
 from app.utils.datetime_utils import utcnow, to_utc, from_utc, format_datetime
 from functools import wraps
 
@@ -97,42 +98,22 @@ def check_out(booking_id):
     
     if request.method == 'POST':
         try:
-            # Create check-out record
-            check_out = CheckOut(
-                booking_id=booking_id,
-                aircraft_id=booking.aircraft_id,
-                instructor_id=current_user.id if current_user.is_instructor else None,
-                check_out_time=utcnow(),
+            squawk_description = None
+            if request.form.get('has_squawk') == 'on':
+                squawk_description = request.form.get('squawk_description')
+            complete_check_out(
+                booking,
                 hobbs_end=float(request.form['hobbs_end']),
                 tach_end=float(request.form['tach_end']),
-                notes=request.form.get('notes', '')
+                instructor_id=current_user.id if current_user.is_instructor else None,
+                notes=request.form.get('notes', ''),
+                squawk_description=squawk_description,
+                reported_by_id=current_user.id
             )
             
-            # Update booking status
-            booking.status = 'completed'
-            
-            # Update aircraft hobbs and tach times
-            aircraft = booking.aircraft
-            aircraft.hobbs_time = check_out.hobbs_end
-            aircraft.tach_time = check_out.tach_end
-            
-            # Create squawk if reported
-            if request.form.get('has_squawk') == 'on' and request.form.get('squawk_description'):
-                squawk = Squawk(
-                    aircraft_id=booking.aircraft_id,
-                    description=request.form.get('squawk_description'),
-                    reported_by_id=current_user.id,
-                    status='open'
-                )
-                db.session.add(squawk)
-            
-            db.session.add(check_out)
-            db.session.commit()
-            
             flash('Flight check-out completed successfully.', 'success')
             return redirect(url_for('flight.flight_summary', booking_id=booking_id))
         except Exception as e:
-            db.session.rollback()
             flash(f'Error during check-out: {str(e)}', 'error')
     
     return render_template('flight/check_out.html', 
@@ -1,6 +1,9 @@
 from flask import Blueprint, render_template, flash, redirect, url_for
 from flask_login import login_required, current_user
+from app import db
+from app.currency import RULES as CURRENCY_RULES, evaluate_currency
 from app.models import Booking, User
+from app.booking_queries import BookingQueries
 from datetime import datetime, timedelta
 from functools import wraps
 
@@ -24,14 +27,12 @@ def instructor_required(f):
 def dashboard():
     """Display the instructor dashboard."""
     # Get upcoming lessons
-    upcoming_lessons = Booking.query.filter(
-        Booking.instructor_id == current_user.id,
+    upcoming_lessons = BookingQueries.for_instructor(current_user.id).filter(
         Booking.start_time > datetime.now()
     ).order_by(Booking.start_time).all()
 
     # Get pending student requests
-    pending_requests = Booking.query.filter(
-        Booking.instructor_id == current_user.id,
+    pending_requests = BookingQueries.for_instructor(current_user.id).filter(
         Booking.status == 'pending'
     ).order_by(Booking.created_at).all()
 
@@ -49,11 +50,10 @@ def schedule():
     start_date = datetime.now()
     end_date = start_date + timedelta(days=30)
     
-    schedule = Booking.query.filter(
-        Booking.instructor_id == current_user.id,
-        Booking.start_time >= start_date,
-        Booking.start_time <= end_date
-    ).order_by(Booking.start_time).all()
+    schedule = BookingQueries.in_window(
+        start_date, end_date,
+        query=Booking.query.filter(Booking.instructor_id == current_user.id)
+    ).all()
 
     return render_template('instructor/schedule.html', schedule=schedule)
 
@@ -62,11 +62,15 @@ def schedule():
 @login_required
 @instructor_required
 def students():
-    """Display instructor's students."""
-    # Get all students assigned to this instructor
-    students = User.query.filter_by(
-        instructor_id=current_user.id,
-        status='active'
-    ).order_by(User.last_name).all()
+    """Display instructor's students and their currency."""
+    # Students are the pilots this instructor has flown with or is booked to
+    students = User.query.filter(
+        User.id.in_(db.session.query(Booking.student_id).filter(
+            Booking.instructor_id == current_user.id
+        )),
+        User.status == 'active'
+    ).order_by(User.last_name, User.first_name).all()
+    currency = evaluate_currency([student.id for student in students])
 
-    return render_template('instructor/students.html', students=students) 
\ No newline at end of file
+    return render_template('instructor/students.html', students=students,
+                           currency=currency, rules=CURRENCY_RULES)
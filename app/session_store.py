@@ -0,0 +1,274 @@
+"""
+Optional server-side session storage.
+
+By default Flask keeps the whole session in a signed cookie, which is fine
+while sessions stay small.  Setting ``SESSION_STORE`` to ``'sqlite'`` or
+``'filesystem'`` keeps the session data on the server instead.  The cookie
+then carries only a signed random session id, so its size and signing cost
+no longer depend on what the session holds.  In both modes the session is
+written back (and the cookie re-emitted) only when it was modified, or when
+a permanent session is refreshed under ``SESSION_REFRESH_EACH_REQUEST``.
+
+The session id is replaced whenever a user logs in, so an id planted
+before login (session fixation) never becomes an authenticated session.
+Expired sessions are not removed on read; run ``flask purge-sessions``
+periodically (e.g. from cron) to delete them.
+
+Stores subclass ``SessionStore``; pass an instance as ``SESSION_STORE`` to
+plug in another backend.
+"""
+
+from abc import ABC, abstractmethod
+from contextlib import closing
+from datetime import datetime, timezone
+import json
+import os
+import secrets
+import sqlite3
+import tempfile
+import time
+
+from flask import session
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSession, SessionInterface
+from flask_login import user_logged_in
+from itsdangerous import BadSignature, Signer
+
+SESSION_ID_BYTES = 32
+SIGNER_SALT = 'server-side-session'
+
+
+class SessionStore(ABC):
+    """Interface for server-side session backends; data is a serialized string."""
+
+    @abstractmethod
+    def load(self, sid):
+        """Return the stored data for ``sid``, or None if missing or expired."""
+
+    @abstractmethod
+    def save(self, sid, data, expires_at):
+        """Store ``data`` for ``sid`` until the POSIX timestamp ``expires_at``."""
+
+    @abstractmethod
+    def delete(self, sid):
+        """Remove ``sid``; a missing id is not an error."""
+
+    @abstractmethod
+    def purge_expired(self):
+        """Delete every expired session and return how many were removed."""
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Sessions in a standalone SQLite file.
+
+    Deliberately separate from the application database so that saving a
+    session never touches ``db.session`` or the request's transaction.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS sessions ('
+                'sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def load(self, sid):
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                'SELECT data, expires_at FROM sessions WHERE sid = ?', (sid,)
+            ).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return row[0]
+
+    def save(self, sid, data, expires_at):
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)',
+                (sid, data, expires_at)
+            )
+
+    def delete(self, sid):
+        with closing(self._connect()) as conn, conn:
+            conn.execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+    def purge_expired(self):
+        """Delete every expired session and return how many were removed."""
+        with closing(self._connect()) as conn, conn:
+            return conn.execute(
+                'DELETE FROM sessions WHERE expires_at <= ?', (time.time(),)
+            ).rowcount
+
+
+class FilesystemSessionStore(SessionStore):
+    """Sessions as one JSON file per session id in a directory."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, sid):
+        return os.path.join(self.directory, sid)
+
+    def load(self, sid):
+        try:
+            with open(self._path(sid)) as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if record.get('expires_at', 0) <= time.time():
+            return None
+        return record.get('data')
+
+    def save(self, sid, data, expires_at):
+        # Write to a temporary file and rename so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'data': data, 'expires_at': expires_at}, f)
+        os.replace(tmp_path, self._path(sid))
+
+    def delete(self, sid):
+        try:
+            os.remove(self._path(sid))
+        except OSError:
+            pass
+
+    def purge_expired(self):
+        """Delete every expired session file and return how many were removed."""
+        removed = 0
+        for sid in os.listdir(self.directory):
+            if self.load(sid) is None:
+                self.delete(sid)
+                removed += 1
+        return removed
+
+
+def new_session_id():
+    return secrets.token_urlsafe(SESSION_ID_BYTES)
+
+
+class ServerSideSession(SecureCookieSession):
+    """Session dict that also remembers its server-side id."""
+
+    def __init__(self, initial=None, sid=None):
+        super().__init__(initial)
+        self.sid = sid
+        # Id the data was stored under before ``regenerate``, deleted on save
+        self.previous_sid = None
+
+    def regenerate(self):
+        """Move the session to a fresh id, keeping its data."""
+        if self.previous_sid is None:
+            self.previous_sid = self.sid
+        self.sid = new_session_id()
+        self.modified = True
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """Session interface keeping data in a SessionStore and only an id in the cookie."""
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store):
+        self.store = store
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt=SIGNER_SALT)
+
+    def open_session(self, app, request):
+        if not app.secret_key:
+            return None
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode()
+            except BadSignature:
+                sid = None
+            if sid:
+                data = self.store.load(sid)
+                if data is not None:
+                    return ServerSideSession(self.serializer.loads(data), sid=sid)
+        return ServerSideSession(sid=new_session_id())
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if session.previous_sid is not None:
+            self.store.delete(session.previous_sid)
+
+        if not session:
+            if session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=secure,
+                                       samesite=samesite, httponly=httponly)
+                response.vary.add('Cookie')
+            return
+
+        if not self.should_set_cookie(app, session):
+            return
+
+        expires = self.get_expiration_time(app, session)
+        # Browser-session cookies still need a server-side lifetime
+        expires_at = (expires or datetime.now(timezone.utc) + app.permanent_session_lifetime).timestamp()
+        self.store.save(session.sid, self.serializer.dumps(dict(session)), expires_at)
+        response.set_cookie(
+            name, self._signer(app).sign(session.sid).decode(), expires=expires,
+            httponly=httponly, domain=domain, path=path, secure=secure, samesite=samesite
+        )
+        response.vary.add('Cookie')
+
+
+def create_store(app, kind):
+    """Build the store named by ``SESSION_STORE``; objects are used as-is."""
+    if kind == 'sqlite':
+        path = app.config.get('SESSION_STORE_PATH') or os.path.join(app.instance_path, 'sessions.sqlite3')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return SQLiteSessionStore(path)
+    if kind == 'filesystem':
+        path = app.config.get('SESSION_STORE_PATH') or os.path.join(app.instance_path, 'sessions')
+        return FilesystemSessionStore(path)
+    if isinstance(kind, SessionStore):
+        return kind
+    raise ValueError(f'Unknown SESSION_STORE: {kind!r}')
+
+
+def _regenerate_on_login(sender, user, **extra):
+    # Every login path goes through login_user, which sends this signal
+    if isinstance(session, ServerSideSession):
+        session.regenerate()
+
+
+user_logged_in.connect(_regenerate_on_login)
+
+
+def init_app(app):
+    """
+    Switch to server-side sessions if ``SESSION_STORE`` is configured.
+
+    Also registers ``flask purge-sessions``.
+    """
+    kind = app.config.get('SESSION_STORE')
+    if kind:
+        app.session_interface = ServerSideSessionInterface(create_store(app, kind))
+
+    @app.cli.command('purge-sessions')
+    def purge_sessions_command():
+        """Delete expired server-side sessions."""
+        interface = app.session_interface
+        if not isinstance(interface, ServerSideSessionInterface):
+            print('Sessions are kept in cookies; nothing to purge')
+            return
+        print(f'Purged {interface.store.purge_expired()} expired sessions')
@@ -1,5 +1,7 @@
 // Simple 7-day calendar widget for booking UI
-// Renders a week view, allows navigation, and emits selected datetime
+// Renders a week view, allows navigation, and emits selected datetime.
+// Busy intervals are fetched from options.availabilityUrl one week at a
+// time, as the user navigates, and kept for the life of the page.
 
 class WeekCalendar {
     constructor(containerId, onSelect, options = {}) {
@@ -9,8 +11,9 @@ class WeekCalendar {
         this.selectedEnd = null;
         this.currentStart = this.getStartOfWeek(new Date());
         this.isDragging = false;
-        // Booking block rendering support
-        this.bookingBlocks = options.bookingBlocks || [];
+        // Busy interval rendering support
+        this.availabilityUrl = options.availabilityUrl || null;
+        this.weeks = new Map(); // week start ISO string -> busy intervals, or null while loading
         this.aircraftBlockColor = options.aircraftBlockColor || '#ffcccc';
         this.instructorBlockColor = options.instructorBlockColor || '#cce5ff';
         this.render();
@@ -41,6 +44,50 @@ class WeekCalendar {
         return (start1 < end2 && start2 < end1);
     }
 
+    // Return the busy intervals for the week starting at `start`, starting a
+    // fetch (and re-rendering when it arrives) if the week is not loaded yet
+    loadWeek(start) {
+        const key = start.toISOString();
+        if (!this.availabilityUrl || this.weeks.has(key)) {
+            return this.weeks.get(key) || null;
+        }
+        this.weeks.set(key, null);
+        const params = new URLSearchParams({
+            from: key,
+            to: this.addDays(start, 7).toISOString()
+        });
+        fetch(`${this.availabilityUrl}?${params}`, { credentials: 'same-origin' })
+            .then(response => response.ok ? response.json() : Promise.reject(response.status))
+            .then(data => {
+                const week = {};
+                ['aircraft', 'instructor'].forEach(resource => {
+                    week[resource] = {};
+                    Object.entries(data[resource] || {}).forEach(([id, intervals]) => {
+                        week[resource][id] = intervals.map(([s, e]) => [new Date(s), new Date(e)]);
+                    });
+                });
+                this.weeks.set(key, week);
+                if (this.currentStart.toISOString() === key) {
+                    this.render();
+                }
+            })
+            .catch(() => this.weeks.delete(key));
+        return null;
+    }
+
+    isBusy(week, resource, resourceId, slotStart, slotEnd) {
+        if (!week || !resourceId) {
+            return false;
+        }
+        const intervals = week[resource][resourceId] || [];
+        return intervals.some(([start, end]) => this.overlaps(slotStart, slotEnd, start, end));
+    }
+
+    selectedValue(elementId) {
+        const element = document.getElementById(elementId);
+        return element ? element.value : null;
+    }
+
     render() {
         this.container.innerHTML = '';
         const nav = document.createElement('div');
@@ -65,6 +112,9 @@ class WeekCalendar {
         thead.appendChild(tr);
         table.appendChild(thead);
 
+        const week = this.loadWeek(this.currentStart);
+        const aircraftId = this.selectedValue('aircraft_id');
+        const instructorId = this.selectedValue('instructor_id');
         const tbody = document.createElement('tbody');
         const slots = [];
         for (let slot = 8 * 2; slot <= 18 * 2; slot++) {
@@ -92,20 +142,13 @@ class WeekCalendar {
                 } else if (this.selectedStart && new Date(this.selectedStart).toISOString() === slotTime.toISOString()) {
                     td.classList.add('bg-primary', 'text-white');
                 }
-                // Highlight booking blocks
-                if (this.bookingBlocks && this.bookingBlocks.length > 0) {
-                    this.bookingBlocks.forEach(block => {
-                        const blockStart = new Date(block.start);
-                        const blockEnd = new Date(block.end);
-                        // Aircraft block
-                        if (block.aircraft_id && block.aircraft_id == document.getElementById('aircraft_id').value && this.overlaps(slotTime, new Date(slotTime.getTime()+30*60000), blockStart, blockEnd)) {
-                            td.style.backgroundColor = this.aircraftBlockColor;
-                        }
-                        // Instructor block
-                        if (block.instructor_id && block.instructor_id == document.getElementById('instructor_id').value && this.overlaps(slotTime, new Date(slotTime.getTime()+30*60000), blockStart, blockEnd)) {
-                            td.style.backgroundColor = this.instructorBlockColor;
-                        }
-                    });
+                // Highlight times when the selected aircraft or instructor is busy
+                const slotEnd = new Date(slotTime.getTime() + 30 * 60000);
+                if (this.isBusy(week, 'aircraft', aircraftId, slotTime, slotEnd)) {
+                    td.style.backgroundColor = this.aircraftBlockColor;
+                }
+                if (this.isBusy(week, 'instructor', instructorId, slotTime, slotEnd)) {
+                    td.style.backgroundColor = this.instructorBlockColor;
                 }
                 // Mouse events for drag selection
                 td.onmousedown = (ev) => {
@@ -0,0 +1,54 @@
+"""
+Single-statement upserts for the derived tables.
+
+The fact and rollup tables kept by ``app.payroll``, ``app.reports`` and
+``app.logbook`` have one row per key, created by whichever write or read
+reaches the key first.  Updating and then inserting when no row matched races: two
+transactions can both miss and both insert, and the second fails on the
+unique constraint.  These helpers send ``INSERT ... ON CONFLICT DO UPDATE``
+instead, so the database settles the race.  Only SQLite and PostgreSQL
+have the statement in SQLAlchemy's dialects.
+"""
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+_INSERTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+
+def dialect_insert(connection):
+    """Return the connection's dialect ``insert``, which has ``on_conflict_*``."""
+    try:
+        return _INSERTS[connection.dialect.name]
+    except KeyError:
+        raise NotImplementedError(f'No upsert for the {connection.dialect.name} dialect')
+
+
+def _upsert(connection, table, key, rows, index_elements, new_value):
+    if not rows:
+        return
+    statement = dialect_insert(connection)(table)
+    columns = [column for column in rows[0] if column not in key]
+    statement = statement.on_conflict_do_update(
+        index_elements=index_elements or [table.c[column] for column in key],
+        set_={column: new_value(table.c[column], statement.excluded[column]) for column in columns}
+    )
+    connection.execute(statement, rows)
+
+
+def add_to_rows(connection, table, key, rows, index_elements=None):
+    """
+    Add each row's values to the stored row with the same key, inserting it if missing.
+
+    ``key`` names the columns of the unique constraint; every row must have
+    the same columns.  ``index_elements`` replaces the key columns as the
+    conflict target, for unique indexes on expressions.
+    """
+    _upsert(connection, table, key, rows, index_elements, lambda stored, new: stored + new)
+
+
+def upsert(connection, table, key, rows, index_elements=None):
+    """Insert each row, or overwrite the stored row with the same key."""
+    _upsert(connection, table, key, rows, index_elements, lambda stored, new: new)
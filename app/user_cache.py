@@ -0,0 +1,149 @@
+"""
+Cache-aside identity cache for the Flask-Login user loader.
+
+Flask-Login reloads the logged-in user on every authenticated request, yet
+most requests only need the handful of fields that decide what the user may
+see (role, admin/instructor flags, status) plus the name shown in the
+navbar.  Those fields are kept in a small per-process TTL/LRU cache and
+``current_user`` is a ``User`` attached to the session from them without a
+query; any other attribute loads the rest of the row on first use.
+
+Commits in this process that change or delete a user (role, status or
+password changes from ``edit_user`` or ``account_settings``) drop the
+entry straight away.  Writes made by another worker process are only seen
+once the entry's TTL runs out, so the TTL bounds how long a demoted or
+deactivated user keeps their old access there.
+"""
+
+from collections import OrderedDict
+import threading
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app import db
+from app.models import User
+
+# Columns copied into the cache for each logged-in user
+PRINCIPAL_FIELDS = (
+    'id', 'email', 'first_name', 'last_name', 'role', 'is_admin',
+    'is_instructor', 'status', 'timezone',
+)
+
+DEFAULT_CACHE_TTL = 60
+DEFAULT_CACHE_SIZE = 1024
+
+EXTENSION_KEY = 'user_identity_cache'
+
+
+class UserIdentityCache:
+    """Thread-safe LRU map of user id -> principal fields with a TTL."""
+
+    def __init__(self, ttl=DEFAULT_CACHE_TTL, max_size=DEFAULT_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()  # user id -> (expires_at, fields)
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """Return the cached fields for ``user_id``, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def put(self, user_id, fields):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, fields)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_ids=None):
+        """Drop the given user ids, or every entry when ``user_ids`` is None."""
+        with self._lock:
+            if user_ids is None:
+                self._entries.clear()
+            else:
+                for user_id in user_ids:
+                    self._entries.pop(user_id, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def init_app(app):
+    """Attach a user identity cache to the application."""
+    app.extensions[EXTENSION_KEY] = UserIdentityCache(
+        ttl=app.config.get('USER_CACHE_TTL', DEFAULT_CACHE_TTL),
+        max_size=app.config.get('USER_CACHE_SIZE', DEFAULT_CACHE_SIZE),
+    )
+
+
+def get_user_cache():
+    """Return the current application's user identity cache."""
+    cache = current_app.extensions.get(EXTENSION_KEY)
+    if cache is None:
+        init_app(current_app)
+        cache = current_app.extensions[EXTENSION_KEY]
+    return cache
+
+
+def _attach(fields):
+    """Return the session's ``User`` for the cached fields, without a query."""
+    user = db.session.identity_map.get(db.session.identity_key(User, fields['id']))
+    if user is not None:
+        # Already in the session, maybe expired by a commit: fill the gaps
+        for name in inspect(user).unloaded & fields.keys():
+            set_committed_value(user, name, fields[name])
+        return user
+    user = User(**fields)
+    # Unset columns become expired and load together on first access
+    make_transient_to_detached(user)
+    db.session.add(user)
+    return user
+
+
+def load_principal(user_id):
+    """
+    Return the ``User`` for ``user_id``, from the cache when possible.
+
+    A hit runs no query; a miss reads the principal fields by primary key.
+    """
+    cache = get_user_cache()
+    fields = cache.get(user_id)
+    if fields is None:
+        row = db.session.query(*(getattr(User, name) for name in PRINCIPAL_FIELDS)) \
+            .filter(User.id == user_id).first()
+        if row is None:
+            return None
+        fields = dict(zip(PRINCIPAL_FIELDS, row))
+        cache.put(user_id, fields)
+    return _attach(fields)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_user_changes(session, flush_context):
+    """Remember which users were updated or deleted in this flush."""
+    touched = session.info.setdefault('user_cache_keys', set())
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User) and obj.id is not None:
+            touched.add(obj.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    touched = session.info.pop('user_cache_keys', None)
+    if touched and has_app_context():
+        cache = current_app.extensions.get(EXTENSION_KEY)
+        if cache is not None:
+            cache.invalidate(touched)
+
@@ -8,7 +8,9 @@ Rule:
 """
 
 from datetime import datetime, timezone
+from functools import lru_cache
 import pytz
+from flask import current_app, g, has_app_context, has_request_context
 
 # For testing purposes, use Auckland timezone (UTC+12)
 # In production, this would be determined from the user's browser or system
@@ -18,9 +20,20 @@ def utcnow():
     """Get current UTC datetime with timezone information."""
     return datetime.now(timezone.utc)
 
-def get_local_timezone():
+@lru_cache(maxsize=None)
+def get_timezone(name):
+    """Return the pytz zone for an IANA name, or None if the name is unknown."""
+    if not name:
+        return None
+    try:
+        return pytz.timezone(name)
+    except pytz.exceptions.UnknownTimeZoneError:
+        return None
+
+@lru_cache(maxsize=1)
+def get_system_timezone():
     """
-    Get the local timezone.
+    Get the system timezone, discovered once per process.
     First tries to use tzlocal to get the system timezone,
     falls back to DEFAULT_LOCAL_TIMEZONE if that fails.
     """
@@ -30,10 +43,38 @@ def get_local_timezone():
     except (ImportError, pytz.exceptions.UnknownTimeZoneError):
         return pytz.timezone(DEFAULT_LOCAL_TIMEZONE)
 
-def to_utc(dt):
+def _current_user_timezone_name():
+    from flask_login import current_user
+    if current_user and current_user.is_authenticated:
+        return current_user.timezone
+    return None
+
+def get_local_timezone(user=None):
+    """
+    Get the timezone to display times in.
+
+    Uses the user's own timezone if set (the logged-in user when ``user`` is
+    not given), then the school's SCHOOL_TIMEZONE setting, then the system
+    timezone.  The result for the logged-in user is remembered for the rest
+    of the request.
+    """
+    if user is None and has_request_context():
+        if '_local_timezone' not in g:
+            g._local_timezone = _resolve_timezone(_current_user_timezone_name())
+        return g._local_timezone
+    return _resolve_timezone(user.timezone if user is not None else None)
+
+def _resolve_timezone(user_timezone):
+    school_timezone = current_app.config.get('SCHOOL_TIMEZONE') if has_app_context() else None
+    return (get_timezone(user_timezone)
+            or get_timezone(school_timezone)
+            or get_system_timezone())
+
+def to_utc(dt, tz=None):
     """
     Convert a datetime to UTC.
-    If the datetime is naive (no timezone), assume it's in local time and convert to UTC.
+    If the datetime is naive (no timezone), assume it's in local time (or
+    ``tz``) and convert to UTC.
     If the datetime already has timezone info, convert to UTC.
     """
     if dt is None:
@@ -41,15 +82,15 @@ def to_utc(dt):
         
     # If datetime is naive (no timezone), assume it's local time
     if dt.tzinfo is None:
-        local_tz = get_local_timezone()
+        local_tz = tz or get_local_timezone()
         dt = local_tz.localize(dt)
     
     # Convert to UTC
     return dt.astimezone(timezone.utc)
 
-def from_utc(dt, as_naive=False):
+def from_utc(dt, as_naive=False, tz=None):
     """
-    Convert a UTC datetime to local time.
+    Convert a UTC datetime to local time (or to ``tz``).
     If as_naive is True, return a naive datetime (no timezone info).
     """
     if dt is None:
@@ -60,7 +101,7 @@ def from_utc(dt, as_naive=False):
         dt = dt.replace(tzinfo=timezone.utc)
     
     # Convert to local timezone
-    local_tz = get_local_timezone()
+    local_tz = tz or get_local_timezone()
     local_dt = dt.astimezone(local_tz)
     
     # Strip timezone info if requested
@@ -69,8 +110,8 @@ def from_utc(dt, as_naive=False):
     
     return local_dt
 
-def format_datetime(dt, format_str='%Y-%m-%d %H:%M:%S'):
-    """Format a datetime object as a string in local time."""
+def format_datetime(dt, format_str='%Y-%m-%d %H:%M:%S', tz=None):
+    """Format a datetime object as a string in local time (or in ``tz``)."""
     if dt is None:
         return ''
     
@@ -78,5 +119,15 @@ def format_datetime(dt, format_str='%Y-%m-%d %H:%M:%S'):
     if dt.tzinfo is None:
         dt = dt.replace(tzinfo=timezone.utc)
         
-    local_dt = from_utc(dt)
+    local_dt = from_utc(dt, tz=tz)
     return local_dt.strftime(format_str)
+
+def from_utc_many(dts, as_naive=False, tz=None):
+    """Convert a sequence of UTC datetimes to local time, resolving the zone once."""
+    local_tz = tz or get_local_timezone()
+    return [from_utc(dt, as_naive=as_naive, tz=local_tz) for dt in dts]
+
+def format_datetimes(dts, format_str='%Y-%m-%d %H:%M:%S', tz=None):
+    """Format a sequence of datetimes in local time, resolving the zone once."""
+    local_tz = tz or get_local_timezone()
+    return [format_datetime(dt, format_str, tz=local_tz) for dt in dts]
@@ -0,0 +1,197 @@
+"""
+Waitlist matching on freed booking time.
+
+When a commit cancels or deletes an active booking, or moves it to another
+aircraft or time, the time it held becomes free.  Those freed windows are
+collected during the flush and queued as ``match_waitlist`` jobs in the
+same transaction, so they only run if the commit succeeds and cancelling
+stays as fast as before.  The job looks up active ``WaitlistEntry`` rows
+for the aircraft and day through the (aircraft_id, requested_date, status)
+index and offers the window to them in the order they joined: the first
+entry whose time preference and duration fit, and whose student and
+instructor are free, gets a pending booking held for it, is marked
+``offered`` and is emailed about it.
+"""
+
+from datetime import datetime, time, timedelta, timezone
+import logging
+
+from flask import has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, joinedload
+
+from app import db
+from app.models import Booking, WaitlistEntry
+from app.availability_service import (
+    ACTIVE_BOOKING_STATUSES, find_conflicts, normalize_datetime
+)
+from app.jobs import enqueue, task
+from app.model_history import attribute_values, track_previous_values
+from app.notifications import send_email
+from app.utils.datetime_utils import format_datetime, get_local_timezone, to_utc
+
+logger = logging.getLogger("waitlist_matcher")
+
+# Local wall-clock hours [start, end) for each time preference
+TIME_PREFERENCE_HOURS = {
+    'morning': (6, 12),
+    'afternoon': (12, 17),
+    'evening': (17, 21),
+}
+
+OFFER_NOTE = 'Offered from the waitlist'
+
+
+def _preference_window(entry):
+    """Return the naive UTC window in which the entry would accept a slot."""
+    day = entry.requested_date.date()
+    start_hour, end_hour = TIME_PREFERENCE_HOURS.get(entry.time_preference, (0, 24))
+    tz = get_local_timezone(entry.student)
+    start = datetime.combine(day, time()) + timedelta(hours=start_hour)
+    end = datetime.combine(day, time()) + timedelta(hours=end_hour)
+    return (to_utc(start, tz=tz).replace(tzinfo=None),
+            to_utc(end, tz=tz).replace(tzinfo=None))
+
+
+def fit_slot(entry, start_time, end_time):
+    """
+    Return the (start, end) the entry would take out of a freed window.
+
+    The slot starts as early as the window and the entry's time preference
+    allow and must end inside the freed window.  Returns None if it does
+    not fit.
+    """
+    preferred_start, preferred_end = _preference_window(entry)
+    slot_start = max(start_time, preferred_start)
+    slot_end = slot_start + timedelta(hours=entry.duration_hours)
+    if slot_start >= preferred_end or slot_end > end_time:
+        return None
+    return slot_start, slot_end
+
+
+def candidate_entries(aircraft_id, start_time, end_time):
+    """Active waitlist entries for the aircraft around the window, oldest first."""
+    # requested_date holds a calendar day; widen by a day each way so every
+    # local day the UTC window touches is included
+    first_day = datetime.combine(start_time.date() - timedelta(days=1), time())
+    last_day = datetime.combine(end_time.date() + timedelta(days=2), time())
+    return WaitlistEntry.query.options(joinedload(WaitlistEntry.student)).filter(
+        WaitlistEntry.aircraft_id == aircraft_id,
+        WaitlistEntry.requested_date >= first_day,
+        WaitlistEntry.requested_date < last_day,
+        WaitlistEntry.status == 'active'
+    ).order_by(WaitlistEntry.created_at, WaitlistEntry.id).all()
+
+
+def match_freed_slot(aircraft_id, start_time, end_time, now=None):
+    """
+    Offer a freed aircraft window to waiting students and commit.
+
+    Entries are tried in the order they joined.  Each offer is committed
+    before the next entry is tried, so later candidates see the time it
+    took.  Returns the entries that were offered a slot.
+    """
+    now = normalize_datetime(now or datetime.now(timezone.utc))
+    start_time = max(normalize_datetime(start_time), now)
+    end_time = normalize_datetime(end_time)
+    offered = []
+    if end_time <= start_time:
+        return offered
+
+    for entry in candidate_entries(aircraft_id, start_time, end_time):
+        slot = fit_slot(entry, start_time, end_time)
+        if slot is None:
+            continue
+        if find_conflicts(slot[0], slot[1], aircraft_id=aircraft_id,
+                          instructor_id=entry.instructor_id,
+                          student_id=entry.student_id):
+            continue
+        booking = Booking(
+            student_id=entry.student_id,
+            instructor_id=entry.instructor_id,
+            aircraft_id=aircraft_id,
+            start_time=slot[0],
+            end_time=slot[1],
+            status='pending',
+            notes=OFFER_NOTE
+        )
+        db.session.add(booking)
+        db.session.flush()
+        entry.status = 'offered'
+        entry.offered_booking_id = booking.id
+        entry.offered_at = now
+        _notify_offer(entry, booking)
+        db.session.commit()
+        offered.append(entry)
+    return offered
+
+
+def _notify_offer(entry, booking):
+    when = format_datetime(booking.start_time, '%A %b %d at %H:%M',
+                           tz=get_local_timezone(entry.student))
+    send_email(
+        'A slot opened up for you',
+        [entry.student.email],
+        f'{entry.aircraft.display_name} is free on {when} for {entry.duration_hours:g} hours. '
+        f'We have held it for you as a pending booking.'
+    )
+
+
+@task('match_waitlist')
+def match_waitlist_job(aircraft_id, start_time, end_time):
+    """Job handler: offer a freed window; times are ISO strings."""
+    for entry in match_freed_slot(aircraft_id, datetime.fromisoformat(start_time),
+                                  datetime.fromisoformat(end_time)):
+        logger.info(f"Offered booking {entry.offered_booking_id} to waitlist entry {entry.id}")
+
+
+def freed_windows(state, deleted=False):
+    """Return the (aircraft_id, start, end) windows a booking change released."""
+    status_before, status_after = attribute_values(state, 'status')
+    if status_before not in ACTIVE_BOOKING_STATUSES:
+        return []
+    aircraft_before, aircraft_after = attribute_values(state, 'aircraft_id')
+    start_before, start_after = attribute_values(state, 'start_time')
+    end_before, end_after = attribute_values(state, 'end_time')
+    if not aircraft_before or start_before is None or end_before is None:
+        return []
+    aircraft_before = int(aircraft_before)
+
+    if (deleted or status_after not in ACTIVE_BOOKING_STATUSES
+            or not aircraft_after or int(aircraft_after) != aircraft_before):
+        return [(aircraft_before, start_before, end_before)]
+
+    # Still held on the same aircraft: only the parts of the old window the
+    # new one no longer covers were freed
+    windows = []
+    if start_before < start_after:
+        windows.append((aircraft_before, start_before, min(end_before, start_after)))
+    if end_after < end_before:
+        windows.append((aircraft_before, max(start_before, end_after), end_before))
+    return windows
+
+
+# Load the old window before it is overwritten, even when the attribute
+# was expired by an earlier commit
+track_previous_values(Booking.status, Booking.aircraft_id, Booking.start_time, Booking.end_time)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_freed_windows(session, flush_context):
+    freed = session.info.setdefault('waitlist_freed_windows', [])
+    for obj in session.dirty:
+        if isinstance(obj, Booking) and obj not in session.deleted:
+            freed.extend(freed_windows(inspect(obj)))
+    for obj in session.deleted:
+        if isinstance(obj, Booking):
+            freed.extend(freed_windows(inspect(obj), deleted=True))
+
+
+@event.listens_for(Session, 'after_flush_postexec')
+def _enqueue_freed_windows(session, flush_context):
+    """Queue a matching job per freed window in the same transaction."""
+    freed = session.info.pop('waitlist_freed_windows', None)
+    if freed and has_app_context():
+        for aircraft_id, start_time, end_time in freed:
+            enqueue('match_waitlist', aircraft_id=aircraft_id,
+                    start_time=start_time.isoformat(), end_time=end_time.isoformat())
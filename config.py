@@ -17,10 +17,17 @@ class Config:
     SESSION_COOKIE_SECURE = False  # Set to True in production
     SESSION_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SAMESITE = 'Lax'
+    # None keeps sessions in the signed cookie; 'sqlite' or 'filesystem'
+    # keeps them server-side under SESSION_STORE_PATH (default: instance/)
+    SESSION_STORE = os.environ.get('SESSION_STORE') or None
+    SESSION_STORE_PATH = os.environ.get('SESSION_STORE_PATH')
     PREFERRED_URL_SCHEME = 'http'  # Change to 'https' in production
     SCHOOL_NAME = os.environ.get('SCHOOL_NAME', 'Tailwheel Addicts Aviation')
     CONTACT_EMAIL = os.environ.get('CONTACT_EMAIL', 'info@tailwheeladdicts.com')
     CONTACT_PHONE = os.environ.get('CONTACT_PHONE', '(555) 123-4567')
+    # IANA timezone used to display times for users without their own;
+    # unset means the server's system timezone
+    SCHOOL_TIMEZONE = os.environ.get('SCHOOL_TIMEZONE')
     
     # Mail settings (placeholder for future implementation)
     MAIL_SERVER = os.environ.get('MAIL_SERVER')
@@ -32,11 +39,32 @@ class Config:
     # Application specific settings
     MAX_BOOKING_DURATION = 8  # hours
     MIN_BOOKING_DURATION = 1  # hour
+    # Fetch missing aircraft images from Wikimedia in the background
+    AIRCRAFT_IMAGE_FETCH_ENABLED = True
+    # Background job threads started in each process once a job is queued;
+    # 0 (the default) leaves jobs to `flask jobs worker`
+    JOBS_WORKER_THREADS = int(os.environ.get('JOBS_WORKER_THREADS') or 0)
+    # Trailing window, in days, of check-outs used to project when
+    # hour-based maintenance comes due
+    MAINTENANCE_UTILIZATION_DAYS = 90
+    # Seconds a pilot's cached currency is trusted before re-reading the
+    # log; writes in this process drop it sooner
+    CURRENCY_CACHE_TTL = 300
+    # Ledger entries per student between balance snapshots
+    LEDGER_SNAPSHOT_INTERVAL = 50
+    # Refuse student bookings their prepaid balance does not cover
+    REQUIRE_PREPAID_BALANCE = False
 
     # Google Calendar settings
     GOOGLE_CLIENT_ID = os.environ.get('GOOGLE_CLIENT_ID')
     GOOGLE_CLIENT_SECRET = os.environ.get('GOOGLE_CLIENT_SECRET')
     GOOGLE_REDIRECT_URI = os.environ.get('GOOGLE_REDIRECT_URI') or 'http://localhost:5000/booking/google-callback'
+    # Base URL of the Google APIs; unset means https://www.googleapis.com/
+    GOOGLE_CALENDAR_API_ENDPOINT = os.environ.get('GOOGLE_CALENDAR_API_ENDPOINT')
+    # Seconds between background refreshes of tokens expiring within
+    # GOOGLE_CALENDAR_REFRESH_MARGIN seconds; 0 turns the refresher off
+    GOOGLE_CALENDAR_REFRESH_INTERVAL = 60
+    GOOGLE_CALENDAR_REFRESH_MARGIN = 300
 
 class DevelopmentConfig(Config):
     """Development configuration."""
@@ -50,6 +78,9 @@ class TestingConfig(Config):
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
     SERVER_NAME = 'localhost.localdomain'
+    AIRCRAFT_IMAGE_FETCH_ENABLED = False
+    JOBS_WORKER_THREADS = 0
+    GOOGLE_CALENDAR_REFRESH_INTERVAL = 0
 
 class ProductionConfig(Config):
     """Production configuration."""
@@ -0,0 +1,106 @@
+"""Keep Google Calendar event ids per user
+
+Revision ID: 3b7e0c2f9a41
+Revises:
+Create Date: 2026-10-18 09:52:29.000000
+
+Event ids move from ``booking.google_calendar_event_id`` into the
+``google_calendar_event`` table, one row per booking and calendar, and
+users get the ``google_calendar_synced_at`` high-water mark.  The old
+column did not record whose calendar the event was in, so its id is
+seeded for every connected user who can see the booking.  The seeded rows
+have no ``booking_updated_at``, so the next sync updates those events; a
+calendar that does not hold one gets a 404 and a fresh insert.
+
+Databases created with ``db.create_all()`` from the current models
+already have this schema and only need ``flask db stamp head``.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b7e0c2f9a41'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+users = sa.table(
+    'users',
+    sa.column('id', sa.Integer),
+    sa.column('is_admin', sa.Boolean),
+    sa.column('is_instructor', sa.Boolean),
+    sa.column('google_calendar_enabled', sa.Boolean),
+    sa.column('google_calendar_credentials', sa.Text),
+)
+booking = sa.table(
+    'booking',
+    sa.column('id', sa.Integer),
+    sa.column('student_id', sa.Integer),
+    sa.column('instructor_id', sa.Integer),
+    sa.column('google_calendar_event_id', sa.String),
+)
+google_calendar_event = sa.table(
+    'google_calendar_event',
+    sa.column('user_id', sa.Integer),
+    sa.column('booking_id', sa.Integer),
+    sa.column('event_id', sa.String),
+    sa.column('created_at', sa.DateTime),
+)
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('google_calendar_synced_at', sa.DateTime(), nullable=True))
+
+    op.create_table(
+        'google_calendar_event',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('booking_id', sa.Integer(), nullable=False),
+        sa.Column('event_id', sa.String(length=255), nullable=False),
+        sa.Column('booking_updated_at', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['booking_id'], ['booking.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'booking_id', name='uq_google_calendar_event_user_booking'),
+    )
+
+    # Same rule as calendar_service.visible_bookings
+    not_instructor = sa.or_(users.c.is_instructor.is_(None), users.c.is_instructor == sa.false())
+    visible = sa.or_(
+        users.c.is_admin == sa.true(),
+        sa.and_(users.c.is_instructor == sa.true(),
+                sa.or_(booking.c.instructor_id == users.c.id, booking.c.instructor_id.is_(None))),
+        sa.and_(not_instructor, booking.c.student_id == users.c.id),
+    )
+    op.execute(google_calendar_event.insert().from_select(
+        ['user_id', 'booking_id', 'event_id', 'created_at'],
+        sa.select(users.c.id, booking.c.id, booking.c.google_calendar_event_id,
+                  sa.func.current_timestamp())
+        .where(booking.c.google_calendar_event_id.isnot(None),
+               users.c.google_calendar_enabled == sa.true(),
+               users.c.google_calendar_credentials.isnot(None),
+               visible)
+    ))
+
+    with op.batch_alter_table('booking', schema=None) as batch_op:
+        batch_op.drop_column('google_calendar_event_id')
+
+
+def downgrade():
+    with op.batch_alter_table('booking', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('google_calendar_event_id', sa.String(length=255), nullable=True))
+
+    # Only one of a booking's events fits back in the column
+    op.execute(booking.update().values(google_calendar_event_id=(
+        sa.select(sa.func.min(google_calendar_event.c.event_id))
+        .where(google_calendar_event.c.booking_id == booking.c.id)
+        .scalar_subquery()
+    )))
+
+    op.drop_table('google_calendar_event')
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('google_calendar_synced_at')
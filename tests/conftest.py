@@ -1,7 +1,9 @@
 import os
 import tempfile
 import pytest
+from contextlib import contextmanager
 from datetime import datetime, timedelta, timezone
+from sqlalchemy import event
 from app import create_app, db
 from app.models import (
     User, Aircraft, Booking, CheckIn, CheckOut, Invoice,
@@ -384,3 +386,59 @@ def test_squawk(session, test_aircraft):
     session.add(squawk)
     session.commit()
     return squawk
+
+
+@pytest.fixture
+def count_queries(app):
+    """Return a context manager that collects the SQL statements run inside it."""
+    @contextmanager
+    def count():
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    return count
+
+
+@pytest.fixture
+def flight_start():
+    """When the first flight booked by ``book_flight`` starts."""
+    return datetime(2030, 5, 1, 9)
+
+
+@pytest.fixture
+def book_flight(session, flight_start):
+    """
+    Return a factory for two-hour bookings ``days`` after ``flight_start``.
+
+    With ``hobbs_start`` the flight is checked in, and with ``hours`` as
+    well it is checked out too, without billing it.  The status follows
+    unless given: confirmed, in progress or completed.
+    """
+    def book(student, aircraft, instructor=None, days=0, status=None, hobbs_start=None,
+             hours=None):
+        start = flight_start + timedelta(days=days)
+        if status is None:
+            status = ('confirmed' if hobbs_start is None else
+                      'in_progress' if hours is None else 'completed')
+        booking = Booking(student_id=student.id, aircraft_id=aircraft.id,
+                          instructor_id=instructor.id if instructor else None,
+                          start_time=start, end_time=start + timedelta(hours=2), status=status)
+        session.add(booking)
+        session.flush()
+        if hobbs_start is not None:
+            session.add(CheckIn(booking_id=booking.id, aircraft_id=aircraft.id, check_in_time=start,
+                                hobbs_start=hobbs_start, tach_start=hobbs_start))
+        if hours is not None:
+            session.add(CheckOut(booking_id=booking.id, aircraft_id=aircraft.id,
+                                 check_out_time=start + timedelta(hours=hours),
+                                 hobbs_end=hobbs_start + hours, tach_end=hobbs_start + hours))
+        session.commit()
+        return booking
+    return book
@@ -0,0 +1,115 @@
+"""
+A local stand-in for the Google Calendar API.
+
+Implements event insert/update/delete on any calendar, the multipart batch
+endpoint and an OAuth token endpoint at ``/token``, keeps events in memory,
+and records every HTTP round-trip so tests can assert how many requests a
+sync made.
+"""
+
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import itertools
+import json
+import re
+import threading
+
+EVENT_PATH = re.compile(r'^/calendar/v3/calendars/([^/]+)/events(?:/([^/?]+))?')
+
+
+class FakeCalendar:
+    def __init__(self):
+        self.events = {}       # event id -> event body
+        self.round_trips = []  # (method, path) of each HTTP request received
+        self.operations = []   # (method, event id) of each API call, batched or not
+        self.issued_tokens = []
+        self._ids = itertools.count(1)
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.endpoint = f'http://127.0.0.1:{self._server.server_port}/'
+        self.token_uri = self.endpoint + 'token'
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def call(self, method, path, body):
+        """Apply one API call; returns (status, response body dict or None)."""
+        match = EVENT_PATH.match(path)
+        if not match:
+            return 404, {'error': {'code': 404, 'message': 'Not Found'}}
+        event_id = match.group(2)
+        self.operations.append((method, event_id))
+        if method == 'POST' and event_id is None:
+            event_id = f'evt{next(self._ids)}'
+            self.events[event_id] = dict(json.loads(body), id=event_id)
+            return 200, self.events[event_id]
+        if event_id not in self.events:
+            return 404, {'error': {'code': 404, 'message': 'Not Found'}}
+        if method == 'PUT':
+            self.events[event_id] = dict(json.loads(body), id=event_id)
+            return 200, self.events[event_id]
+        if method == 'DELETE':
+            del self.events[event_id]
+            return 204, None
+        return 405, {'error': {'code': 405, 'message': 'Method Not Allowed'}}
+
+    def _batch(self, content_type, body):
+        message = BytesParser(policy=HTTP).parsebytes(
+            f'Content-Type: {content_type}\r\n\r\n'.encode() + body
+        )
+        parts = []
+        for part in message.iter_parts():
+            raw = part.get_payload(decode=True).decode()
+            request_line, rest = raw.split('\n', 1)
+            method, path, _ = request_line.split(' ', 2)
+            inner_body = rest.split('\n\n', 1)[1] if '\n\n' in rest else rest.split('\r\n\r\n', 1)[-1]
+            status, result = self.call(method, path, inner_body)
+            response = f'HTTP/1.1 {status} Status\r\nContent-Type: application/json\r\n\r\n'
+            response += json.dumps(result) if result is not None else ''
+            content_id = part['Content-ID']
+            parts.append(
+                '--batch_boundary\r\n'
+                'Content-Type: application/http\r\n'
+                f'Content-ID: <response-{content_id[1:]}\r\n\r\n'
+                f'{response}\r\n'
+            )
+        return ''.join(parts) + '--batch_boundary--\r\n'
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _respond(self, status, body, content_type='application/json'):
+                data = body.encode() if body else b''
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _handle(self):
+                fake.round_trips.append((self.command, self.path))
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if self.path == '/token':
+                    fake.issued_tokens.append(f'token{len(fake.issued_tokens) + 1}')
+                    self._respond(200, json.dumps({'access_token': fake.issued_tokens[-1],
+                                                   'expires_in': 3600, 'token_type': 'Bearer'}))
+                    return
+                if self.path.startswith('/batch/'):
+                    self._respond(200, fake._batch(self.headers['Content-Type'], body),
+                                  'multipart/mixed; boundary=batch_boundary')
+                    return
+                status, result = fake.call(self.command, self.path, body.decode())
+                self._respond(status, json.dumps(result) if result is not None else '')
+
+            do_POST = do_PUT = do_DELETE = do_GET = _handle
+
+        return Handler
@@ -92,11 +92,11 @@ def test_aircraft_image_fallback_single_engine_piston(client, monkeypatch):
         aircraft = Aircraft.query.filter_by(registration="N12345").first()
         booking = Booking.query.filter_by(aircraft_id=aircraft.id).first()
         
-        # Mock ensure_aircraft_image to return the fallback path
-        def mock_ensure_aircraft_image(filename, make=None, model=None):
+        # Mock resolve_aircraft_image to return the fallback path
+        def mock_resolve_aircraft_image(filename, make=None, model=None):
             return "images/aircraft/cessna172.jpg"
         
-        monkeypatch.setattr("app.models.ensure_aircraft_image", mock_ensure_aircraft_image)
+        monkeypatch.setattr("app.models.resolve_aircraft_image", mock_resolve_aircraft_image)
         
         booking_id = booking.id  # Store the ID to use outside the context
     
@@ -115,11 +115,11 @@ def test_aircraft_image_fallback_single_engine_turboprop(client, monkeypatch):
         aircraft = Aircraft.query.filter_by(registration="N67890").first()
         booking = Booking.query.filter_by(aircraft_id=aircraft.id).first()
         
-        # Mock ensure_aircraft_image to return the fallback path
-        def mock_ensure_aircraft_image(filename, make=None, model=None):
+        # Mock resolve_aircraft_image to return the fallback path
+        def mock_resolve_aircraft_image(filename, make=None, model=None):
             return "images/aircraft/tbm930.jpg"
         
-        monkeypatch.setattr("app.models.ensure_aircraft_image", mock_ensure_aircraft_image)
+        monkeypatch.setattr("app.models.resolve_aircraft_image", mock_resolve_aircraft_image)
         
         booking_id = booking.id  # Store the ID to use outside the context
     
@@ -138,11 +138,11 @@ def test_aircraft_image_fallback_multi_engine_piston(client, monkeypatch):
         aircraft = Aircraft.query.filter_by(registration="N54321").first()
         booking = Booking.query.filter_by(aircraft_id=aircraft.id).first()
         
-        # Mock ensure_aircraft_image to return the fallback path
-        def mock_ensure_aircraft_image(filename, make=None, model=None):
+        # Mock resolve_aircraft_image to return the fallback path
+        def mock_resolve_aircraft_image(filename, make=None, model=None):
             return "images/aircraft/baron58.jpg"
         
-        monkeypatch.setattr("app.models.ensure_aircraft_image", mock_ensure_aircraft_image)
+        monkeypatch.setattr("app.models.resolve_aircraft_image", mock_resolve_aircraft_image)
         
         booking_id = booking.id  # Store the ID to use outside the context
     
@@ -161,11 +161,11 @@ def test_aircraft_image_fallback_multi_engine_turboprop(client, monkeypatch):
         aircraft = Aircraft.query.filter_by(registration="N09876").first()
         booking = Booking.query.filter_by(aircraft_id=aircraft.id).first()
         
-        # Mock ensure_aircraft_image to return the fallback path
-        def mock_ensure_aircraft_image(filename, make=None, model=None):
+        # Mock resolve_aircraft_image to return the fallback path
+        def mock_resolve_aircraft_image(filename, make=None, model=None):
             return "images/aircraft/kingair350.jpg"
         
-        monkeypatch.setattr("app.models.ensure_aircraft_image", mock_ensure_aircraft_image)
+        monkeypatch.setattr("app.models.resolve_aircraft_image", mock_resolve_aircraft_image)
         
         booking_id = booking.id  # Store the ID to use outside the context
     
@@ -184,11 +184,11 @@ def test_aircraft_image_fallback_jet(client, monkeypatch):
         aircraft = Aircraft.query.filter_by(registration="N11111").first()
         booking = Booking.query.filter_by(aircraft_id=aircraft.id).first()
         
-        # Mock ensure_aircraft_image to return the fallback path
-        def mock_ensure_aircraft_image(filename, make=None, model=None):
+        # Mock resolve_aircraft_image to return the fallback path
+        def mock_resolve_aircraft_image(filename, make=None, model=None):
             return "images/aircraft/citation.jpg"
         
-        monkeypatch.setattr("app.models.ensure_aircraft_image", mock_ensure_aircraft_image)
+        monkeypatch.setattr("app.models.resolve_aircraft_image", mock_resolve_aircraft_image)
         
         booking_id = booking.id  # Store the ID to use outside the context
     
@@ -207,11 +207,11 @@ def test_aircraft_image_fallback_default(client, monkeypatch):
         aircraft = Aircraft.query.filter_by(registration="N12345").first()
         booking = Booking.query.filter_by(aircraft_id=aircraft.id).first()
         
-        # Mock ensure_aircraft_image to return the default fallback path
-        def mock_ensure_aircraft_image(filename, make=None, model=None):
+        # Mock resolve_aircraft_image to return the default fallback path
+        def mock_resolve_aircraft_image(filename, make=None, model=None):
             return "images/aircraft/default.jpg"
         
-        monkeypatch.setattr("app.models.ensure_aircraft_image", mock_ensure_aircraft_image)
+        monkeypatch.setattr("app.models.resolve_aircraft_image", mock_resolve_aircraft_image)
         
         booking_id = booking.id  # Store the ID to use outside the context
     
@@ -243,11 +243,11 @@ def test_aircraft_image_integration_in_flight_status(client, monkeypatch):
         booking.status = "in_progress"
         db.session.commit()
         
-        # Mock ensure_aircraft_image to return the fallback path
-        def mock_ensure_aircraft_image(filename, make=None, model=None):
+        # Mock resolve_aircraft_image to return the fallback path
+        def mock_resolve_aircraft_image(filename, make=None, model=None):
             return "images/aircraft/cessna172.jpg"
         
-        monkeypatch.setattr("app.models.ensure_aircraft_image", mock_ensure_aircraft_image)
+        monkeypatch.setattr("app.models.resolve_aircraft_image", mock_resolve_aircraft_image)
         
         booking_id = booking.id  # Store the ID to use outside the context
     
@@ -265,11 +265,11 @@ def test_aircraft_image_integration_in_maintenance_records(client, monkeypatch):
     with app.app_context():
         aircraft = Aircraft.query.filter_by(registration="N12345").first()
         
-        # Mock ensure_aircraft_image to return the fallback path
-        def mock_ensure_aircraft_image(filename, make=None, model=None):
+        # Mock resolve_aircraft_image to return the fallback path
+        def mock_resolve_aircraft_image(filename, make=None, model=None):
             return "images/aircraft/cessna172.jpg"
         
-        monkeypatch.setattr("app.models.ensure_aircraft_image", mock_ensure_aircraft_image)
+        monkeypatch.setattr("app.models.resolve_aircraft_image", mock_resolve_aircraft_image)
         
         aircraft_id = aircraft.id  # Store the ID to use outside the context
     
@@ -80,3 +80,57 @@ def test_ensure_aircraft_image_fetch_fail(monkeypatch, tmp_path):
     fname = "fail.jpg"
     result = ensure_aircraft_image(fname, make="TestMake", model="TestModel")
     assert result == 'images/aircraft/default.jpg'
+
+
+def _write_jpeg(path):
+    jpeg_header = b'\xff\xd8\xff\xe0' + b'JFIF' + b'\x00' * 100
+    path.write_bytes(jpeg_header + b"x" * (2048 - len(jpeg_header)))
+
+
+def test_resolver_caches_validation_by_mtime(tmp_path, monkeypatch):
+    from app import aircraft_images
+    _write_jpeg(tmp_path / "cached.jpg")
+    resolver = aircraft_images.AircraftImageResolver(str(tmp_path), fetch=lambda *a: None)
+    sniffs = []
+    real_check = aircraft_images.is_valid_image_file
+    monkeypatch.setattr(aircraft_images, "is_valid_image_file",
+                        lambda path: sniffs.append(path) or real_check(path))
+
+    assert resolver.resolve("cached.jpg") == 'images/aircraft/cached.jpg'
+    assert resolver.resolve("cached.jpg") == 'images/aircraft/cached.jpg'
+    assert len(sniffs) == 1
+
+    # Rewriting the file changes its mtime and forces revalidation
+    (tmp_path / "cached.jpg").write_bytes(b"not an image")
+    os.utime(tmp_path / "cached.jpg", ns=(1, 1))
+    assert resolver.resolve("cached.jpg", fetch_missing=False) == 'images/aircraft/default.jpg'
+    assert len(sniffs) == 2
+
+
+def test_resolver_fetches_in_background_with_negative_cache(tmp_path):
+    from app.aircraft_images import AircraftImageResolver
+    calls = []
+
+    def fetch(filename, make, model):
+        calls.append(filename)
+        if filename == "good.jpg":
+            _write_jpeg(tmp_path / filename)
+            return f'images/aircraft/{filename}'
+        return 'images/aircraft/default.jpg'
+
+    resolver = AircraftImageResolver(str(tmp_path), fetch=fetch)
+    # Stop the worker thread from racing the test; run_pending drains the queue
+    resolver._ensure_worker = lambda: None
+
+    assert resolver.resolve("good.jpg", "Cessna", "172") == 'images/aircraft/default.jpg'
+    assert resolver.resolve("bad.jpg") == 'images/aircraft/default.jpg'
+    # A fetch already queued is not queued twice
+    assert resolver.schedule_fetch("good.jpg") is False
+    resolver.run_pending()
+    assert calls == ["good.jpg", "bad.jpg"]
+
+    assert resolver.resolve("good.jpg") == 'images/aircraft/good.jpg'
+    # The failed fetch is not retried until the negative TTL expires
+    assert resolver.resolve("bad.jpg") == 'images/aircraft/default.jpg'
+    resolver.run_pending()
+    assert calls == ["good.jpg", "bad.jpg"]
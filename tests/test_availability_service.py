@@ -0,0 +1,295 @@
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import event, insert
+from app import db
+from app.models import Aircraft, Booking, MaintenanceRecord, MaintenanceType, Squawk
+from app.availability_service import (
+    BookingConflictIndex, IntervalIndex, find_conflicts, conflict_message, get_conflict_index,
+    compute_fleet_availability, merge_intervals, busy_intervals
+)
+
+
+def _window(hours_from_now, duration_hours=1):
+    start = datetime.now(timezone.utc).replace(microsecond=0) + timedelta(hours=hours_from_now)
+    return start, start + timedelta(hours=duration_hours)
+
+
+def test_interval_index_overlapping():
+    base = datetime(2025, 1, 1, 8, 0)
+    index = IntervalIndex([
+        (base, base + timedelta(hours=2), 1),
+        (base + timedelta(hours=3), base + timedelta(hours=4), 2),
+        (base - timedelta(hours=1), base + timedelta(hours=10), 3),
+    ])
+    assert len(index) == 3
+    assert sorted(index.overlapping(base + timedelta(hours=1), base + timedelta(hours=3))) == [1, 3]
+    # Touching windows do not overlap
+    assert index.overlapping(base + timedelta(hours=10), base + timedelta(hours=11)) == []
+    assert index.overlapping(base - timedelta(hours=3), base - timedelta(hours=1)) == []
+    assert index.overlapping(base, base + timedelta(hours=1), exclude_booking_id=3) == [1]
+
+
+def test_find_conflicts_by_resource(session, test_user, test_instructor, test_aircraft):
+    start, end = _window(24, 2)
+    booking = Booking(student_id=test_user.id, instructor_id=test_instructor.id,
+                      aircraft_id=test_aircraft.id, start_time=start, end_time=end,
+                      status='confirmed')
+    session.add(booking)
+    session.commit()
+
+    conflicts = find_conflicts(start + timedelta(hours=1), end + timedelta(hours=1),
+                               aircraft_id=test_aircraft.id,
+                               instructor_id=test_instructor.id)
+    assert conflicts == {'aircraft': [booking.id], 'instructor': [booking.id]}
+    assert conflict_message(conflicts) == 'The aircraft and instructor are already booked during the selected time.'
+
+    assert find_conflicts(end, end + timedelta(hours=1), aircraft_id=test_aircraft.id) == {}
+    assert find_conflicts(start, end, aircraft_id=test_aircraft.id,
+                          exclude_booking_id=booking.id) == {}
+
+
+def _busy_aircraft(start, end, aircraft):
+    return busy_intervals(start, end, aircraft_ids=[aircraft.id], instructor_ids=[])['aircraft']
+
+
+def test_conflict_index_invalidated_on_commit(session, test_user, test_aircraft):
+    start, end = _window(48)
+    assert _busy_aircraft(start, end, test_aircraft) == {}
+
+    booking = Booking(student_id=test_user.id, aircraft_id=test_aircraft.id,
+                      start_time=start, end_time=end, status='pending')
+    session.add(booking)
+    session.commit()
+    naive = (start.replace(tzinfo=None), end.replace(tzinfo=None))
+    assert _busy_aircraft(start, end, test_aircraft) == {test_aircraft.id: [naive]}
+
+    booking.status = 'cancelled'
+    session.commit()
+    assert _busy_aircraft(start, end, test_aircraft) == {}
+
+
+def test_writes_do_not_trust_a_stale_index(session, test_user, test_aircraft):
+    start, end = _window(48)
+    assert _busy_aircraft(start, end, test_aircraft) == {}
+
+    # Stands in for a booking committed by another worker process, which
+    # never invalidates this process's index
+    booking_id = session.execute(insert(Booking).values(
+        student_id=test_user.id, aircraft_id=test_aircraft.id,
+        start_time=start.replace(tzinfo=None), end_time=end.replace(tzinfo=None), status='confirmed'
+    )).inserted_primary_key[0]
+    assert _busy_aircraft(start, end, test_aircraft) == {}
+    assert find_conflicts(start, end, aircraft_id=test_aircraft.id) == {'aircraft': [booking_id]}
+
+
+def test_index_built_across_an_invalidation_is_not_stored(app, session, test_aircraft):
+    cache = BookingConflictIndex()
+    build = cache._build
+
+    def build_then_commit(resource, resource_ids):
+        indexes = build(resource, resource_ids)
+        cache.invalidate([(resource, resource_id) for resource_id in resource_ids])
+        return indexes
+
+    cache._build = build_then_commit
+    first = cache.get('aircraft', test_aircraft.id)
+    cache._build = build
+    assert cache.get('aircraft', test_aircraft.id) is not first
+
+
+def test_busy_intervals_read_from_cached_indexes(session, test_user, test_instructor,
+                                                 test_aircraft, count_queries):
+    start, end = _window(24, 2)
+    session.add(Booking(student_id=test_user.id, instructor_id=test_instructor.id,
+                        aircraft_id=test_aircraft.id, start_time=start, end_time=end,
+                        status='confirmed'))
+    session.commit()
+    window = (start - timedelta(hours=1), end + timedelta(days=1))
+    first = busy_intervals(*window)
+
+    with count_queries() as statements:
+        assert busy_intervals(*window) == first
+    # Only the aircraft and instructor ids are read; no bookings or series
+    assert len(statements) == 2
+    assert not any('booking' in statement for statement in statements)
+    naive = (start.replace(tzinfo=None), end.replace(tzinfo=None))
+    assert first == {'aircraft': {test_aircraft.id: [naive]},
+                     'instructor': {test_instructor.id: [naive]}}
+
+
+def test_old_windows_fall_back_to_database(session, test_user, test_aircraft):
+    start, end = _window(-24 * 30, 2)
+    booking = Booking(student_id=test_user.id, aircraft_id=test_aircraft.id,
+                      start_time=start, end_time=end, status='confirmed')
+    session.add(booking)
+    session.commit()
+    assert not get_conflict_index().get('aircraft', test_aircraft.id).covers(start.replace(tzinfo=None))
+    assert _busy_aircraft(start, end, test_aircraft) == {
+        test_aircraft.id: [(start.replace(tzinfo=None), end.replace(tzinfo=None))]}
+
+
+def test_admin_create_booking_rejects_conflict(admin_client, session, test_user, test_aircraft):
+    start, end = _window(72)
+    existing = Booking(student_id=test_user.id, aircraft_id=test_aircraft.id,
+                       start_time=start.replace(tzinfo=None), end_time=end.replace(tzinfo=None),
+                       status='confirmed')
+    session.add(existing)
+    session.commit()
+
+    resp = admin_client.post('/admin/booking/create', data={
+        'student_id': test_user.id,
+        'aircraft_id': test_aircraft.id,
+        'start_time': start.strftime('%Y-%m-%dT%H:%M'),
+        'duration': 60,
+    }, follow_redirects=True)
+    assert resp.status_code == 200
+    assert b"already booked during the selected time" in resp.data
+    assert Booking.query.count() == 1
+
+
+def test_compute_fleet_availability(session, test_user, test_aircraft):
+    due_100hr = Aircraft(registration='N100HR', make='Piper', model='PA-28',
+                         rate_per_hour=120.0, status='available', time_to_next_100hr=0.5)
+    annual = Aircraft(registration='NANNUAL', make='Piper', model='PA-28',
+                      rate_per_hour=120.0, status='available',
+                      date_of_next_annual=datetime.now(timezone.utc).date() - timedelta(days=1))
+    grounded = Aircraft(registration='NGROUND', make='Piper', model='PA-28',
+                        rate_per_hour=120.0, status='available')
+    session.add_all([due_100hr, annual, grounded])
+    session.flush()
+    session.add_all([
+        Squawk(aircraft_id=grounded.id, description='Flat tire', reported_by_id=test_user.id,
+               status='open', ground_airplane=True),
+        Squawk(aircraft_id=test_aircraft.id, description='Loose seat belt',
+               reported_by_id=test_user.id, status='open', ground_airplane=False),
+    ])
+    session.commit()
+
+    fleet = compute_fleet_availability()
+    assert fleet[test_aircraft.id]['available'] is True
+    assert fleet[test_aircraft.id]['status'] == 'Available'
+    assert fleet[due_100hr.id]['inspection_100hr_due'] is True
+    assert fleet[due_100hr.id]['status'] == 'Unavailable: 100hr inspection due'
+    assert fleet[annual.id]['annual_due'] is True
+    assert fleet[grounded.id]['grounded'] is True
+    assert fleet[grounded.id]['status'] == grounded.availability_status
+    assert compute_fleet_availability([]) == {}
+
+    # The properties read the memo filled above instead of querying squawks
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        assert [a.is_available for a in (test_aircraft, grounded)] == [True, False]
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    assert statements == []
+
+
+def test_bookings_past_maintenance_limit_conflict(session, test_user, test_aircraft):
+    annual = (datetime.now(timezone.utc) + timedelta(days=3)).date()
+    test_aircraft.date_of_next_annual = annual
+    session.commit()
+    assert test_aircraft.available_until == datetime.combine(annual, datetime.min.time())
+    assert test_aircraft.available_until_reason == 'Annual inspection due'
+
+    start, end = _window(24)
+    assert find_conflicts(start, end, aircraft_id=test_aircraft.id) == {}
+    start, end = _window(24 * 4)
+    conflicts = find_conflicts(start, end, aircraft_id=test_aircraft.id, student_id=test_user.id)
+    assert conflicts == {'maintenance': ['Annual inspection due']}
+    assert conflict_message(conflicts) == (
+        'The aircraft is unavailable for maintenance by then (Annual inspection due).')
+
+    # Signing off the annual clears the limit
+    test_aircraft.date_of_next_annual = annual.replace(year=annual.year + 1)
+    session.commit()
+    assert find_conflicts(start, end, aircraft_id=test_aircraft.id) == {}
+
+
+def test_planned_maintenance_blocks_later_bookings(session, admin_user, test_aircraft):
+    maintenance_type = MaintenanceType(name='Avionics upgrade', created_by_id=admin_user.id)
+    session.add(maintenance_type)
+    session.flush()
+    block_start, _ = _window(48)
+    record = MaintenanceRecord(aircraft_id=test_aircraft.id, maintenance_type_id=maintenance_type.id,
+                               performed_at=block_start.replace(tzinfo=None), labor_hours=6.0,
+                               performed_by_id=admin_user.id, status='pending')
+    session.add(record)
+    session.commit()
+    # Planned maintenance is a blocked interval, not a limit
+    assert compute_fleet_availability()[test_aircraft.id]['available_until'] is None
+
+    assert find_conflicts(*_window(24), aircraft_id=test_aircraft.id) == {}
+    assert find_conflicts(*_window(47, 2), aircraft_id=test_aircraft.id) == {
+        'maintenance': ['Scheduled maintenance']}
+    assert find_conflicts(*_window(53, 2), aircraft_id=test_aircraft.id) == {
+        'maintenance': ['Scheduled maintenance']}
+    # Bookings after the expected end are fine
+    assert find_conflicts(*_window(54, 2), aircraft_id=test_aircraft.id) == {}
+
+    # Without an estimate it blocks for PLANNED_MAINTENANCE_HOURS
+    record.labor_hours = None
+    session.commit()
+    assert find_conflicts(*_window(71, 2), aircraft_id=test_aircraft.id) == {
+        'maintenance': ['Scheduled maintenance']}
+    assert find_conflicts(*_window(72, 2), aircraft_id=test_aircraft.id) == {}
+
+    record.status = 'completed'
+    session.commit()
+    assert test_aircraft.available_until is None
+    assert find_conflicts(*_window(47, 2), aircraft_id=test_aircraft.id) == {}
+
+
+def test_admin_booking_form_uses_fleet_availability(admin_client, test_aircraft):
+    resp = admin_client.get('/admin/booking/create')
+    assert resp.status_code == 200
+    assert b'data-status="Available"' in resp.data
+
+
+def test_merge_intervals():
+    base = datetime(2025, 1, 1, 8, 0)
+    hours = lambda h: base + timedelta(hours=h)
+    assert merge_intervals([(hours(3), hours(4)), (hours(0), hours(1)), (hours(1), hours(2)),
+                            (hours(3), hours(3.5))]) == [(hours(0), hours(2)), (hours(3), hours(4))]
+
+
+def test_busy_intervals_merge_and_clip(session, test_user, test_instructor, test_aircraft):
+    base = datetime(2025, 3, 3, 8, 0)
+    for offset, duration, status in ((0, 2, 'confirmed'), (1, 2, 'pending'),
+                                     (5, 1, 'cancelled'), (-2, 3, 'confirmed')):
+        session.add(Booking(student_id=test_user.id, instructor_id=test_instructor.id,
+                            aircraft_id=test_aircraft.id,
+                            start_time=base + timedelta(hours=offset),
+                            end_time=base + timedelta(hours=offset + duration), status=status))
+    session.commit()
+
+    busy = busy_intervals(base, base + timedelta(days=1))
+    # Overlapping bookings merge, the early one is clipped, cancelled ones are ignored
+    expected = [(base, base + timedelta(hours=3))]
+    assert busy['aircraft'] == {test_aircraft.id: expected}
+    assert busy['instructor'] == {test_instructor.id: expected}
+
+    only_other = busy_intervals(base, base + timedelta(days=1), aircraft_ids=[test_aircraft.id + 1],
+                                instructor_ids=[])
+    assert only_other == {'aircraft': {}, 'instructor': {}}
+
+
+def test_availability_api_etag(auth_client, session, test_user, test_aircraft):
+    start = datetime(2025, 3, 3, 8, 0)
+    session.add(Booking(student_id=test_user.id, aircraft_id=test_aircraft.id, start_time=start,
+                        end_time=start + timedelta(hours=1), status='confirmed'))
+    session.commit()
+
+    url = '/api/availability?from=2025-03-02T00:00:00.000Z&to=2025-03-09T00:00:00Z'
+    resp = auth_client.get(url)
+    assert resp.status_code == 200
+    assert resp.json['aircraft'] == {
+        str(test_aircraft.id): [['2025-03-03T08:00:00Z', '2025-03-03T09:00:00Z']]
+    }
+    etag = resp.headers['ETag']
+
+    resp = auth_client.get(url, headers={'If-None-Match': etag})
+    assert resp.status_code == 304
+
+    assert auth_client.get('/api/availability?from=nope').status_code == 400
+    assert auth_client.get('/api/availability?from=2025-01-01&to=2025-03-01').status_code == 400
@@ -0,0 +1,102 @@
+from datetime import timedelta
+import pytest
+from sqlalchemy.exc import IntegrityError
+from app import billing
+from app.billing import invoice_number_for, invoice_values, run_billing
+from app.models import Invoice, LedgerEntry
+
+
+def test_billing_run_invoices_uninvoiced_flights(app, session, book_flight, test_user,
+                                                 test_instructor, test_aircraft):
+    dual = book_flight(test_user, test_aircraft, test_instructor, hobbs_start=100.0, hours=1.5)
+    solo = book_flight(test_user, test_aircraft, days=1, hobbs_start=101.5, hours=2.0)
+    book_flight(test_user, test_aircraft, days=2, status='in_progress', hobbs_start=103.5, hours=1.0)
+
+    assert run_billing() == 2
+    invoice = Invoice.query.filter_by(booking_id=dual.id).one()
+    assert invoice.invoice_number == f'INV-{dual.id:06d}'
+    assert (invoice.aircraft_time, invoice.aircraft_total) == (1.5, 225.0)
+    assert (invoice.instructor_rate, invoice.instructor_total) == (75.0, 112.5)
+    assert (invoice.total_amount, invoice.status) == (337.5, 'pending')
+    invoice = Invoice.query.filter_by(booking_id=solo.id).one()
+    assert (invoice.instructor_rate, invoice.instructor_time, invoice.total_amount) == (None, None, 300.0)
+
+    # Billed flights are not billed again
+    assert run_billing() == 0
+    assert Invoice.query.count() == 2
+
+
+def test_billing_run_batches_and_respects_cutoff(app, session, book_flight, flight_start,
+                                                 count_queries, test_user, test_aircraft):
+    for day in range(5):
+        book_flight(test_user, test_aircraft, days=day, hobbs_start=100.0 + day, hours=1.0)
+
+    with count_queries() as statements:
+        assert run_billing(until=flight_start + timedelta(days=3)) == 3
+    inserts = [s for s in statements if s.lstrip().upper().startswith('INSERT')]
+    # The batch is one select and one insert of invoices, plus charging them
+    # to the student (a select, a lock, an insert and a snapshot check) and reading
+    # their instruction for payroll (none here) and one daily-facts upsert;
+    # then an empty select ends the run
+    assert (len(statements), len(inserts)) == (9, 3)
+
+    with count_queries() as statements:
+        assert run_billing(batch_size=1) == 2
+    assert len([s for s in statements if s.startswith('INSERT INTO invoice ')]) == 2
+    assert Invoice.query.count() == 5
+
+
+def test_flights_invoiced_concurrently_are_skipped(app, session, book_flight, flight_start,
+                                                   test_user, test_aircraft, monkeypatch):
+    raced = book_flight(test_user, test_aircraft, hobbs_start=100.0, hours=1.0)
+    book_flight(test_user, test_aircraft, days=1, hobbs_start=101.0, hours=1.0)
+    found = billing.uninvoiced_flights
+
+    def invoiced_meanwhile(*args, **kwargs):
+        rows = found(*args, **kwargs)
+        if rows:
+            # Another run invoices the first flight after this one read it
+            session.execute(Invoice.__table__.insert().values(invoice_values(
+                raced.id, test_aircraft.id, test_user.id, None, 1.0, 150.0, None, flight_start)))
+        return rows
+    monkeypatch.setattr(billing, 'uninvoiced_flights', invoiced_meanwhile)
+
+    assert run_billing() == 1
+    assert Invoice.query.count() == 2
+    # Only the invoice this run wrote is charged
+    charged, = LedgerEntry.query.filter_by(entry_type='charge')
+    assert charged.invoice.booking_id != raced.id
+
+
+def test_invoice_number_taken_by_another_invoice_is_not_skipped(app, session, book_flight,
+                                                                 flight_start, test_user,
+                                                                 test_aircraft):
+    flight = book_flight(test_user, test_aircraft, hobbs_start=100.0, hours=1.0)
+    other = book_flight(test_user, test_aircraft, days=1, status='cancelled')
+    # Entered by hand with the number the run would give the flight
+    session.add(Invoice(**dict(
+        invoice_values(other.id, test_aircraft.id, test_user.id, None, 0.5, 150.0, None,
+                       flight_start),
+        invoice_number=invoice_number_for(flight.id)
+    )))
+    session.commit()
+
+    with pytest.raises(IntegrityError):
+        run_billing()
+    assert Invoice.query.count() == 1
+
+
+def test_admin_billing_action(app, session, admin_client, book_flight, test_user, test_aircraft):
+    book_flight(test_user, test_aircraft, hobbs_start=100.0, hours=1.2)
+    response = admin_client.post('/admin/billing/run', follow_redirects=True)
+    assert response.status_code == 200
+    assert b'Created 1 invoices' in response.data
+    assert Invoice.query.one().aircraft_total == pytest.approx(180.0)
+
+
+def test_billing_cli(app, session, book_flight, test_user, test_aircraft):
+    book_flight(test_user, test_aircraft, hobbs_start=100.0, hours=1.0)
+    result = app.test_cli_runner().invoke(args=['run-billing', '--until', '2030-05-01'])
+    assert 'Created 0 invoices' in result.output
+    result = app.test_cli_runner().invoke(args=['run-billing'])
+    assert 'Created 1 invoices' in result.output
@@ -0,0 +1,53 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+from app.models import User, Aircraft, Booking
+from app.booking_queries import BookingQueries
+
+
+def _add_bookings(session, count):
+    """Add bookings that each have their own student, instructor and aircraft."""
+    start = datetime.now(timezone.utc) + timedelta(days=1)
+    offset = Booking.query.count()
+    for i in range(offset, offset + count):
+        student = User(email=f'student{i}@example.com', first_name='S', last_name=str(i),
+                       role='student', status='active')
+        instructor = User(email=f'cfi{i}@example.com', first_name='I', last_name=str(i),
+                          role='instructor', is_instructor=True, status='active')
+        aircraft = Aircraft(registration=f'N{1000 + i}', make='Cessna', model='172',
+                            rate_per_hour=100.0)
+        session.add_all([student, instructor, aircraft])
+        session.flush()
+        session.add(Booking(student_id=student.id, instructor_id=instructor.id,
+                            aircraft_id=aircraft.id,
+                            start_time=start + timedelta(hours=i),
+                            end_time=start + timedelta(hours=i + 1),
+                            status='confirmed'))
+    session.commit()
+
+
+def test_with_parties_loads_relationships(session, count_queries):
+    _add_bookings(session, 3)
+    session.expunge_all()
+    bookings = BookingQueries.with_parties().all()
+    with count_queries() as statements:
+        names = [(b.student.full_name, b.instructor.full_name, b.aircraft.registration)
+                 for b in bookings]
+    assert len(names) == 3
+    assert statements == []
+
+
+@pytest.mark.parametrize('url', ['/admin/bookings', '/admin/schedule', '/list'])
+def test_listing_query_count_is_constant(admin_client, session, url, count_queries):
+    _add_bookings(session, 1)
+    # Warm the user identity cache so both measured requests skip the loader
+    admin_client.get(url)
+    with count_queries() as statements:
+        assert admin_client.get(url).status_code == 200
+    baseline = len(statements)
+
+    _add_bookings(session, 5)
+    # The commit expired the principal the shared app context keeps in g
+    admin_client.get(url)
+    with count_queries() as statements:
+        assert admin_client.get(url).status_code == 200
+    assert len(statements) == baseline
@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta, timezone
+from app.availability_service import busy_intervals
+from app.bulk_inserts import bulk_insert
+from app.dashboard_stats import rebuild_dashboard_stats
+from app.models import Booking, DailyFact, DashboardStats
+
+
+def test_bulk_inserted_bookings_reach_every_listener(app, session, test_user, test_aircraft):
+    rebuild_dashboard_stats()
+    session.commit()
+    start = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0) + timedelta(days=1)
+    window = (start, start + timedelta(hours=1))
+    busy = lambda: busy_intervals(*window, aircraft_ids=[test_aircraft.id], instructor_ids=[])
+    # Builds and caches the aircraft's conflict index
+    assert busy()['aircraft'] == {}
+
+    bulk_insert(session, Booking, [
+        dict(student_id=test_user.id, aircraft_id=test_aircraft.id, start_time=start,
+             end_time=start + timedelta(hours=1), status=status)
+        for status in ('pending', 'confirmed')
+    ])
+    session.commit()
+
+    assert session.get(DashboardStats, 1).pending_bookings == 1
+    fact = DailyFact.query.filter_by(day=start.date()).one()
+    assert (fact.aircraft_id, fact.bookings) == (test_aircraft.id, 2)
+    assert busy()['aircraft'] == {test_aircraft.id: [window]}
+
+
+def test_bulk_insert_of_nothing_does_nothing(app, session, count_queries):
+    with count_queries() as statements:
+        bulk_insert(session, Booking, [])
+    assert statements == []
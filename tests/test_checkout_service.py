@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+import pytest
+from app.checkout_service import CheckOutError, complete_check_out
+from app.models import Booking, CheckIn, CheckOut, FlightLog, Invoice
+
+
+@pytest.fixture
+def checked_in(session, test_user, test_instructor, test_aircraft):
+    test_aircraft.time_to_next_oil_change = 38.0
+    test_aircraft.time_to_next_100hr = 78.0
+    start = datetime(2030, 5, 1, 9)
+    booking = Booking(student_id=test_user.id, instructor_id=test_instructor.id,
+                      aircraft_id=test_aircraft.id, start_time=start,
+                      end_time=start + timedelta(hours=2), status='in_progress')
+    session.add(booking)
+    session.flush()
+    session.add(CheckIn(booking_id=booking.id, aircraft_id=test_aircraft.id,
+                        check_in_time=start, hobbs_start=2345.6, tach_start=2300.4))
+    session.commit()
+    return booking
+
+
+def test_check_out_updates_counters_and_bills(app, session, checked_in, test_aircraft):
+    complete_check_out(checked_in, hobbs_end=2347.1, tach_end=2301.6, notes='Pattern work')
+
+    assert checked_in.status == 'completed'
+    assert CheckOut.query.filter_by(booking_id=checked_in.id).count() == 1
+    assert (test_aircraft.hobbs_time, test_aircraft.tach_time) == (2347.1, 2301.6)
+    assert test_aircraft.time_to_next_oil_change == pytest.approx(36.5)
+    assert test_aircraft.time_to_next_100hr == pytest.approx(76.5)
+
+    log = FlightLog.query.filter_by(booking_id=checked_in.id).one()
+    assert (log.user_id, log.dual_received, log.pic_time) == (checked_in.student_id, 1.5, None)
+
+    invoice = Invoice.query.filter_by(booking_id=checked_in.id).one()
+    assert invoice.invoice_number == f'INV-{checked_in.id:06d}'
+    assert (invoice.aircraft_time, invoice.aircraft_total) == (1.5, 225.0)
+    assert (invoice.instructor_rate, invoice.instructor_total) == (75.0, 112.5)
+    assert invoice.total_amount == 337.5
+
+
+def test_consecutive_flights_both_count(app, session, checked_in, test_user, test_aircraft):
+    complete_check_out(checked_in, hobbs_end=2347.1, tach_end=2301.6)
+    start = datetime(2030, 5, 2, 9)
+    second = Booking(student_id=test_user.id, aircraft_id=test_aircraft.id, start_time=start,
+                     end_time=start + timedelta(hours=1), status='in_progress')
+    session.add(second)
+    session.flush()
+    session.add(CheckIn(booking_id=second.id, aircraft_id=test_aircraft.id,
+                        check_in_time=start, hobbs_start=2347.1, tach_start=2301.6))
+    session.commit()
+
+    complete_check_out(second, hobbs_end=2348.1, tach_end=2302.4)
+    assert test_aircraft.time_to_next_100hr == pytest.approx(75.5)
+    log = FlightLog.query.filter_by(booking_id=second.id).one()
+    assert (log.dual_received, log.pic_time) == (None, 1.0)
+    assert Invoice.query.filter_by(booking_id=second.id).one().instructor_total is None
+
+
+def test_failed_check_out_changes_nothing(app, session, checked_in, test_aircraft):
+    with pytest.raises(CheckOutError):
+        complete_check_out(checked_in, hobbs_end=2340.0, tach_end=2301.6)
+
+    assert checked_in.status == 'in_progress'
+    assert test_aircraft.time_to_next_100hr == 78.0
+    assert CheckOut.query.count() == FlightLog.query.count() == Invoice.query.count() == 0
+
+    complete_check_out(checked_in, hobbs_end=2347.1, tach_end=2301.6)
+    with pytest.raises(CheckOutError):
+        complete_check_out(checked_in, hobbs_end=2348.0, tach_end=2302.0)
+    assert Invoice.query.count() == 1
@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from app.currency import RULES, evaluate_currency
+from app.models import Booking, FlightLog, User
+
+NOW = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+RULE = {rule.name: rule for rule in RULES}
+
+
+def _log(session, booking, when, student_id=None, **values):
+    log = FlightLog(booking_id=booking.id, aircraft_id=booking.aircraft_id,
+                    user_id=student_id or booking.student_id, flight_date=when, **values)
+    session.add(log)
+    session.commit()
+    return log
+
+
+@pytest.fixture
+def booking(session, test_user, test_instructor, test_aircraft):
+    booking = Booking(student_id=test_user.id, instructor_id=test_instructor.id,
+                      aircraft_id=test_aircraft.id, status='completed',
+                      start_time=NOW - timedelta(days=1), end_time=NOW - timedelta(hours=23))
+    session.add(booking)
+    session.commit()
+    return booking
+
+
+def test_landing_rules_lapse_ninety_days_after_the_third_landing():
+    flights = [(NOW - timedelta(days=10), {'landings': 1, 'landings_night': 1}),
+               (NOW - timedelta(days=40), {'landings': 2, 'landings_night': 0}),
+               (NOW - timedelta(days=100), {'landings': 5, 'landings_night': 5})]
+    status = RULE['passengers'].evaluate(flights, NOW)
+    assert status.current
+    assert status.expires_at == NOW - timedelta(days=40) + timedelta(days=90)
+    assert status.counts == {'landings': 3}
+    # The night landings 100 days ago no longer count
+    night = RULE['night'].evaluate(flights, NOW)
+    assert (night.current, night.expires_at, night.counts) == (False, None, {'landings_night': 1})
+
+
+def test_instrument_rule_uses_calendar_months():
+    now = datetime(2026, 10, 18)
+    flights = [(datetime(2026, 9, 2), {'approaches': 2, 'holds': 1}),
+               (datetime(2026, 4, 30), {'approaches': 4, 'holds': 0}),
+               (datetime(2026, 3, 31), {'approaches': 6, 'holds': 1})]
+    status = RULE['instrument'].evaluate(flights, now)
+    assert status.current
+    # April's approaches count through the end of October
+    assert status.expires_at == datetime(2026, 11, 1)
+    assert status.counts == {'approaches': 6, 'holds': 1}
+    assert not RULE['instrument'].evaluate(flights, datetime(2026, 11, 1)).current
+
+
+def test_all_students_are_evaluated_in_one_query(app, session, booking, test_user,
+                                                 test_instructor, count_queries):
+    other = User(email='other@example.com', first_name='Other', last_name='Student')
+    other.set_password('password123')
+    session.add(other)
+    session.commit()
+    for days_ago in (5, 6, 7):
+        _log(session, booking, NOW - timedelta(days=days_ago), landings_day=1)
+    _log(session, booking, NOW - timedelta(days=3), student_id=other.id, landings_night=3)
+    user_ids = [test_user.id, other.id, test_instructor.id]
+
+    with count_queries() as statements:
+        currency = evaluate_currency(user_ids)
+    assert len(statements) == 1
+    assert currency[test_user.id]['passengers'].current
+    assert not currency[test_user.id]['night'].current
+    assert currency[other.id]['night'].current
+    assert not any(status.current for status in currency[test_instructor.id].values())
+
+    # A second read comes from the cache
+    with count_queries() as statements:
+        assert evaluate_currency(user_ids) == currency
+    assert statements == []
+
+
+def test_flight_log_writes_invalidate_the_pilot(app, session, booking, test_user):
+    user_id = test_user.id
+    assert not evaluate_currency([user_id])[user_id]['passengers'].current
+
+    log = _log(session, booking, NOW - timedelta(days=2), landings_day=2)
+    assert not evaluate_currency([user_id])[user_id]['passengers'].current
+    log.landings_day = 3
+    session.commit()
+    assert evaluate_currency([user_id])[user_id]['passengers'].current
+
+    session.delete(log)
+    session.commit()
+    assert not evaluate_currency([user_id])[user_id]['passengers'].current
+
+
+def test_students_page_and_booking_form_show_currency(app, session, client, booking, test_user,
+                                                      test_instructor):
+    with client.session_transaction() as sess:
+        sess['_user_id'] = test_instructor.id
+        sess['_fresh'] = True
+    response = client.get('/instructor/students')
+    assert response.status_code == 200
+    assert test_user.last_name.encode() in response.data
+    assert b'Not current' in response.data
+
+    with client.session_transaction() as sess:
+        sess['_user_id'] = test_user.id
+    response = client.get('/create')
+    assert response.status_code == 200
+    assert b'You are not current for' in response.data
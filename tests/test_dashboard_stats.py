@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+from app.models import User, Aircraft, Booking, DashboardStats
+from app.dashboard_stats import get_dashboard_stats, rebuild_dashboard_stats
+
+
+def _recount():
+    """Return the counters a full rebuild would produce, without keeping them."""
+    return {
+        'total_users': User.query.count(),
+        'active_users': User.query.filter_by(status='active').count(),
+        'total_aircraft': Aircraft.query.count(),
+        'available_aircraft': Aircraft.query.filter_by(status='available').count(),
+        'pending_bookings': Booking.query.filter_by(status='pending').count(),
+    }
+
+
+def _snapshot(session):
+    stats = get_dashboard_stats()
+    session.expire_all()
+    return stats
+
+
+def test_counters_follow_inserts_updates_and_deletes(session, test_user, test_aircraft):
+    rebuild_dashboard_stats()
+    before = _snapshot(session)
+
+    start = datetime(2024, 6, 1, 9, 0)
+    booking = Booking(student_id=test_user.id, aircraft_id=test_aircraft.id,
+                      start_time=start, end_time=start + timedelta(hours=1),
+                      status='pending')
+    aircraft = Aircraft(registration='N999ZZ', make='Piper', model='PA-28',
+                        rate_per_hour=120.0, status='available')
+    session.add_all([booking, aircraft])
+    session.commit()
+    after_insert = _snapshot(session)
+    assert after_insert['pending_bookings'] == before['pending_bookings'] + 1
+    assert after_insert['total_aircraft'] == before['total_aircraft'] + 1
+    assert after_insert['available_aircraft'] == before['available_aircraft'] + 1
+
+    booking.status = 'confirmed'
+    aircraft.status = 'maintenance'
+    test_user.status = 'inactive'
+    session.commit()
+    after_update = _snapshot(session)
+    assert after_update['pending_bookings'] == before['pending_bookings']
+    assert after_update['available_aircraft'] == before['available_aircraft']
+    assert after_update['active_users'] == before['active_users'] - 1
+    assert after_update['total_users'] == before['total_users']
+
+    session.delete(aircraft)
+    session.commit()
+    after_delete = _snapshot(session)
+    assert after_delete['total_aircraft'] == before['total_aircraft']
+
+    for name, count in _recount().items():
+        assert after_delete[name] == count
+
+
+def test_first_read_builds_snapshot(session, test_user):
+    DashboardStats.query.delete()
+    session.commit()
+    stats = get_dashboard_stats()
+    assert stats['total_users'] == User.query.count()
+    assert session.get(DashboardStats, 1) is not None
+
+
+def test_dashboard_tabs_load_separately(admin_client, test_instructor, test_aircraft):
+    resp = admin_client.get('/admin/dashboard')
+    assert resp.status_code == 200
+    assert b'/admin/dashboard/tab/instructors' in resp.data
+    assert test_instructor.email.encode() not in resp.data
+
+    resp = admin_client.get('/admin/dashboard/tab/instructors')
+    assert resp.status_code == 200
+    assert test_instructor.email.encode() in resp.data
+
+    resp = admin_client.get('/admin/dashboard/tab/aircraft')
+    assert test_aircraft.registration.encode() in resp.data
+
+    assert admin_client.get('/admin/dashboard/tab/nope').status_code == 404
@@ -7,7 +7,10 @@ and UTC times are properly converted back to local time for display.
 import pytest
 from datetime import datetime, timedelta, timezone
 import pytz
-from app.utils.datetime_utils import utcnow, to_utc, from_utc, format_datetime
+from app.utils.datetime_utils import (
+    utcnow, to_utc, from_utc, format_datetime, format_datetimes, from_utc_many,
+    get_local_timezone, get_system_timezone
+)
 
 def test_utc_to_local_conversion():
     """
@@ -99,3 +102,50 @@ def test_utcnow_function():
     now_via_stdlib = datetime.now(timezone.utc)
     time_difference = abs((now - now_via_stdlib).total_seconds())
     assert time_difference < 5  # Less than 5 seconds difference
+
+
+def test_timezone_resolution_order(app, test_user):
+    """
+    Test that a user's timezone wins over the school timezone.
+    """
+    app.config['SCHOOL_TIMEZONE'] = 'America/Denver'
+    assert get_local_timezone(test_user).zone == 'America/Denver'
+
+    test_user.timezone = 'Europe/London'
+    assert get_local_timezone(test_user).zone == 'Europe/London'
+
+    # Unknown names fall through to the next source
+    test_user.timezone = 'Mars/Olympus_Mons'
+    assert get_local_timezone(test_user).zone == 'America/Denver'
+
+    app.config['SCHOOL_TIMEZONE'] = None
+    assert get_local_timezone(test_user) is get_system_timezone()
+
+
+def test_bulk_conversion_matches_single_values():
+    """
+    Test that the list helpers agree with the per-value functions.
+    """
+    tz = pytz.timezone('Pacific/Auckland')
+    values = [datetime(2025, 4, 25, 1, 30) + timedelta(hours=i) for i in range(3)] + [None]
+    assert format_datetimes(values, '%H:%M', tz=tz) == ['13:30', '14:30', '15:30', '']
+    assert from_utc_many(values, as_naive=True, tz=tz) == [
+        from_utc(value, as_naive=True, tz=tz) for value in values
+    ]
+
+
+def test_account_settings_saves_timezone(auth_client, test_user):
+    """
+    Test that users can pick their own display timezone.
+    """
+    resp = auth_client.post('/auth/account-settings', data={
+        'first_name': 'Test', 'last_name': 'Student', 'timezone': 'Nowhere/Special'
+    })
+    assert resp.status_code == 200
+    assert test_user.timezone is None
+
+    resp = auth_client.post('/auth/account-settings', data={
+        'first_name': 'Test', 'last_name': 'Student', 'timezone': 'Asia/Tokyo'
+    })
+    assert resp.status_code == 302
+    assert test_user.timezone == 'Asia/Tokyo'
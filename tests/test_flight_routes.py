@@ -231,6 +231,10 @@ def test_flight_check_out(client):
         aircraft = Aircraft.query.get(aircraft_id)
         assert aircraft.hobbs_time == 101.5
         assert aircraft.tach_time == 91.2
+        assert aircraft.time_to_next_oil_change == 38.5
+        assert aircraft.time_to_next_100hr == 78.5
+        assert booking.invoice is not None
+        assert booking.flight_log is not None
 
 def test_flight_check_out_with_squawk(client):
     """Test the flight check-out process with squawk reporting."""
@@ -0,0 +1,243 @@
+from datetime import datetime, timedelta, timezone
+import json
+import logging.config
+import os
+import google.oauth2.credentials
+from flask_migrate import upgrade
+import pytest
+from sqlalchemy import inspect, text
+from app import calendar_service, db
+from app.calendar_service import GoogleCalendarService, refresh_expiring_credentials, service_cache
+from app.models import Booking, GoogleCalendarEvent
+from tests.fake_google_calendar import FakeCalendar
+
+MIGRATIONS = os.path.join(os.path.dirname(__file__), os.pardir, 'migrations')
+
+
+@pytest.fixture
+def fake_calendar(app):
+    fake = FakeCalendar().start()
+    app.config['GOOGLE_CALENDAR_API_ENDPOINT'] = fake.endpoint
+    service_cache.clear()
+    yield fake
+    service_cache.clear()
+    fake.stop()
+
+
+@pytest.fixture
+def connected_user(session, test_user):
+    test_user.google_calendar_enabled = True
+    test_user.google_calendar_credentials = json.dumps({
+        'token': 'access-token', 'refresh_token': 'refresh-token',
+        'client_id': 'client', 'client_secret': 'secret', 'expiry': '2099-01-01T00:00:00Z',
+    })
+    session.commit()
+    return test_user
+
+
+def _bookings(session, user, aircraft, count):
+    start = datetime(2030, 5, 1, 9)
+    bookings = [
+        Booking(student_id=user.id, aircraft_id=aircraft.id, status='confirmed',
+                start_time=start + timedelta(days=day), end_time=start + timedelta(days=day, hours=2))
+        for day in range(count)
+    ]
+    session.add_all(bookings)
+    session.commit()
+    return bookings
+
+
+def test_first_sync_batches_inserts(app, session, fake_calendar, connected_user, test_aircraft):
+    _bookings(session, connected_user, test_aircraft, 3)
+
+    assert GoogleCalendarService().sync_all_bookings(connected_user) == 3
+    assert fake_calendar.round_trips == [('POST', '/batch/calendar/v3')]
+    assert len(fake_calendar.events) == 3
+    assert GoogleCalendarEvent.query.filter_by(user_id=connected_user.id).count() == 3
+    assert next(iter(fake_calendar.events.values()))['summary'] == 'Flight Training - N12345'
+
+    # Nothing changed, so nothing is sent
+    assert GoogleCalendarService().sync_all_bookings(connected_user) == 0
+    assert len(fake_calendar.round_trips) == 1
+
+
+def test_only_changed_bookings_are_sent(app, session, fake_calendar, connected_user, test_aircraft):
+    moved, cancelled, untouched = _bookings(session, connected_user, test_aircraft, 3)
+    GoogleCalendarService().sync_all_bookings(connected_user)
+    fake_calendar.operations.clear()
+
+    moved.end_time += timedelta(hours=1)
+    cancelled.status = 'cancelled'
+    session.commit()
+
+    assert GoogleCalendarService().sync_all_bookings(connected_user) == 2
+    assert sorted(method for method, _ in fake_calendar.operations) == ['DELETE', 'PUT']
+    assert len(fake_calendar.events) == 2
+    assert {e.booking_id for e in GoogleCalendarEvent.query} == {moved.id, untouched.id}
+
+
+def test_event_deleted_in_calendar_is_recreated(app, session, fake_calendar, connected_user, test_aircraft):
+    booking, = _bookings(session, connected_user, test_aircraft, 1)
+    GoogleCalendarService().sync_all_bookings(connected_user)
+    fake_calendar.events.clear()
+
+    booking.notes = 'Bring headset'
+    session.commit()
+    GoogleCalendarService().sync_all_bookings(connected_user)
+
+    assert len(fake_calendar.events) == 1
+    mapping = GoogleCalendarEvent.query.one()
+    assert mapping.event_id in fake_calendar.events
+
+
+def test_late_commits_inside_the_overlap_are_picked_up(app, session, fake_calendar, connected_user,
+                                                       test_aircraft):
+    _bookings(session, connected_user, test_aircraft, 2)
+    GoogleCalendarService().sync_all_bookings(connected_user)
+    fake_calendar.operations.clear()
+
+    # Stamped before the last sync but committed after it
+    late = Booking(student_id=connected_user.id, aircraft_id=test_aircraft.id, status='confirmed',
+                   start_time=datetime(2030, 6, 1, 9), end_time=datetime(2030, 6, 1, 11),
+                   updated_at=connected_user.google_calendar_synced_at - timedelta(minutes=1))
+    session.add(late)
+    session.commit()
+
+    # Bookings already pushed are rescanned but not resent
+    assert GoogleCalendarService().sync_all_bookings(connected_user) == 1
+    assert fake_calendar.operations == [('POST', None)]
+    assert GoogleCalendarEvent.query.filter_by(booking_id=late.id).count() == 1
+
+
+def test_events_are_removed_when_bookings_leave_the_calendar(app, session, fake_calendar,
+                                                             connected_user, admin_user, test_aircraft):
+    reassigned, deleted, kept = _bookings(session, connected_user, test_aircraft, 3)
+    GoogleCalendarService().sync_all_bookings(connected_user)
+
+    reassigned.student_id = admin_user.id
+    session.execute(Booking.__table__.delete().where(Booking.id == deleted.id))
+    session.commit()
+
+    assert GoogleCalendarService().sync_all_bookings(connected_user) == 2
+    assert len(fake_calendar.events) == 1
+    assert [e.booking_id for e in GoogleCalendarEvent.query] == [kept.id]
+
+
+def test_legacy_event_ids_are_migrated(app, session, fake_calendar, connected_user, test_aircraft,
+                                      monkeypatch):
+    booking, = _bookings(session, connected_user, test_aircraft, 1)
+    legacy = GoogleCalendarService()
+    legacy._initialize_service(connected_user)
+    event_id = legacy.create_event(booking, connected_user)
+    # Put the schema back as it was before the migration
+    session.execute(text('DROP TABLE google_calendar_event'))
+    session.execute(text('ALTER TABLE users DROP COLUMN google_calendar_synced_at'))
+    session.execute(text('ALTER TABLE booking ADD COLUMN google_calendar_event_id VARCHAR(255)'))
+    session.execute(text('UPDATE booking SET google_calendar_event_id = :event_id'), {'event_id': event_id})
+    session.commit()
+
+    # Keep the test run's logging configuration
+    monkeypatch.setattr(logging.config, 'fileConfig', lambda *args, **kwargs: None)
+    upgrade(directory=MIGRATIONS, revision='3b7e0c2f9a41')
+
+    assert 'google_calendar_event_id' not in {c['name'] for c in inspect(db.engine).get_columns('booking')}
+    assert [(e.user_id, e.event_id) for e in GoogleCalendarEvent.query] == [(connected_user.id, event_id)]
+
+    # The seeded event is updated in place rather than inserted again
+    fake_calendar.operations.clear()
+    assert GoogleCalendarService().sync_all_bookings(connected_user) == 1
+    assert fake_calendar.operations == [('PUT', event_id)]
+    assert list(fake_calendar.events) == [event_id]
+
+
+def test_large_syncs_are_split_into_batches(app, session, fake_calendar, connected_user,
+                                            test_aircraft, monkeypatch):
+    monkeypatch.setattr(calendar_service, 'MAX_BATCH_SIZE', 2)
+    _bookings(session, connected_user, test_aircraft, 5)
+
+    GoogleCalendarService().sync_all_bookings(connected_user)
+    assert len(fake_calendar.round_trips) == 3
+    assert len(fake_calendar.events) == 5
+
+
+def test_built_client_is_reused_across_syncs(app, session, fake_calendar, connected_user):
+    first = GoogleCalendarService()
+    first._initialize_service(connected_user)
+    second = GoogleCalendarService()
+    second._initialize_service(connected_user)
+    assert second.service is first.service
+
+    # New credentials mean a new client
+    connected_user.google_calendar_credentials = json.dumps({
+        'token': 'other-token', 'refresh_token': 'refresh-token',
+        'client_id': 'client', 'client_secret': 'secret', 'expiry': '2099-01-01T00:00:00Z',
+    })
+    third = GoogleCalendarService()
+    third._initialize_service(connected_user)
+    assert third.service is not first.service
+
+
+@pytest.fixture
+def fake_token_endpoint(fake_calendar, monkeypatch):
+    # from_authorized_user_info always uses Google's token endpoint
+    monkeypatch.setattr(google.oauth2.credentials, '_GOOGLE_OAUTH2_TOKEN_ENDPOINT', fake_calendar.token_uri)
+    return fake_calendar
+
+
+def _credentials(fake, token, expiry):
+    return json.dumps({
+        'token': token, 'refresh_token': 'refresh-token',
+        'client_id': 'client', 'client_secret': 'secret',
+        'expiry': expiry.strftime('%Y-%m-%dT%H:%M:%SZ'),
+    })
+
+
+def test_discovery_document_is_parsed_once(app, session, fake_calendar, connected_user,
+                                           test_instructor, monkeypatch):
+    calls = []
+    original = calendar_service.get_static_doc
+    monkeypatch.setattr(calendar_service, 'get_static_doc',
+                        lambda *args: calls.append(args) or original(*args))
+    calendar_service.get_discovery_document.cache_clear()
+
+    test_instructor.google_calendar_credentials = connected_user.google_calendar_credentials
+    GoogleCalendarService()._initialize_service(connected_user)
+    GoogleCalendarService()._initialize_service(test_instructor)
+    assert calls == [('calendar', 'v3')]
+
+
+def test_expired_token_is_refreshed_on_use(app, session, fake_calendar, fake_token_endpoint,
+                                           connected_user):
+    connected_user.google_calendar_credentials = _credentials(
+        fake_calendar, 'stale', datetime.now(timezone.utc) - timedelta(minutes=5))
+    session.commit()
+
+    service = GoogleCalendarService()
+    service._initialize_service(connected_user)
+    assert service.credentials.token == 'token1'
+    assert connected_user.google_calendar_token == 'token1'
+    assert json.loads(connected_user.google_calendar_credentials)['token'] == 'token1'
+
+
+def test_tokens_near_expiry_are_refreshed_in_background(app, session, fake_calendar, fake_token_endpoint,
+                                                        connected_user, test_instructor):
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    connected_user.google_calendar_credentials = _credentials(
+        fake_calendar, 'expiring', now + timedelta(minutes=4, seconds=30))
+    test_instructor.google_calendar_enabled = True
+    test_instructor.google_calendar_credentials = _credentials(
+        fake_calendar, 'fresh', now + timedelta(hours=1))
+    session.commit()
+    service = GoogleCalendarService()
+    service._initialize_service(connected_user)
+    GoogleCalendarService()._initialize_service(test_instructor)
+    assert connected_user.google_calendar_token_expiry is not None
+
+    assert refresh_expiring_credentials(now) == 1
+    assert fake_calendar.issued_tokens == ['token1']
+    assert test_instructor.google_calendar_token == 'fresh'
+    # The cached client picked up the new token without being rebuilt
+    reused = GoogleCalendarService()
+    reused._initialize_service(connected_user)
+    assert reused.service is service.service
+    assert reused.credentials.token == 'token1'
@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from app.jobs import TASKS, claim_job, enqueue, run_pending, task
+from app.models import Job
+
+calls = []
+
+
+@task('test_record')
+def record(value):
+    calls.append(value)
+
+
+@task('test_fail')
+def fail():
+    raise RuntimeError('third party is down')
+
+
+@pytest.fixture(autouse=True)
+def reset_calls():
+    calls.clear()
+    yield
+
+
+def test_enqueued_job_runs_once_committed(app, session):
+    enqueue('test_record', value=42)
+    session.commit()
+    assert calls == []
+
+    assert run_pending() == 1
+    assert calls == [42]
+    job = Job.query.one()
+    assert (job.status, job.attempts) == ('done', 1)
+    assert run_pending() == 0
+
+
+def test_rolled_back_job_is_never_queued(app, session):
+    enqueue('test_record', value=1)
+    session.rollback()
+    assert Job.query.count() == 0
+
+
+def test_failed_job_backs_off_then_dead_letters(app, session):
+    app.config['JOBS_BACKOFF_SECONDS'] = 10
+    enqueue('test_fail', max_attempts=2)
+    session.commit()
+    now = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(minutes=1)
+
+    assert run_pending(now) == 1
+    job = Job.query.one()
+    assert (job.status, job.attempts) == ('queued', 1)
+    assert job.run_at == now + timedelta(seconds=10)
+    assert 'third party is down' in job.last_error
+    # Not due again until the backoff has passed
+    assert run_pending(now + timedelta(seconds=5)) == 0
+
+    assert run_pending(now + timedelta(seconds=10)) == 1
+    session.refresh(job)
+    assert (job.status, job.attempts) == ('dead', 2)
+
+
+def test_unknown_task_cannot_be_enqueued(app, session):
+    with pytest.raises(ValueError):
+        enqueue('no_such_task')
+
+
+def test_abandoned_running_job_is_reclaimed(app, session):
+    enqueue('test_record', value=7)
+    session.commit()
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    job = claim_job(now + timedelta(days=1))
+    assert job.status == 'running'
+    # A second worker cannot take it while the lock is fresh
+    assert claim_job(now + timedelta(days=1, seconds=1)) is None
+
+    reclaimed = claim_job(now + timedelta(days=1, seconds=app.config.get('JOBS_LOCK_TIMEOUT', 600) + 1))
+    assert (reclaimed.id, reclaimed.attempts) == (job.id, 2)
+
+
+def test_worker_cli_runs_due_jobs(app, session):
+    enqueue('test_record', value='cli')
+    session.commit()
+    result = app.test_cli_runner().invoke(args=['jobs', 'worker', '--burst'])
+    assert 'Ran 1 jobs' in result.output
+    assert calls == ['cli']
+
+
+def test_retry_dead_requeues_jobs(app, session):
+    session.add(Job(name='test_record', payload={'value': 'again'}, status='dead', attempts=5))
+    session.commit()
+    result = app.test_cli_runner().invoke(args=['jobs', 'retry-dead'])
+    assert 'Requeued 1 jobs' in result.output
+    assert run_pending() == 1
+    assert calls == ['again']
+
+
+def test_application_tasks_are_registered(app):
+    assert {'send_email', 'match_waitlist', 'sync_google_calendar'} <= set(TASKS)
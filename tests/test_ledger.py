@@ -0,0 +1,140 @@
+from datetime import datetime, timedelta
+import pytest
+from app.billing import run_billing
+from app.checkout_service import complete_check_out
+from app.ledger import LedgerError, account_balance, post_entry
+from app.models import Booking, LedgerEntry, LedgerSnapshot, RecurringBooking
+
+
+def test_entries_are_signed_by_type(app, session, test_user):
+    post_entry(test_user.id, 'deposit', 500)
+    post_entry(test_user.id, 'refund', 120.5)
+    post_entry(test_user.id, 'adjustment', -4.5)
+    session.commit()
+    assert [e.amount for e in LedgerEntry.query.order_by(LedgerEntry.id)] == [500.0, -120.5, -4.5]
+    assert account_balance(test_user.id) == 375.0
+
+    with pytest.raises(LedgerError):
+        post_entry(test_user.id, 'gift', 10)
+    with pytest.raises(LedgerError):
+        post_entry(test_user.id, 'deposit', 0)
+    for amount in ('nan', 'inf', '-inf'):
+        with pytest.raises(LedgerError):
+            post_entry(test_user.id, 'adjustment', amount)
+
+
+def test_invoices_are_charged_once(app, session, book_flight, test_user, test_instructor,
+                                   test_aircraft):
+    post_entry(test_user.id, 'deposit', 1000)
+    session.commit()
+    booking = book_flight(test_user, test_aircraft, test_instructor, hobbs_start=100.0)
+    complete_check_out(booking, hobbs_end=101.5, tach_end=101.5)
+    charge = LedgerEntry.query.filter_by(entry_type='charge').one()
+    assert (charge.amount, charge.invoice_id) == (-337.5, booking.invoice.id)
+    assert account_balance(test_user.id) == 662.5
+
+    # The billing run charges the invoices it inserts with the same query
+    book_flight(test_user, test_aircraft, days=1, hobbs_start=101.5, hours=1.0)
+    assert run_billing() == 1
+    assert LedgerEntry.query.filter_by(entry_type='charge').count() == 2
+    assert account_balance(test_user.id) == 512.5
+
+
+def test_balance_is_snapshot_plus_short_tail(app, session, test_user, count_queries):
+    app.config['LEDGER_SNAPSHOT_INTERVAL'] = 3
+    user_id = test_user.id
+    for amount in range(1, 8):
+        post_entry(user_id, 'deposit', amount)
+    session.commit()
+
+    snapshots = LedgerSnapshot.query.order_by(LedgerSnapshot.through_entry_id).all()
+    assert [s.balance for s in snapshots] == [6.0, 21.0]
+    with count_queries() as statements:
+        assert account_balance(user_id) == 28.0
+    assert len(statements) == 1
+
+    result = app.test_cli_runner().invoke(args=['snapshot-ledgers'])
+    assert 'Snapshot 1 accounts' in result.output
+    assert LedgerSnapshot.query.count() == 3
+    assert account_balance(user_id) == 28.0
+
+
+def test_entries_lock_the_account_first(app, session, test_user, count_queries):
+    with count_queries() as statements:
+        post_entry(test_user.id, 'deposit', 100)
+    # SQLite drops the FOR UPDATE, but the lock is still taken before the insert
+    lock = next(i for i, s in enumerate(statements) if s.startswith('SELECT users.id \nFROM users'))
+    assert statements[lock + 1].startswith('INSERT INTO account_ledger ')
+    session.rollback()
+
+
+def test_admin_records_deposit(app, session, admin_client, test_user):
+    response = admin_client.post(f'/admin/user/{test_user.id}/account',
+                                 data={'entry_type': 'deposit', 'amount': '250',
+                                       'description': 'Check #1001'},
+                                 follow_redirects=True)
+    assert response.status_code == 200
+    assert b'Check #1001' in response.data
+    assert b'$250.00' in response.data
+    assert account_balance(test_user.id) == 250.0
+
+    response = admin_client.post(f'/admin/user/{test_user.id}/account',
+                                 data={'entry_type': 'deposit', 'amount': 'nan'},
+                                 follow_redirects=True)
+    assert response.status_code == 200
+    assert b'A ledger entry needs a finite amount.' in response.data
+    assert LedgerEntry.query.count() == 1
+
+
+def test_prepaid_bookings_need_funds(app, session, auth_client, test_user, test_aircraft):
+    app.config['REQUIRE_PREPAID_BALANCE'] = True
+    start = datetime.now() + timedelta(days=3)
+    data = {'aircraft_id': test_aircraft.id, 'instructor_id': 0,
+            'start_time': start.strftime('%Y-%m-%dT%H:00'), 'duration': 60, 'notes': ''}
+
+    response = auth_client.post('/create', data=data, follow_redirects=True)
+    assert b'does not cover this flight' in response.data
+    assert Booking.query.count() == 0
+
+    post_entry(test_user.id, 'deposit', 150)
+    session.commit()
+    auth_client.post('/create', data=data, follow_redirects=True)
+    assert Booking.query.count() == 1
+
+    # The pending booking already spends the deposit
+    later = start + timedelta(days=1)
+    response = auth_client.post('/create', data=dict(data, start_time=later.strftime('%Y-%m-%dT%H:00')),
+                                follow_redirects=True)
+    assert b'does not cover this flight' in response.data
+    assert Booking.query.count() == 1
+
+
+def test_booking_locks_its_parties_before_checking(app, session, auth_client, test_user,
+                                                   test_instructor, test_aircraft, count_queries):
+    app.config['REQUIRE_PREPAID_BALANCE'] = True
+    start = datetime.now() + timedelta(days=3)
+    with count_queries() as statements:
+        auth_client.post('/create', data={
+            'aircraft_id': test_aircraft.id, 'instructor_id': test_instructor.id,
+            'start_time': start.strftime('%Y-%m-%dT%H:00'), 'duration': 60, 'notes': ''
+        })
+    # SQLite drops the FOR UPDATE; the locks still come before the checks
+    aircraft_lock = statements.index(
+        'SELECT aircraft.id \nFROM aircraft \nWHERE aircraft.id = ?')
+    users_lock = next(i for i, s in enumerate(statements)
+                      if s.startswith('SELECT users.id \nFROM users \nWHERE users.id IN'))
+    first_check = next(i for i, s in enumerate(statements) if 'FROM booking' in s)
+    assert aircraft_lock < users_lock < first_check
+
+
+def test_prepaid_recurring_bookings_need_funds(app, session, auth_client, test_user, test_aircraft):
+    app.config['REQUIRE_PREPAID_BALANCE'] = True
+    post_entry(test_user.id, 'deposit', 300)
+    session.commit()
+    start_date = (datetime.now() + timedelta(days=7)).strftime('%Y-%m-%d')
+    response = auth_client.post('/recurring/create', data={
+        'aircraft_id': test_aircraft.id, 'instructor_id': 0, 'day_of_week': 2,
+        'start_time': '10:00', 'duration_hours': 1.0, 'start_date': start_date
+    }, follow_redirects=True)
+    assert b'does not cover the' in response.data
+    assert RecurringBooking.query.count() == Booking.query.count() == 0
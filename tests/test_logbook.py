@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from app.logbook import get_logbook_totals, rebuild_rollup
+from app.models import Booking, FlightLog, LogbookRollup
+
+NOW = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+
+
+@pytest.fixture
+def booking(session, test_user, test_aircraft):
+    booking = Booking(student_id=test_user.id, aircraft_id=test_aircraft.id, status='completed',
+                      start_time=NOW - timedelta(days=1), end_time=NOW - timedelta(days=1, hours=-1))
+    session.add(booking)
+    session.commit()
+    return booking
+
+
+def _log(session, booking, days_ago, **values):
+    log = FlightLog(booking_id=booking.id, aircraft_id=booking.aircraft_id,
+                    user_id=booking.student_id, flight_date=NOW - timedelta(days=days_ago),
+                    **values)
+    session.add(log)
+    session.commit()
+    return log
+
+
+def _assert_matches_rebuild(session, user_id):
+    totals = get_logbook_totals(user_id)
+    incremental = {period: (r.flights, r.total_time, r.landings) for period, r in totals.items()}
+    for period, (flights, total_time, landings) in incremental.items():
+        rebuilt = rebuild_rollup(user_id, period)
+        assert (rebuilt.flights, rebuilt.landings) == (flights, landings)
+        assert rebuilt.total_time == pytest.approx(total_time)
+    session.rollback()
+
+
+def test_writes_adjust_rollups_incrementally(app, session, booking, test_user):
+    _log(session, booking, 200, pic_time=1.0, landings_day=2)
+    totals = get_logbook_totals(test_user.id)
+    assert (totals['all'].flights, totals['12m'].flights, totals['90d'].flights) == (1, 1, 0)
+
+    recent = _log(session, booking, 10, dual_received=1.5, night=1.0, landings_night=3)
+    totals = get_logbook_totals(test_user.id)
+    assert totals['all'].total_time == 2.5
+    assert (totals['30d'].flights, totals['30d'].night, totals['30d'].landings) == (1, 1.0, 3)
+    assert totals['12m'].landings == 5
+
+    recent.landings_night = 1
+    session.commit()
+    assert get_logbook_totals(test_user.id)['30d'].landings == 1
+
+    # Moving a flight out of the window takes it out of the rollup
+    recent.flight_date = NOW - timedelta(days=45)
+    session.commit()
+    totals = get_logbook_totals(test_user.id)
+    assert (totals['30d'].flights, totals['90d'].flights) == (0, 1)
+
+    session.delete(recent)
+    session.commit()
+    totals = get_logbook_totals(test_user.id)
+    assert (totals['all'].flights, totals['all'].total_time, totals['90d'].flights) == (1, 1.0, 0)
+    _assert_matches_rebuild(session, test_user.id)
+
+
+def test_reads_are_one_query_until_a_flight_ages_out(app, session, booking, test_user,
+                                                     count_queries):
+    user_id = test_user.id
+    _log(session, booking, 20, pic_time=1.2, landings_day=1)
+    get_logbook_totals(user_id)
+
+    with count_queries() as statements:
+        totals = get_logbook_totals(user_id)
+    assert len(statements) == 1
+    assert totals['30d'].stale_after == NOW + timedelta(days=10)
+
+    # Eleven days on, the flight has left the 30-day window
+    later = get_logbook_totals(user_id, now=NOW + timedelta(days=11))
+    assert (later['30d'].flights, later['90d'].flights) == (0, 1)
+    assert later['30d'].stale_after is None
+
+
+def test_rebuild_overwrites_a_row_written_concurrently(app, session, booking, test_user):
+    _log(session, booking, 5, pic_time=1.0, landings_day=1)
+    session.execute(LogbookRollup.__table__.delete())
+    # Another request built the row after this one found it missing
+    session.execute(LogbookRollup.__table__.insert().values(user_id=test_user.id, period='all', flights=7))
+
+    rollup = rebuild_rollup(test_user.id, 'all')
+    session.commit()
+    assert (rollup.flights, rollup.landings) == (1, 1)
+    assert LogbookRollup.query.filter_by(user_id=test_user.id).count() == 1
+
+
+def test_flight_logs_page_shows_totals(app, session, auth_client, booking, test_user):
+    _log(session, booking, 5, route='KPAO KSQL', pic_time=1.3, cross_country=1.3, landings_day=2)
+
+    response = auth_client.get('/auth/flight-logs')
+    assert response.status_code == 200
+    assert b'KPAO KSQL' in response.data
+    assert b'Last 30 days' in response.data
+    assert b'1.3' in response.data
@@ -0,0 +1,97 @@
+from datetime import date, datetime, timedelta, timezone
+import pytest
+from app.checkout_service import complete_check_out
+from app.maintenance_forecast import refresh_forecast
+from app.models import Booking, CheckIn, MaintenanceForecast, MaintenanceRecord, MaintenanceType
+
+
+def _now():
+    return datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+
+
+def _forecast(aircraft, item, now=None):
+    if now is not None:
+        # The flush hooks refresh with the real clock; pin it for exact dates
+        refresh_forecast([aircraft.id], now=now)
+    return MaintenanceForecast.query.filter_by(aircraft_id=aircraft.id, item=item).one()
+
+
+def _fly(session, student, aircraft, hobbs_start, hours, days_ago, now):
+    start = now - timedelta(days=days_ago)
+    booking = Booking(student_id=student.id, aircraft_id=aircraft.id, start_time=start,
+                      end_time=start + timedelta(hours=hours), status='in_progress')
+    session.add(booking)
+    session.flush()
+    session.add(CheckIn(booking_id=booking.id, aircraft_id=aircraft.id, check_in_time=start,
+                        hobbs_start=hobbs_start, tach_start=hobbs_start))
+    session.commit()
+    complete_check_out(booking, hobbs_end=hobbs_start + hours, tach_end=hobbs_start + hours,
+                       now=start + timedelta(hours=hours))
+
+
+@pytest.fixture
+def oil_change_type(session, admin_user):
+    maintenance_type = MaintenanceType(name='Oil change (50hr)', interval_hours=50.0,
+                                       interval_days=120, created_by_id=admin_user.id)
+    session.add(maintenance_type)
+    session.commit()
+    return maintenance_type
+
+
+def test_countdowns_are_projected_from_utilization(app, session, test_user, test_aircraft):
+    now = _now()
+    test_aircraft.time_to_next_100hr = 30.0
+    test_aircraft.date_of_next_annual = date(2031, 1, 1)
+    session.commit()
+    forecast = _forecast(test_aircraft, '100hr')
+    # Never flown: no hour-based projection yet
+    assert (forecast.hours_remaining, forecast.projected_due_at) == (30.0, None)
+    assert _forecast(test_aircraft, 'annual').projected_due_at == datetime(2031, 1, 1)
+
+    _fly(session, test_user, test_aircraft, test_aircraft.hobbs_time, 9.0, days_ago=10, now=now)
+    forecast = _forecast(test_aircraft, '100hr', now)
+    assert forecast.hours_remaining == pytest.approx(21.0)
+    assert forecast.daily_hours == pytest.approx(0.1)
+    assert forecast.projected_due_at == forecast.due_by_hours_at
+    assert forecast.projected_due_at == now + timedelta(days=210)
+
+
+def test_maintenance_types_use_latest_record(app, session, test_user, test_aircraft,
+                                             admin_user, oil_change_type):
+    now = _now()
+    hobbs = test_aircraft.hobbs_time
+    for days_ago, hobbs_hours in ((100, hobbs - 60), (30, hobbs - 20)):
+        session.add(MaintenanceRecord(aircraft_id=test_aircraft.id,
+                                      maintenance_type_id=oil_change_type.id,
+                                      performed_at=now - timedelta(days=days_ago),
+                                      performed_by_id=admin_user.id,
+                                      hobbs_hours=hobbs_hours, status='completed'))
+    session.commit()
+
+    forecast = _forecast(test_aircraft, f'type-{oil_change_type.id}', now)
+    assert forecast.hours_remaining == pytest.approx(30.0)
+    assert forecast.due_by_date_at == now - timedelta(days=30) + timedelta(days=120)
+    assert forecast.projected_due_at == forecast.due_by_date_at
+
+    # Flying 40 hours in 20 days makes the hour limit come first
+    _fly(session, test_user, test_aircraft, hobbs, 40.0, days_ago=20, now=now)
+    forecast = _forecast(test_aircraft, f'type-{oil_change_type.id}', now)
+    assert forecast.hours_remaining == pytest.approx(-10.0)
+    # Already over the hour limit, so it is due now
+    assert forecast.projected_due_at == forecast.due_by_hours_at == now
+
+
+def test_full_refresh_removes_stale_items(app, session, test_aircraft):
+    test_aircraft.time_to_next_oil_change = 12.0
+    session.commit()
+    assert _forecast(test_aircraft, 'oil_change')
+
+    # A bulk update bypasses the flush hooks
+    session.query(type(test_aircraft)).update({'time_to_next_oil_change': None})
+    session.commit()
+    assert MaintenanceForecast.query.filter_by(item='oil_change').count() == 1
+
+    result = app.test_cli_runner().invoke(args=['refresh-maintenance-forecast'])
+    assert 'Forecast' in result.output
+    assert MaintenanceForecast.query.filter_by(item='oil_change').count() == 0
+    assert refresh_forecast() == 0
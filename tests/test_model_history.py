@@ -0,0 +1,30 @@
+from sqlalchemy import event
+from app.models import Booking, FlightLog
+from app.model_history import (
+    _load_deleted_values, _load_previous_value, track_previous_values
+)
+
+
+def test_each_attribute_gets_one_listener(app):
+    # Reports, the waitlist matcher and the dashboard all track booking status
+    assert event.contains(Booking.status, 'set', _load_previous_value)
+    listeners = len(Booking.status.dispatch.set)
+    track_previous_values(Booking.status)
+    assert len(Booking.status.dispatch.set) == listeners
+
+    # Payroll registers its own attributes instead of relying on the logbook
+    for attribute in (FlightLog.booking_id, FlightLog.flight_date, FlightLog.ground_instruction):
+        assert event.contains(attribute, 'set', _load_previous_value)
+
+
+def test_deleted_rows_load_every_tracked_value(app, session, book_flight, test_user, test_aircraft):
+    booking = book_flight(test_user, test_aircraft)
+    session.commit()
+    session.delete(booking)
+    assert 'status' not in booking.__dict__
+
+    with session.no_autoflush:  # as during a flush
+        _load_deleted_values(session, None, None)
+    # Tracked by reports, the waitlist matcher and the dashboard
+    for name in ('status', 'aircraft_id', 'start_time', 'end_time'):
+        assert name in booking.__dict__
@@ -35,15 +35,15 @@ def test_days_to_maintenance_value():
     ac = DummyAircraft(last_maintenance=last_maint)
     assert ac.days_to_maintenance == 10
 
-# image_url property is more complex due to Flask context and ensure_aircraft_image
-# We'll test the logic up to the ensure_aircraft_image call using monkeypatching
+# image_url property is more complex due to Flask context and resolve_aircraft_image
+# We'll test the logic up to the resolve_aircraft_image call using monkeypatching
 from flask import Flask
 from app.models import ensure_aircraft_image
 
 def test_image_url_with_image(monkeypatch):
     app = Flask(__name__)
     ac = DummyAircraft(image_filename="test.jpg", make="Cessna", model="172S")
-    monkeypatch.setattr("app.models.ensure_aircraft_image", lambda *a, **kw: "images/aircraft/test.jpg")
+    monkeypatch.setattr("app.models.resolve_aircraft_image", lambda *a, **kw: "images/aircraft/test.jpg")
     with app.test_request_context():
         url = ac.image_url
         assert "images/aircraft/test.jpg" in url
@@ -51,19 +51,19 @@ def test_image_url_with_image(monkeypatch):
 def test_image_url_category(monkeypatch):
     app = Flask(__name__)
     ac = DummyAircraft(image_filename=None, category="single_engine_land", engine_type="piston", make="Cessna", model="172")
-    monkeypatch.setattr("app.models.ensure_aircraft_image", lambda *a, **kw: "images/aircraft/cessna172.jpg")
+    monkeypatch.setattr("app.models.resolve_aircraft_image", lambda *a, **kw: "images/aircraft/cessna172.jpg")
     with app.test_request_context():
         url = ac.image_url
         assert "images/aircraft/cessna172.jpg" in url
 
     ac = DummyAircraft(image_filename=None, category="multi_engine_land", engine_type="jet", make="Cessna", model="Citation")
-    monkeypatch.setattr("app.models.ensure_aircraft_image", lambda *a, **kw: "images/aircraft/citation.jpg")
+    monkeypatch.setattr("app.models.resolve_aircraft_image", lambda *a, **kw: "images/aircraft/citation.jpg")
     with app.test_request_context():
         url = ac.image_url
         assert "images/aircraft/citation.jpg" in url
 
     ac = DummyAircraft(image_filename=None, category=None, engine_type=None)
-    monkeypatch.setattr("app.models.ensure_aircraft_image", lambda *a, **kw: "images/aircraft/default.jpg")
+    monkeypatch.setattr("app.models.resolve_aircraft_image", lambda *a, **kw: "images/aircraft/default.jpg")
     with app.test_request_context():
         url = ac.image_url
         assert "images/aircraft/default.jpg" in url
@@ -173,25 +173,25 @@ def test_aircraft_image_url_all_branches(monkeypatch):
     app = Flask(__name__)
     # single_engine_land, turboprop
     ac = DummyAircraft(image_filename=None, category="single_engine_land", engine_type="turboprop")
-    monkeypatch.setattr("app.models.ensure_aircraft_image", lambda *a, **kw: "images/aircraft/tbm930.jpg")
+    monkeypatch.setattr("app.models.resolve_aircraft_image", lambda *a, **kw: "images/aircraft/tbm930.jpg")
     with app.test_request_context():
         url = ac.image_url
         assert "tbm930.jpg" in url
     # multi_engine_land, piston
     ac = DummyAircraft(image_filename=None, category="multi_engine_land", engine_type="piston")
-    monkeypatch.setattr("app.models.ensure_aircraft_image", lambda *a, **kw: "images/aircraft/baron58.jpg")
+    monkeypatch.setattr("app.models.resolve_aircraft_image", lambda *a, **kw: "images/aircraft/baron58.jpg")
     with app.test_request_context():
         url = ac.image_url
         assert "baron58.jpg" in url
     # multi_engine_land, turboprop
     ac = DummyAircraft(image_filename=None, category="multi_engine_land", engine_type="turboprop")
-    monkeypatch.setattr("app.models.ensure_aircraft_image", lambda *a, **kw: "images/aircraft/kingair350.jpg")
+    monkeypatch.setattr("app.models.resolve_aircraft_image", lambda *a, **kw: "images/aircraft/kingair350.jpg")
     with app.test_request_context():
         url = ac.image_url
         assert "kingair350.jpg" in url
     # multi_engine_land, jet
     ac = DummyAircraft(image_filename=None, category="multi_engine_land", engine_type="jet")
-    monkeypatch.setattr("app.models.ensure_aircraft_image", lambda *a, **kw: "images/aircraft/citation.jpg")
+    monkeypatch.setattr("app.models.resolve_aircraft_image", lambda *a, **kw: "images/aircraft/citation.jpg")
     with app.test_request_context():
         url = ac.image_url
         assert "citation.jpg" in url
@@ -0,0 +1,77 @@
+import pytest
+from datetime import datetime, timedelta
+from werkzeug.datastructures import MultiDict
+from app.models import Booking
+from app.pagination import (
+    keyset_paginate, encode_cursor, decode_cursor, parse_listing_filters,
+    apply_listing_filters
+)
+
+
+@pytest.fixture
+def many_bookings(session, test_user, test_aircraft):
+    base = datetime(2024, 6, 1, 9, 0)
+    for i in range(7):
+        # Pairs of bookings share a start time to exercise the id tie-breaker
+        start = base + timedelta(days=i // 2)
+        session.add(Booking(student_id=test_user.id, aircraft_id=test_aircraft.id,
+                            start_time=start, end_time=start + timedelta(hours=1),
+                            status='cancelled' if i == 0 else 'confirmed'))
+    session.commit()
+    return Booking.query.order_by(Booking.start_time.desc(), Booking.id.desc()).all()
+
+
+def test_cursor_round_trip():
+    when = datetime(2024, 6, 1, 9, 30)
+    assert decode_cursor(encode_cursor(when, 42)) == (when, 42)
+    assert decode_cursor('not-a-cursor') is None
+    assert decode_cursor(None) is None
+
+
+def test_keyset_paginate_walks_forward_and_back(many_bookings):
+    expected = [b.id for b in many_bookings]
+
+    seen = []
+    page = keyset_paginate(Booking.query, Booking.start_time, Booking.id, per_page=3)
+    pages = [page]
+    assert not page.has_prev
+    seen.extend(b.id for b in page)
+    while page.has_next:
+        page = keyset_paginate(Booking.query, Booking.start_time, Booking.id,
+                               after=page.next_cursor, per_page=3)
+        pages.append(page)
+        seen.extend(b.id for b in page)
+    assert seen == expected
+    assert [len(p) for p in pages] == [3, 3, 1]
+
+    back = keyset_paginate(Booking.query, Booking.start_time, Booking.id,
+                           before=pages[2].prev_cursor, per_page=3)
+    assert [b.id for b in back] == expected[3:6]
+    assert back.has_prev and back.has_next
+
+
+def test_listing_filters(many_bookings, test_aircraft):
+    filters = parse_listing_filters(MultiDict({
+        'from': '2024-06-02', 'to': '2024-06-02', 'status': 'confirmed',
+        'aircraft_id': str(test_aircraft.id), 'instructor_id': 'junk'
+    }))
+    assert filters == {
+        'start_date': datetime(2024, 6, 2), 'end_date': datetime(2024, 6, 2),
+        'status': 'confirmed', 'aircraft_id': test_aircraft.id
+    }
+    rows = apply_listing_filters(Booking.query, Booking, Booking.start_time, filters).all()
+    assert len(rows) == 2
+    assert all(b.start_time.date() == datetime(2024, 6, 2).date() for b in rows)
+
+
+def test_admin_bookings_page_links(admin_client, many_bookings):
+    resp = admin_client.get('/admin/bookings?per_page=5&status=confirmed')
+    assert resp.status_code == 200
+    assert b'Older' in resp.data
+    assert b'status=confirmed' in resp.data
+
+
+def test_admin_maintenance_records_page(admin_client):
+    resp = admin_client.get('/admin/maintenance/records?from=2024-01-01')
+    assert resp.status_code == 200
+    assert b'filterModal' in resp.data
@@ -0,0 +1,86 @@
+from datetime import date, timedelta
+from app.billing import run_billing
+from app.checkout_service import complete_check_out
+from app.models import FlightLog, InstructorDayFact
+from app.payroll import payroll, rebuild_instructor_facts
+
+
+def _fact_rows():
+    return [(f.day, f.flights, f.flight_hours, f.flight_pay, f.ground_hours)
+            for f in InstructorDayFact.query.order_by(InstructorDayFact.day)]
+
+
+def test_check_out_and_ground_time_maintain_facts(app, session, book_flight, flight_start, test_user,
+                                                  test_instructor, test_aircraft):
+    dual = book_flight(test_user, test_aircraft, test_instructor, hobbs_start=100.0)
+    complete_check_out(dual, hobbs_end=101.5, tach_end=101.5, now=flight_start + timedelta(hours=2))
+    solo = book_flight(test_user, test_aircraft, days=1, hobbs_start=101.5)
+    complete_check_out(solo, hobbs_end=102.5, tach_end=102.5,
+                       now=flight_start + timedelta(days=1, hours=2))
+    assert _fact_rows() == [(date(2030, 5, 1), 1, 1.5, 112.5, 0.0)]
+
+    log = FlightLog.query.filter_by(booking_id=dual.id).one()
+    log.ground_instruction = 0.5
+    session.commit()
+    assert _fact_rows() == [(date(2030, 5, 1), 1, 1.5, 112.5, 0.5)]
+
+    # Moving the flight to another day moves its ground hours too
+    log.flight_date = flight_start + timedelta(days=2)
+    session.commit()
+    assert _fact_rows() == [(date(2030, 5, 1), 1, 1.5, 112.5, 0.0),
+                            (date(2030, 5, 3), 0, 0.0, 0.0, 0.5)]
+
+    session.delete(log)
+    session.commit()
+    assert _fact_rows()[-1] == (date(2030, 5, 3), 0, 0.0, 0.0, 0.0)
+
+
+def test_billing_run_adds_to_facts(app, session, book_flight, test_user, test_instructor,
+                                   test_aircraft):
+    book_flight(test_user, test_aircraft, test_instructor, hobbs_start=100.0, hours=2.0)
+    assert run_billing() == 1
+    assert _fact_rows() == [(date(2030, 5, 1), 1, 2.0, 150.0, 0.0)]
+
+
+def test_payroll_is_one_grouped_query(app, session, book_flight, flight_start, count_queries,
+                                      test_user, test_instructor, test_aircraft):
+    for day in range(3):
+        booking = book_flight(test_user, test_aircraft, test_instructor, days=day,
+                              hobbs_start=100.0 + day)
+        complete_check_out(booking, hobbs_end=101.0 + day, tach_end=101.0 + day,
+                           now=flight_start + timedelta(days=day, hours=2))
+    log = FlightLog.query.order_by(FlightLog.id).first()
+    log.ground_instruction = 1.0
+    session.commit()
+
+    with count_queries() as statements:
+        lines = payroll(date(2030, 5, 1), date(2030, 5, 2))
+    assert len(statements) == 1
+    line, = lines
+    assert (line.instructor_id, line.flights, line.flight_hours, line.ground_hours) == (
+        test_instructor.id, 2, 2.0, 1.0)
+    assert (line.flight_pay, line.ground_pay, line.total_pay) == (150.0, 75.0, 225.0)
+
+    expected = _fact_rows()
+    rebuild_instructor_facts()
+    session.commit()
+    assert _fact_rows() == expected
+
+
+def test_payroll_page_and_csv(app, session, admin_client, book_flight, flight_start, test_user,
+                              test_instructor, test_aircraft):
+    booking = book_flight(test_user, test_aircraft, test_instructor, hobbs_start=100.0)
+    complete_check_out(booking, hobbs_end=101.0, tach_end=101.0, now=flight_start + timedelta(hours=2))
+
+    response = admin_client.get('/admin/payroll?start=2030-05-01&end=2030-05-31')
+    assert response.status_code == 200
+    assert test_instructor.last_name.encode() in response.data
+
+    response = admin_client.get('/admin/payroll?start=2030-05-01&end=2030-05-31&format=csv')
+    assert response.mimetype == 'text/csv'
+    header, row = response.get_data(as_text=True).splitlines()
+    assert header.startswith('Instructor ID,Instructor,Hourly Rate')
+    assert row.endswith(',75.0,1,1.0,0.0,75.0,0.0,75.0')
+
+    result = app.test_cli_runner().invoke(args=['payroll', '2030-05-01', '2030-05-31'])
+    assert result.output.splitlines()[1] == row
@@ -0,0 +1,111 @@
+from datetime import datetime
+import io
+import pytest
+from app.ledger import account_balance
+from app import reconciliation
+from app.models import Booking, Invoice, LedgerEntry
+from app.reconciliation import ReconciliationError, reconcile_payments
+
+
+@pytest.fixture
+def invoices(session, flight_start, test_user, test_aircraft):
+    invoices = []
+    for number, total in ((1, 150.0), (2, 225.0), (3, 300.0)):
+        booking = Booking(student_id=test_user.id, aircraft_id=test_aircraft.id, status='completed',
+                          start_time=flight_start, end_time=flight_start)
+        session.add(booking)
+        session.flush()
+        invoice = Invoice(booking_id=booking.id, aircraft_id=test_aircraft.id,
+                          student_id=test_user.id, invoice_number=f'INV-{number:06d}',
+                          invoice_date=flight_start, aircraft_rate=150.0, aircraft_time=total / 150,
+                          aircraft_total=total, total_amount=total)
+        session.add(invoice)
+        invoices.append(invoice)
+    session.commit()
+    return invoices
+
+
+def _csv(*lines):
+    return io.StringIO('Date,Description,Name,Amount\n' + '\n'.join(lines) + '\n')
+
+
+def test_matches_by_number_then_payer(app, session, invoices, test_user, count_queries):
+    assert account_balance(test_user.id) == -675.0
+    export = _csv(
+        '2030-05-03,Payment ref inv-1,Someone Else,150.00',
+        '05/04/2030,Transfer,Test Student,"$1,000.00"',
+        '2030-05-05,Card payment,student@example.com,225.00',
+        '2030-05-05,Card payment INV-000003,Test Student,200.00',
+        '2030-05-06,Bank fee,,(12.00)',
+    )
+    with count_queries() as statements:
+        result = reconcile_payments(export, payment_method='card')
+    # Loading the index, one update, locking the account and one insert,
+    # then the snapshot check
+    assert len(statements) == 5
+
+    assert (result.lines, result.matched) == (5, 2)
+    assert [(line.line_number, line.reason) for line in result.unmatched] == [
+        (3, 'No open invoice matches'),
+        (5, 'Amount differs from invoice INV-000003'),
+    ]
+    session.expire_all()
+    first, second, third = invoices
+    assert (first.status, first.payment_method, first.payment_date) == ('paid', 'card', datetime(2030, 5, 3))
+    assert (second.status, second.payment_date) == ('paid', datetime(2030, 5, 5))
+    assert third.status == 'pending'
+    assert account_balance(test_user.id) == -300.0
+
+
+def test_paid_invoices_are_not_matched_again(app, session, invoices):
+    reconcile_payments(_csv('2030-05-03,INV-000001,,150.00'))
+    result = reconcile_payments(_csv('2030-05-03,INV-000001,,150.00'))
+    assert (result.matched, result.unmatched[0].reason) == (0, 'No open invoice matches')
+
+
+def test_invoices_paid_meanwhile_get_no_deposit(app, session, invoices, monkeypatch):
+    build_index = reconciliation.OpenInvoiceIndex
+
+    def paid_after_indexing():
+        index = build_index()
+        # Another run pays the first invoice once this one has loaded it as open
+        session.execute(Invoice.__table__.update().where(Invoice.id == invoices[0].id).values(status='paid'))
+        return index
+    monkeypatch.setattr(reconciliation, 'OpenInvoiceIndex', paid_after_indexing)
+
+    result = reconcile_payments(_csv('2030-05-03,INV-000001,,150.00', '2030-05-03,INV-000002,,225.00'))
+    assert (result.matched, result.amount_matched) == (1, 225)
+    assert [(line.line_number, line.reason) for line in result.unmatched] == [
+        (2, 'Invoice INV-000001 is no longer open')]
+    assert LedgerEntry.query.filter_by(entry_type='deposit').count() == 1
+
+
+def test_blank_and_non_finite_amounts(app, session, invoices):
+    export = io.StringIO('Date,Memo,Debit,Credit\n'
+                         '2030-05-03,Fuel,45.00,\n'
+                         '2030-05-03,INV-000001,,150.00\n'
+                         '2030-05-04,INV-000002,,NaN\n'
+                         '2030-05-04,INV-000003,,Infinity\n')
+    result = reconcile_payments(export)
+    # The debit line has no credit and is skipped like any other debit
+    assert (result.lines, result.matched) == (4, 1)
+    assert [(line.line_number, line.reason) for line in result.unmatched] == [
+        (4, 'Unreadable amount'), (5, 'Unreadable amount')]
+
+
+def test_payer_with_several_equal_invoices_is_ambiguous(app, session, invoices):
+    invoices[2].total_amount = 225.0
+    session.commit()
+    result = reconcile_payments(io.StringIO('Payer,Amount\nTest Student,225.00\n'))
+    assert result.unmatched[0].reason == 'Several open invoices for this payer have this amount'
+
+
+def test_cli_and_unknown_layout(app, session, invoices, tmp_path):
+    with pytest.raises(ReconciliationError):
+        reconcile_payments(io.StringIO('When,What\n2030-05-03,x\n'))
+
+    export = tmp_path / 'bank.csv'
+    export.write_text('Date,Memo,Amount\n2030-05-03,INV-000001,150.00\n2030-05-03,Rent,99.00\n')
+    result = app.test_cli_runner().invoke(args=['reconcile-payments', str(export)])
+    assert 'Matched 1 of 2 lines ($150.00)' in result.output
+    assert 'Line 3: No open invoice matches' in result.output
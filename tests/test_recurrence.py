@@ -0,0 +1,149 @@
+from datetime import datetime, time, timedelta, timezone
+from app.models import Booking, RecurringBooking
+from app.availability_service import find_conflicts, busy_intervals
+from app.recurrence import (
+    iter_occurrences, materialize_series, virtual_occurrences, cancel_series, extend_all_series
+)
+
+
+def _series(session, student, aircraft, **kwargs):
+    values = dict(student_id=student.id, aircraft_id=aircraft.id, day_of_week=2,
+                  start_time=time(9, 0), duration_hours=2.0,
+                  start_date=datetime(2025, 3, 1), status='active')
+    values.update(kwargs)
+    series = RecurringBooking(**values)
+    session.add(series)
+    session.commit()
+    return series
+
+
+def test_occurrences_keep_local_time_across_dst(app, session, test_user, test_aircraft):
+    app.config['SCHOOL_TIMEZONE'] = 'America/New_York'
+    series = _series(session, test_user, test_aircraft, day_of_week=2)
+    starts = [start for start, _ in iter_occurrences(series, datetime(2025, 3, 1), datetime(2025, 3, 20))]
+    # Wednesdays at 09:00 Eastern: EST (UTC-5) before March 9, EDT (UTC-4) after
+    assert starts == [datetime(2025, 3, 5, 14), datetime(2025, 3, 12, 13), datetime(2025, 3, 19, 13)]
+
+
+def test_materialize_skips_conflicts_in_one_query(app, session, test_user, test_aircraft,
+                                                  count_queries):
+    app.config['SCHOOL_TIMEZONE'] = 'UTC'
+    taken = Booking(student_id=test_user.id, aircraft_id=test_aircraft.id,
+                    start_time=datetime(2025, 3, 12, 10), end_time=datetime(2025, 3, 12, 11),
+                    status='confirmed')
+    session.add(taken)
+    session.commit()
+    series = _series(session, test_user, test_aircraft)
+
+    with count_queries() as statements:
+        created, skipped = materialize_series(series, datetime(2025, 4, 1))
+    session.commit()
+    assert created == 3
+    assert skipped == [(datetime(2025, 3, 12, 9), datetime(2025, 3, 12, 11))]
+    assert sum('candidate_slots' in s for s in statements) == 1
+    assert sum(s.startswith('INSERT INTO booking') for s in statements) == 1
+
+    occurrences = series.occurrences.order_by(Booking.start_time).all()
+    assert [b.start_time.day for b in occurrences] == [5, 19, 26]
+    assert series.materialized_until == datetime(2025, 4, 1)
+    # The conflict index sees the bulk-inserted rows
+    conflicts = find_conflicts(datetime(2025, 3, 19, 10), datetime(2025, 3, 19, 12),
+                               aircraft_id=test_aircraft.id)
+    assert conflicts == {'aircraft': [occurrences[1].id]}
+
+    # Materializing again up to the same point does nothing
+    assert materialize_series(series, datetime(2025, 4, 1)) == (0, [])
+
+
+def test_far_future_occurrences_expand_on_read(app, session, test_user, test_aircraft):
+    app.config['SCHOOL_TIMEZONE'] = 'UTC'
+    series = _series(session, test_user, test_aircraft, materialized_until=datetime(2025, 4, 1))
+    window = (datetime(2026, 6, 1), datetime(2026, 6, 8))
+
+    virtual = virtual_occurrences(*window, aircraft_ids=[test_aircraft.id])
+    assert [(s.id, start) for s, start, _ in virtual] == [(series.id, datetime(2026, 6, 3, 9))]
+    assert Booking.query.count() == 0
+
+    conflicts = find_conflicts(datetime(2026, 6, 3, 10), datetime(2026, 6, 3, 12),
+                               aircraft_id=test_aircraft.id)
+    assert conflicts == {'aircraft': [f'recurring:{series.id}']}
+    busy = busy_intervals(*window)
+    assert busy['aircraft'] == {test_aircraft.id: [(datetime(2026, 6, 3, 9), datetime(2026, 6, 3, 11))]}
+
+
+def test_cached_index_holds_unmaterialized_occurrences(app, session, test_user, test_aircraft,
+                                                       count_queries, monkeypatch):
+    app.config['SCHOOL_TIMEZONE'] = 'UTC'
+    now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    day = (now + timedelta(days=30)).date()
+    series = _series(session, test_user, test_aircraft, day_of_week=day.weekday(),
+                     start_date=now, materialized_until=now)
+    start = datetime.combine(day, time(10, 0))
+    window = (start, start + timedelta(hours=1))
+    expansions = []
+
+    def counting_virtual_occurrences(*args, **kwargs):
+        expansions.append(args)
+        return virtual_occurrences(*args, **kwargs)
+
+    monkeypatch.setattr('app.recurrence.virtual_occurrences', counting_virtual_occurrences)
+
+    busy = {test_aircraft.id: [window]}
+    assert busy_intervals(*window, aircraft_ids=[test_aircraft.id], instructor_ids=[]) == {
+        'aircraft': busy, 'instructor': {}}
+    with count_queries() as statements:
+        for _ in range(3):
+            assert busy_intervals(*window, aircraft_ids=[test_aircraft.id],
+                                  instructor_ids=[])['aircraft'] == busy
+    # The series was expanded once, when the index was built; later reads
+    # run no bookings or series queries
+    assert len(expansions) == 1
+    assert statements == []
+
+    # Ending the series drops the cached index of its resources
+    series.end_date = now
+    session.commit()
+    assert busy_intervals(*window, aircraft_ids=[test_aircraft.id],
+                          instructor_ids=[])['aircraft'] == {}
+    assert len(expansions) == 2
+
+
+def test_extend_all_series_reports_skipped_slots(app, session, test_user, test_aircraft, caplog):
+    app.config['SCHOOL_TIMEZONE'] = 'UTC'
+    series = _series(session, test_user, test_aircraft)
+    session.add(Booking(student_id=test_user.id, aircraft_id=test_aircraft.id,
+                        start_time=datetime(2025, 3, 12, 10), end_time=datetime(2025, 3, 12, 11),
+                        status='confirmed'))
+    session.commit()
+
+    created, skipped = extend_all_series(now=datetime(2025, 3, 1))
+    assert created == 7
+    assert skipped == {series.id: [(datetime(2025, 3, 12, 9), datetime(2025, 3, 12, 11))]}
+    assert f'Recurring booking {series.id}' in caplog.text
+
+
+def test_cancel_series_cancels_future_occurrences(app, session, test_user, test_aircraft):
+    app.config['SCHOOL_TIMEZONE'] = 'UTC'
+    series = _series(session, test_user, test_aircraft)
+    materialize_series(series, datetime(2025, 4, 1))
+    session.commit()
+
+    assert cancel_series(series, now=datetime(2025, 3, 15)) == 2
+    session.commit()
+    statuses = [b.status for b in series.occurrences.order_by(Booking.start_time)]
+    assert statuses == ['confirmed', 'confirmed', 'cancelled', 'cancelled']
+    assert series.status == 'cancelled'
+    assert virtual_occurrences(datetime(2025, 5, 1), datetime(2025, 6, 1)) == []
+
+
+def test_recurring_booking_routes(auth_client, admin_client, session, test_aircraft):
+    assert auth_client.get('/recurring').status_code == 200
+    start_date = (datetime.now(timezone.utc) + timedelta(days=7)).strftime('%Y-%m-%d')
+    resp = auth_client.post('/recurring/create', data={
+        'aircraft_id': test_aircraft.id, 'instructor_id': 0, 'day_of_week': 4,
+        'start_time': '10:00', 'duration_hours': 1.5, 'start_date': start_date
+    })
+    assert resp.status_code == 302
+    series = RecurringBooking.query.one()
+    assert series.occurrences.count() >= 7
+    assert admin_client.get('/admin/recurring-bookings').status_code == 200
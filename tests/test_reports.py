@@ -0,0 +1,103 @@
+from datetime import date, timedelta
+from app.billing import run_billing
+from app.checkout_service import complete_check_out
+from app.models import DailyFact, RecurringBooking
+from app.recurrence import materialize_series
+from app.reports import build_report, rebuild_daily_facts
+
+MAY = (date(2030, 5, 1), date(2030, 5, 31))
+
+
+def _fly(booking, hours):
+    hobbs_end = booking.check_in.hobbs_start + hours
+    complete_check_out(booking, hobbs_end=hobbs_end, tach_end=hobbs_end,
+                       now=booking.start_time + timedelta(hours=hours))
+
+
+def _facts():
+    return sorted((f.day, f.instructor_id, f.bookings, f.cancellations, f.flights, f.hours, f.revenue)
+                  for f in DailyFact.query)
+
+
+def test_bookings_and_check_outs_maintain_facts(app, session, book_flight, flight_start,
+                                                test_user, test_instructor, test_aircraft):
+    dual = book_flight(test_user, test_aircraft, test_instructor, hobbs_start=100.0)
+    solo = book_flight(test_user, test_aircraft, days=1)
+    _fly(dual, 1.5)
+    assert _facts() == [(date(2030, 5, 1), test_instructor.id, 1, 0, 1, 1.5, 337.5),
+                        (date(2030, 5, 2), None, 1, 0, 0, 0.0, 0.0)]
+
+    solo.status = 'cancelled'
+    session.commit()
+    assert _facts()[1] == (date(2030, 5, 2), None, 1, 1, 0, 0.0, 0.0)
+
+    # Reinstating and moving the booking takes it out of the old row
+    solo.status = 'confirmed'
+    solo.start_time = flight_start + timedelta(days=3)
+    session.commit()
+    assert _facts()[1:] == [(date(2030, 5, 2), None, 0, 0, 0, 0.0, 0.0),
+                            (date(2030, 5, 4), None, 1, 0, 0, 0.0, 0.0)]
+
+    session.delete(solo)
+    session.commit()
+    assert _facts()[-1] == (date(2030, 5, 4), None, 0, 0, 0, 0.0, 0.0)
+
+    expected = [fact for fact in _facts() if fact[2:] != (0, 0, 0, 0.0, 0.0)]
+    rebuild_daily_facts()
+    session.commit()
+    assert _facts() == expected
+
+
+def test_bulk_writes_are_counted(app, session, book_flight, flight_start, test_user,
+                                 test_aircraft):
+    book_flight(test_user, test_aircraft, hobbs_start=100.0, hours=1.0)
+    assert run_billing() == 1
+
+    series = RecurringBooking(student_id=test_user.id, aircraft_id=test_aircraft.id,
+                              day_of_week=flight_start.weekday(), start_time=flight_start.time(),
+                              duration_hours=1.0, start_date=flight_start + timedelta(days=7),
+                              status='active')
+    session.add(series)
+    session.flush()
+    created, _ = materialize_series(series, flight_start + timedelta(days=21))
+    session.commit()
+    assert created == 2
+    facts = {fact[0]: fact for fact in _facts()}
+    assert facts[date(2030, 5, 1)][2:] == (1, 0, 1, 1.0, 150.0)
+    assert facts[date(2030, 5, 8)][2] == facts[date(2030, 5, 15)][2] == 1
+
+
+def test_reports_are_range_sums(app, session, book_flight, count_queries, test_user,
+                                test_instructor, test_aircraft):
+    for day in range(3):
+        booking = book_flight(test_user, test_aircraft, test_instructor, days=day,
+                              hobbs_start=100.0 + day)
+        _fly(booking, 1.0)
+    book_flight(test_user, test_aircraft, days=1, status='cancelled')
+
+    with count_queries() as statements:
+        revenue = build_report('revenue', *MAY)
+    assert len(statements) == 1
+    assert revenue.rows == [(date(2030, 5, 1), 1, 1.0, 225.0), (date(2030, 5, 2), 1, 1.0, 225.0),
+                            (date(2030, 5, 3), 1, 1.0, 225.0)]
+
+    aircraft, = build_report('aircraft', *MAY).rows
+    assert aircraft == ('N12345', 4, 3, 3.0, round(3.0 / 31, 2), 675.0)
+    instructor, = build_report('instructors', date(2030, 5, 2), date(2030, 5, 3)).rows
+    assert instructor[1:] == (2, 0, 2, 2.0, 450.0)
+    assert build_report('cancellations', *MAY).rows[1] == (date(2030, 5, 2), 2, 1, 50.0)
+
+
+def test_reports_page_and_csv(app, session, admin_client, book_flight, test_user, test_aircraft):
+    _fly(book_flight(test_user, test_aircraft, hobbs_start=100.0), 2.0)
+
+    response = admin_client.get('/admin/reports?report=aircraft&start=2030-05-01&end=2030-05-31')
+    assert response.status_code == 200
+    assert b'Aircraft Utilization' in response.data
+    assert b'N12345' in response.data
+
+    response = admin_client.get('/admin/reports?report=revenue&start=2030-05-01&end=2030-05-31&format=csv')
+    assert response.mimetype == 'text/csv'
+    assert response.get_data(as_text=True).splitlines() == ['Date,Flights,Hours,Revenue',
+                                                            '2030-05-01,1,2.0,300.0']
+    assert admin_client.get('/admin/reports?report=nope').status_code == 404
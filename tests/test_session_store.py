@@ -0,0 +1,88 @@
+import time
+import pytest
+from app import session_store
+from app.session_store import FilesystemSessionStore, SQLiteSessionStore
+
+
+def test_static_and_repeat_requests_do_not_set_cookie(client, admin_user):
+    resp = client.get('/static/css/aviation.css')
+    assert 'Set-Cookie' not in resp.headers
+
+    with client.session_transaction() as sess:
+        sess['_user_id'] = admin_user.id
+        sess['_fresh'] = True
+    client.get('/admin/dashboard')
+    resp = client.get('/admin/dashboard')
+    assert resp.status_code == 200
+    assert 'Set-Cookie' not in resp.headers
+
+
+@pytest.mark.parametrize('store_class', [SQLiteSessionStore, FilesystemSessionStore])
+def test_store_round_trip_and_expiry(tmp_path, store_class):
+    location = tmp_path / ('sessions.sqlite3' if store_class is SQLiteSessionStore else 'sessions')
+    store = store_class(str(location))
+    store.save('abc', '{"a": 1}', time.time() + 60)
+    assert store.load('abc') == '{"a": 1}'
+    store.save('old', '{}', time.time() - 1)
+    assert store.load('old') is None
+    assert store.purge_expired() == 1
+    store.delete('abc')
+    assert store.load('abc') is None
+
+
+@pytest.mark.parametrize('kind', ['sqlite', 'filesystem'])
+def test_server_side_session_keeps_data_off_the_cookie(app, admin_user, tmp_path, kind):
+    app.config['SESSION_STORE'] = kind
+    app.config['SESSION_STORE_PATH'] = str(tmp_path / 'sessions.db' if kind == 'sqlite' else tmp_path)
+    session_store.init_app(app)
+    client = app.test_client()
+
+    with client.session_transaction() as sess:
+        sess['_user_id'] = admin_user.id
+        sess['_fresh'] = True
+    cookie = client.get_cookie(app.config['SESSION_COOKIE_NAME'], domain='localhost.localdomain')
+    assert cookie is not None and '.' in cookie.value
+
+    # The first page adds the CSRF token; later visits leave the session alone
+    client.get('/admin/dashboard')
+    resp = client.get('/admin/dashboard')
+    assert resp.status_code == 200
+    assert 'Set-Cookie' not in resp.headers
+
+    with client.session_transaction() as sess:
+        assert sess['_user_id'] == admin_user.id
+        sid = sess.sid
+        sess.clear()
+    assert client.get_cookie(app.config['SESSION_COOKIE_NAME'], domain='localhost.localdomain') is None
+    assert app.session_interface.store.load(sid) is None
+
+
+def test_login_moves_the_session_to_a_new_id(app, test_user, tmp_path):
+    app.config['SESSION_STORE'] = 'sqlite'
+    app.config['SESSION_STORE_PATH'] = str(tmp_path / 'sessions.db')
+    session_store.init_app(app)
+    store = app.session_interface.store
+    client = app.test_client()
+
+    # An attacker-chosen session that the victim then logs in with
+    with client.session_transaction() as sess:
+        sess['planted'] = True
+        planted_sid = sess.sid
+    resp = client.post('/auth/login', data={'email': test_user.email, 'password': 'password123'})
+    assert resp.status_code == 302
+
+    with client.session_transaction() as sess:
+        assert sess.sid != planted_sid
+        assert sess['_user_id'] == str(test_user.id) and sess['planted'] is True
+    assert store.load(planted_sid) is None
+
+
+def test_purge_sessions_command(app, tmp_path):
+    runner = app.test_cli_runner()
+    assert 'nothing to purge' in runner.invoke(args=['purge-sessions']).output
+
+    app.config['SESSION_STORE'] = 'filesystem'
+    app.config['SESSION_STORE_PATH'] = str(tmp_path)
+    session_store.init_app(app)
+    app.session_interface.store.save('old', '{}', time.time() - 1)
+    assert runner.invoke(args=['purge-sessions']).output.strip() == 'Purged 1 expired sessions'
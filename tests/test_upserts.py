@@ -0,0 +1,27 @@
+from datetime import date
+from app.models import DailyFact, InstructorDayFact
+from app.reports import _add_to_facts
+from app.upserts import add_to_rows
+
+
+def test_add_to_rows_inserts_then_adds(app, session, test_instructor):
+    table = InstructorDayFact.__table__
+    row = dict(instructor_id=test_instructor.id, day=date(2030, 5, 1), flights=1,
+               flight_hours=1.5, flight_pay=112.5, ground_hours=0.0)
+    add_to_rows(session.connection(), table, ('instructor_id', 'day'), [row])
+    add_to_rows(session.connection(), table, ('instructor_id', 'day'), [dict(row, ground_hours=0.5)])
+    session.commit()
+
+    fact = InstructorDayFact.query.one()
+    assert (fact.flights, fact.flight_hours, fact.flight_pay, fact.ground_hours) == (2, 3.0, 225.0, 0.5)
+
+
+def test_solo_daily_facts_share_one_row(app, session, test_aircraft):
+    # The reports' facts key solo flying on coalesce(instructor_id, 0)
+    deltas = {(date(2030, 5, 1), test_aircraft.id, None): {'bookings': 1}}
+    _add_to_facts(session.connection(), deltas)
+    _add_to_facts(session.connection(), deltas)
+    session.commit()
+
+    fact = DailyFact.query.one()
+    assert (fact.instructor_id, fact.bookings) == (None, 2)
@@ -0,0 +1,89 @@
+import time
+from app import db
+from app.models import User
+from app.user_cache import UserIdentityCache, get_user_cache, load_principal
+
+
+def test_identity_cache_evicts_least_recently_used():
+    cache = UserIdentityCache(ttl=60, max_size=2)
+    cache.put(1, {'id': 1})
+    cache.put(2, {'id': 2})
+    assert cache.get(1) == {'id': 1}
+    cache.put(3, {'id': 3})
+    assert cache.get(2) is None
+    assert cache.get(1) and cache.get(3)
+
+
+def test_identity_cache_expires_entries():
+    cache = UserIdentityCache(ttl=0)
+    cache.put(1, {'id': 1})
+    time.sleep(0.001)
+    assert cache.get(1) is None
+    assert len(cache) == 0
+
+
+def test_load_principal_runs_no_query_on_a_hit(app, test_user, count_queries):
+    user_id = test_user.id
+    db.session.expunge_all()
+    with count_queries() as statements:
+        first = load_principal(user_id)
+        assert first.is_admin is False and first.full_name == 'Test Student'
+    assert len(statements) == 1
+    assert isinstance(first, User)
+
+    db.session.expunge_all()
+    with count_queries() as statements:
+        second = load_principal(user_id)
+        assert second.is_admin is False and second.full_name == 'Test Student'
+    assert statements == []
+    assert load_principal(user_id + 1000) is None
+
+
+def test_cached_user_loads_row_for_other_attributes(app, test_user):
+    user_id = test_user.id
+    load_principal(user_id)
+    db.session.expunge_all()
+    principal = load_principal(user_id)
+    assert principal.phone == '555-0124'
+    assert principal.check_password('password123')
+    assert not db.session.dirty
+
+
+def test_change_from_another_process_is_seen_once_the_entry_expires(app, test_user,
+                                                                     monkeypatch):
+    user_id = test_user.id
+    load_principal(user_id)
+    # A Core update stands in for another worker, whose commit does not
+    # reach this process's cache
+    db.session.execute(User.__table__.update().where(User.id == user_id).values(
+        role='admin', is_admin=True, status='inactive'
+    ))
+    db.session.expunge_all()
+    assert load_principal(user_id).is_admin is False
+
+    expired = time.monotonic() + get_user_cache().ttl
+    monkeypatch.setattr(time, 'monotonic', lambda: expired)
+    db.session.expunge_all()
+    principal = load_principal(user_id)
+    assert (principal.is_admin, principal.is_active) == (True, False)
+    assert get_user_cache().get(user_id)['role'] == 'admin'
+
+
+def test_edit_user_invalidates_cache(admin_client, test_user):
+    load_principal(test_user.id)
+    resp = admin_client.post(f'/admin/user/{test_user.id}/edit', data={
+        'email': test_user.email, 'first_name': 'Test', 'last_name': 'Student',
+        'status': 'inactive'
+    })
+    assert resp.status_code == 302
+    assert get_user_cache().get(test_user.id) is None
+    assert load_principal(test_user.id).is_active is False
+
+
+def test_account_settings_updates_through_cached_user(auth_client, test_user):
+    resp = auth_client.post('/auth/account-settings', data={
+        'first_name': 'Renamed', 'last_name': 'Student'
+    })
+    assert resp.status_code == 302
+    assert db.session.get(User, test_user.id).first_name == 'Renamed'
+    assert load_principal(test_user.id).first_name == 'Renamed'
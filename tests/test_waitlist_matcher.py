@@ -0,0 +1,118 @@
+from datetime import datetime, time, timedelta, timezone
+from app.jobs import run_pending
+from app.models import Booking, Job, User, WaitlistEntry
+from app.waitlist_matcher import match_freed_slot
+
+DAY = datetime.now(timezone.utc).date() + timedelta(days=10)
+
+
+def _at(hour):
+    return datetime.combine(DAY, time(hour))
+
+
+def _student(session, email):
+    student = User(email=email, first_name='Wait', last_name='Listed',
+                   role='student', status='active')
+    student.set_password('password123')
+    session.add(student)
+    session.commit()
+    return student
+
+
+def _entry(session, student, aircraft, **kwargs):
+    values = dict(student_id=student.id, aircraft_id=aircraft.id,
+                  requested_date=datetime.combine(DAY, time()),
+                  time_preference='afternoon', duration_hours=2.0, status='active')
+    values.update(kwargs)
+    entry = WaitlistEntry(**values)
+    session.add(entry)
+    session.commit()
+    return entry
+
+
+def _booking(session, student, aircraft, start, end):
+    booking = Booking(student_id=student.id, aircraft_id=aircraft.id,
+                      start_time=start, end_time=end, status='confirmed')
+    session.add(booking)
+    session.commit()
+    return booking
+
+
+def test_cancellation_offers_slot_first_come_first_served(app, session, test_user, admin_user, test_aircraft):
+    app.config['SCHOOL_TIMEZONE'] = 'UTC'
+    booking = _booking(session, admin_user, test_aircraft, _at(13), _at(15))
+    first = _entry(session, test_user, test_aircraft)
+    second = _entry(session, _student(session, 'second@example.com'), test_aircraft)
+
+    booking.status = 'cancelled'
+    session.commit()
+    # Nothing happens until the job runs
+    assert first.status == 'active'
+    assert [job.name for job in Job.query.all()] == ['match_waitlist']
+    run_pending()
+
+    session.refresh(first)
+    session.refresh(second)
+    assert first.status == 'offered'
+    assert second.status == 'active'
+    offer = first.offered_booking
+    assert (offer.student_id, offer.status) == (test_user.id, 'pending')
+    assert (offer.start_time, offer.end_time) == (_at(13), _at(15))
+    # The student is emailed about the offer
+    assert Job.query.filter_by(name='send_email', status='done').count() == 1
+
+
+def test_moving_a_booking_offers_only_the_released_part(app, session, test_user, admin_user, test_aircraft):
+    app.config['SCHOOL_TIMEZONE'] = 'UTC'
+    booking = _booking(session, admin_user, test_aircraft, _at(12), _at(16))
+    entry = _entry(session, test_user, test_aircraft)
+
+    booking.start_time = _at(14)
+    session.commit()
+    run_pending()
+
+    session.refresh(entry)
+    assert entry.status == 'offered'
+    assert (entry.offered_booking.start_time, entry.offered_booking.end_time) == (_at(12), _at(14))
+
+
+def test_preference_and_duration_must_fit(app, session, test_user, admin_user, test_aircraft):
+    app.config['SCHOOL_TIMEZONE'] = 'UTC'
+    morning = _entry(session, test_user, test_aircraft, time_preference='morning')
+    too_long = _entry(session, _student(session, 'long@example.com'), test_aircraft, duration_hours=3.0)
+
+    assert match_freed_slot(test_aircraft.id, _at(13), _at(15)) == []
+    assert morning.status == 'active'
+    assert too_long.status == 'active'
+
+
+def test_rolled_back_cancellation_offers_nothing(app, session, test_user, admin_user, test_aircraft):
+    app.config['SCHOOL_TIMEZONE'] = 'UTC'
+    booking = _booking(session, admin_user, test_aircraft, _at(13), _at(15))
+    entry = _entry(session, test_user, test_aircraft)
+
+    booking.status = 'cancelled'
+    session.flush()
+    session.rollback()
+    assert Job.query.count() == 0
+
+    session.refresh(entry)
+    assert entry.status == 'active'
+
+
+def test_waitlist_page_lists_and_joins_entries(app, session, auth_client, test_user, test_aircraft):
+    response = auth_client.post('/waitlist/join', data={
+        'aircraft_id': test_aircraft.id,
+        'instructor_id': 0,
+        'requested_date': DAY.isoformat(),
+        'time_preference': 'morning',
+        'duration_hours': 1.5,
+    })
+    assert response.status_code == 302
+
+    entry = WaitlistEntry.query.filter_by(student_id=test_user.id).one()
+    assert (entry.instructor_id, entry.time_preference, entry.duration_hours) == (None, 'morning', 1.5)
+
+    response = auth_client.get('/waitlist')
+    assert response.status_code == 200
+    assert test_aircraft.registration.encode() in response.data